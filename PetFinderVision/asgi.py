@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PetFinderVision.settings')
 
 application = get_asgi_application()
+
+from similarity_search.services.registry import warm_up_on_startup  # noqa: E402
+
+warm_up_on_startup()
@@ -1,13 +1,20 @@
 from fastapi import FastAPI, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
+import asyncio
 import torch
 import clip
 from PIL import Image
 import io
+import os
+import hashlib
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -25,69 +32,313 @@ app.add_middleware(
 )
 
 # Инициализация модели CLIP
+MODEL_NAME = os.environ.get("CLIP_MODEL_NAME", "ViT-B/32")
 device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess = clip.load("ViT-B/32", device=device)
+model, preprocess = clip.load(MODEL_NAME, device=device)
+
+
+class PromptBank:
+    """Банк текстовых эмбеддингов для zero-shot классификации.
+
+    Каждый набор меток кодируется текстовым энкодером CLIP один раз (или
+    читается с диска) и хранится нормированной матрицей. Все наборы лежат
+    в одной матрице, поэтому классификация по всем сразу - одно умножение.
+    """
+
+    def __init__(self, model_name: str, cache_dir: Optional[str] = None):
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self._labels: Dict[str, List[str]] = {}
+        self._slices: Dict[str, slice] = {}
+        self._matrix = None
+
+    def register(self, name: str, labels: List[str], template: str):
+        """Добавляет набор меток; template - шаблон подсказки с {} для метки"""
+        prompts = [template.format(label) for label in labels]
+        features = self._load(name, prompts)
+        if features is None:
+            features = self._encode(prompts)
+            self._save(name, prompts, features)
+
+        start = 0 if self._matrix is None else self._matrix.shape[0]
+        features = features.to(device).float()
+        self._matrix = features if self._matrix is None else torch.cat([self._matrix, features])
+        self._labels[name] = list(labels)
+        self._slices[name] = slice(start, start + len(labels))
+        logger.info(f"Набор меток '{name}': {len(labels)} подсказок")
+
+    def classify(self, image_features: torch.Tensor) -> List[Dict[str, Dict[str, Any]]]:
+        """Лучшая метка и уверенность по каждому набору для каждой строки пакета"""
+        logits = 100.0 * image_features.float() @ self._matrix.T
+        best = {}
+        for name, part in self._slices.items():
+            values, indices = logits[:, part].softmax(dim=-1).max(dim=-1)
+            best[name] = (values.tolist(), indices.tolist())
+
+        results = []
+        for row in range(logits.shape[0]):
+            results.append({
+                name: {
+                    "label": self._labels[name][indices[row]],
+                    "confidence": values[row]
+                }
+                for name, (values, indices) in best.items()
+            })
+        return results
+
+    def _encode(self, prompts: List[str]) -> torch.Tensor:
+        text_tokens = clip.tokenize(prompts).to(device)
+        with torch.no_grad():
+            text_features = model.encode_text(text_tokens)
+            text_features /= text_features.norm(dim=-1, keepdim=True)
+        return text_features
+
+    def _cache_path(self, name: str, prompts: List[str]) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        key = hashlib.sha1("\n".join([self.model_name] + prompts).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{name}-{key}.npy")
+
+    def _load(self, name: str, prompts: List[str]) -> Optional[torch.Tensor]:
+        path = self._cache_path(name, prompts)
+        if path is None or not os.path.exists(path):
+            return None
+        return torch.from_numpy(np.load(path))
+
+    def _save(self, name: str, prompts: List[str], features: torch.Tensor):
+        path = self._cache_path(name, prompts)
+        if path is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(path, features.cpu().numpy())
+
+
+prompt_bank = PromptBank(MODEL_NAME, cache_dir=os.environ.get("PROMPT_BANK_DIR"))
+prompt_bank.register(
+    "animal_type",
+    ["cat", "dog", "bird", "rodent", "rabbit", "reptile"],
+    "a photo of a {}"
+)
+prompt_bank.register(
+    "color",
+    ["black", "white", "gray", "brown", "red", "orange", "yellow", "green", "blue", "purple"],
+    "a {} animal"
+)
+prompt_bank.register(
+    "eye_color",
+    ["blue", "green", "yellow", "brown", "black", "amber", "hazel"],
+    "a photo of an animal with {} eyes"
+)
+prompt_bank.register(
+    "face_shape",
+    ["round", "oval", "triangular", "long", "flat", "square"],
+    "a photo of an animal with a {} face"
+)
+
+
+class EmbeddingCache:
+    """LRU-кеш векторов изображений по хешу содержимого файла с TTL.
+
+    Повторная загрузка того же фото не декодируется и не попадает в очередь
+    инференса: классификация по готовому вектору - одно умножение. Сервис
+    запускается отдельно от Django, поэтому кеш свой, а не из similarity_search.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[torch.Tensor]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] <= time.monotonic():
+                del self._items[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, features: torch.Tensor):
+        if self.max_size <= 0:
+            return
+        # Строка пакета - вид на тензор всего пакета; копия не держит его в памяти
+        features = features.clone()
+        with self._lock:
+            self._items[key] = (features, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            size, hits, misses = len(self._items), self.hits, self.misses
+        requests = hits + misses
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / requests if requests else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache(
+    max_size=int(os.environ.get("EMBEDDING_CACHE_SIZE", "2048")),
+    ttl=float(os.environ.get("EMBEDDING_CACHE_TTL", "3600")),
+)
+
+
+class InferenceBatcher:
+    """Динамический микробатчинг инференса CLIP.
+
+    Запросы складываются в очередь; фоновая задача ждет до max_wait_ms
+    (или пока не наберется max_batch), прогоняет пакет одним
+    forward-проходом в отдельном потоке, не блокируя event loop, и
+    раздает результаты ожидающим запросам.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Один поток: пакеты идут последовательно, torch параллелит внутри пакета
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip-infer")
+        self.requests_total = 0
+        self.batches_total = 0
+        self.max_queue_depth = 0
+        self.batch_sizes: Dict[int, int] = {}
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, image_input: torch.Tensor) -> Tuple[torch.Tensor, Dict[str, Dict[str, Any]]]:
+        """Ставит предобработанное изображение в очередь и ждет (вектор, результат)"""
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((image_input, future))
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.requests_total += len(batch)
+            self.batches_total += 1
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+            futures = [future for _, future in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self._infer, [image_input for image_input, _ in batch]
+                )
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+
+    @staticmethod
+    def _infer(image_inputs: List[torch.Tensor]) -> List[Tuple[torch.Tensor, Dict[str, Dict[str, Any]]]]:
+        images = torch.stack(image_inputs).to(device)
+        with torch.no_grad():
+            image_features = model.encode_image(images)
+            image_features /= image_features.norm(dim=-1, keepdim=True)
+            # Тип, цвет, глаза и форма мордочки - одним умножением на банк подсказок
+            results = prompt_bank.classify(image_features)
+        return list(zip(image_features.float(), results))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "requests_total": self.requests_total,
+            "batches_total": self.batches_total,
+            "avg_batch_size": self.requests_total / self.batches_total if self.batches_total else 0.0,
+            "batch_sizes": self.batch_sizes,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+        }
+
+
+batcher = InferenceBatcher(
+    max_batch=int(os.environ.get("INFERENCE_MAX_BATCH", "16")),
+    max_wait_ms=float(os.environ.get("INFERENCE_MAX_WAIT_MS", "5")),
+)
+
+
+@app.on_event("startup")
+async def start_batcher():
+    batcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await batcher.stop()
+
+
+def load_image(contents: bytes) -> torch.Tensor:
+    """Декодирует и предобрабатывает изображение (выполняется в пуле потоков)"""
+    image = Image.open(io.BytesIO(contents))
+    return preprocess(image)
+
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics():
+    """Глубина очереди, размеры пакетов инференса и попадания в кеш векторов"""
+    return {**batcher.metrics(), "embedding_cache": embedding_cache.metrics()}
+
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)) -> Dict[str, Any]:
     try:
         # Читаем содержимое файла
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        
-        # Предобработка изображения
-        image_input = preprocess(image).unsqueeze(0).to(device)
-        
-        # Получаем эмбеддинги изображения
-        with torch.no_grad():
-            image_features = model.encode_image(image_input)
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-        
-        # Определяем тип животного
-        animal_types = ["cat", "dog", "bird", "rodent", "rabbit", "reptile"]
-        animal_texts = [f"a photo of a {animal}" for animal in animal_types]
-        text_tokens = clip.tokenize(animal_texts).to(device)
-        
-        with torch.no_grad():
-            text_features = model.encode_text(text_tokens)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
-            
-        # Вычисляем схожесть
-        similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-        values, indices = similarity[0].topk(1)
-        
-        animal_type = animal_types[indices[0].item()]
-        confidence = values[0].item()
-        
-        # Определяем цвет
-        colors = ["black", "white", "gray", "brown", "red", "orange", "yellow", "green", "blue", "purple"]
-        color_texts = [f"a {color} animal" for color in colors]
-        color_tokens = clip.tokenize(color_texts).to(device)
-        
-        with torch.no_grad():
-            color_features = model.encode_text(color_tokens)
-            color_features /= color_features.norm(dim=-1, keepdim=True)
-            
-        color_similarity = (100.0 * image_features @ color_features.T).softmax(dim=-1)
-        color_values, color_indices = color_similarity[0].topk(1)
+
+        # То же фото уже кодировалось - без декодирования и инференса
+        key = hashlib.sha256(contents).hexdigest()
+        features = embedding_cache.get(key)
+        if features is not None:
+            with torch.no_grad():
+                return prompt_bank.classify(features.unsqueeze(0))[0]
         
-        color = colors[color_indices[0].item()]
-        color_confidence = color_values[0].item()
+        # Декодирование и предобработка - вне event loop
+        image_input = await asyncio.get_event_loop().run_in_executor(None, load_image, contents)
         
-        return {
-            "animal_type": {
-                "label": animal_type,
-                "confidence": confidence
-            },
-            "color": {
-                "label": color,
-                "confidence": color_confidence
-            }
-        }
+        # Инференс - в общем пакете с параллельными запросами
+        features, result = await batcher.submit(image_input)
+        embedding_cache.put(key, features)
+        return result
         
     except Exception as e:
         logger.error(f"Ошибка при обработке изображения: {str(e)}")
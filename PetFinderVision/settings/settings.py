@@ -75,6 +75,7 @@ INSTALLED_APPS = [
     'advertisements.apps.AdvertisementsConfig',
     'news.apps.NewsConfig',
     'marks.apps.MarksConfig',
+    'similarity_search.apps.SimilaritySearchConfig',
 ]
 
 REST_FRAMEWORK = {
@@ -104,6 +105,36 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Общий для всех воркеров кеш (курсоры постраничного поиска по фото).
+# По умолчанию - таблица в PostgreSQL (python manage.py createcachetable),
+# с REDIS_URL - Redis (нужен пакет redis). Локальный кеш процесса не
+# подходит: следующую страницу может обработать другой воркер.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
+# Similarity search (CLIP + FAISS)
+SIMILARITY_SEARCH = {
+    'MODEL_NAME': os.environ.get('CLIP_MODEL_NAME', 'ViT-B/32'),
+    'WARMUP_ON_STARTUP': os.environ.get('CLIP_WARMUP_ON_STARTUP', '0') == '1',
+    'INDEX_TYPE': os.environ.get('CLIP_INDEX_TYPE', 'auto'),
+    'CALIBRATION_FILE': os.environ.get('CLIP_SEARCH_CALIBRATION', str(BASE_DIR / 'search_calibration.json')),
+    'SHARD_BY': [key for key in os.environ.get('CLIP_SHARD_BY', '').split(',') if key],
+    'SNAPSHOT_DIR': os.environ.get('CLIP_SNAPSHOT_DIR') or None,
+    'VECTOR_BACKEND': os.environ.get('CLIP_VECTOR_BACKEND', 'faiss'),
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -20,7 +20,7 @@ from django.urls import include, path, re_path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.views.generic import TemplateView
 from django.views.static import serve
-from similarity_search.views import SimilaritySearchView
+from similarity_search.views import AdvertisementMatchesView, SimilaritySearchView, TextSimilaritySearchView
 
 from PetFinderVision.router import router
 
@@ -33,6 +33,8 @@ urlpatterns = [
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/similarity-search/", SimilaritySearchView.as_view(), name="similarity_search"),
+    path("api/similarity-search/text/", TextSimilaritySearchView.as_view(), name="similarity_search_text"),
+    path("api/similarity-search/matches/<int:ad_id>/", AdvertisementMatchesView.as_view(), name="similarity_search_matches"),
     re_path(r'^uploads/(?P<path>.*)$', serve, {
         'document_root': settings.MEDIA_ROOT,
     }),
@@ -1,7 +1,13 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.contrib import messages
-from advertisements.models import Advertisement
+from advertisements.models import Advertisement, AdvertisementPhoto
+
+
+class AdvertisementPhotoInline(admin.TabularInline):
+    model = AdvertisementPhoto
+    extra = 0
+    fields = ["image", "position"]
 
 
 @admin.register(Advertisement)
@@ -13,6 +19,7 @@ class AdvertisementAdmin(admin.ModelAdmin):
     list_per_page = 20
     actions = ["mark_as_found", "mark_as_lost", "delete_selected", "delete_all_advertisements"]
     ordering = ["-created_at"]
+    inlines = [AdvertisementPhotoInline]
     
     fieldsets = (
         ('Основная информация', {
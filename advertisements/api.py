@@ -2,6 +2,8 @@ from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from django.http import Http404
 from django.db.models import Q
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.permissions import BasePermission, SAFE_METHODS
@@ -15,7 +17,9 @@ from advertisements.serializers import (
     AdvertisementRetrieveSerializer,
     AdvertisementCreateSerializer,
     AdvertisementListSerializer,
+    AdvertisementPhotoSerializer,
 )
+from similarity_search.services.registry import registry
 
 
 class IsAuthenticatedOrReadOnly(BasePermission):
@@ -28,6 +32,36 @@ class IsAuthenticatedOrReadOnly(BasePermission):
         return bool(request.user and request.user.is_authenticated)
 
 
+def _decode_image_data(image_data):
+    """Достает байты изображения из data URL или строки base64"""
+    if image_data.startswith('data:') and ',' in image_data:
+        image_data = image_data.split(',', 1)[1]
+    return base64.b64decode(image_data)
+
+
+def find_visual_matches(image_data, animal_type=None, top_k=10):
+    """
+    Визуально похожие объявления из векторного индекса CLIP.
+    Тип животного фильтруется внутри запроса к индексу, поэтому результаты
+    не нужно запрашивать с запасом и отбрасывать.
+    Возвращает (совпадения, индекс прогревается). Пока модель в этом
+    воркере не загружена, запрос ее не ждет: прогрев запускается в фоне,
+    а ответ помечается флагом, чтобы пустой список не выглядел как
+    отсутствие похожих.
+    """
+    if not isinstance(image_data, str) or not image_data:
+        return [], False
+    service = registry.peek()
+    if service is None:
+        registry.warm_up()
+        return [], True
+    try:
+        return service.search(_decode_image_data(image_data), top_k=top_k, animal_type=animal_type), False
+    except Exception as e:
+        print(f'Visual search failed: {e}')
+        return [], False
+
+
 class AdvertisementViewSet(ModelViewSet):
     queryset = Advertisement.objects.all()
     filterset_class = AdvertisementFilter
@@ -420,9 +454,6 @@ class AdvertisementViewSet(ModelViewSet):
             
             analysis = ml_response.json()
             
-            # Получаем похожие объявления из ML сервиса
-            similar_pets = analysis.get('similar_pets', [])
-            
             # УЛУЧШЕННЫЙ поиск в базе данных по характеристикам
             queryset = Advertisement.objects.all()
             
@@ -510,38 +541,15 @@ class AdvertisementViewSet(ModelViewSet):
             # Объединяем результаты ML сервиса с результатами из БД
             combined_results = []
             
-            # ИСПРАВЛЕНИЕ: Фильтруем результаты ML сервиса по типу животного
-            filtered_similar_pets = []
-            if 'animal_type' in analysis:
-                detected_type = analysis['animal_type']['label']
-                print(f"Detected animal type: {detected_type}")
-                
-                for pet in similar_pets:
-                    try:
-                        advertisement = Advertisement.objects.get(id=pet.get('ad_id'))
-                        # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Показываем только животных того же типа
-                        if advertisement.type == detected_type:
-                            filtered_similar_pets.append(pet)
-                            print(f"Added similar pet: {advertisement.title} (type: {advertisement.type})")
-                        else:
-                            print(f"Filtered out pet: {advertisement.title} (type: {advertisement.type}, expected: {detected_type})")
-                    except Advertisement.DoesNotExist:
-                        continue
-            else:
-                filtered_similar_pets = similar_pets
-            
-            # Добавляем ОТФИЛЬТРОВАННЫЕ результаты из ML сервиса (высший приоритет)
-            for pet in filtered_similar_pets:
-                ad_id = pet.get('ad_id')
-                try:
-                    advertisement = Advertisement.objects.get(id=ad_id)
-                    ad_serializer = AdvertisementListSerializer(advertisement)
-                    ad_data = ad_serializer.data
-                    ad_data['similarity'] = pet.get('similarity', 0)
-                    ad_data['match_type'] = 'visual_similarity'
-                    combined_results.append(ad_data)
-                except Advertisement.DoesNotExist:
-                    continue
+            # Визуально похожие объявления того же типа: фильтр по типу
+            # применяется внутри запроса к векторному индексу
+            detected_type = analysis['animal_type']['label'] if 'animal_type' in analysis else None
+            visual_matches, index_warming_up = find_visual_matches(image_data, detected_type)
+            for advertisement, similarity in visual_matches:
+                ad_data = AdvertisementListSerializer(advertisement).data
+                ad_data['similarity'] = similarity
+                ad_data['match_type'] = 'visual_similarity'
+                combined_results.append(ad_data)
             
             # Добавляем совпадения по породе (высокий приоритет)
             existing_ids = {result.get('id') for result in combined_results}
@@ -580,7 +588,9 @@ class AdvertisementViewSet(ModelViewSet):
             return Response({
                 'analysis': analysis,
                 'similar_pets': combined_results[:15],  # Возвращаем топ 15 результатов
-                'total_found': len(combined_results)
+                'total_found': len(combined_results),
+                # Визуальный поиск еще недоступен: модель загружается в фоне
+                'index_warming_up': index_warming_up
             })
             
         except Exception as e:
@@ -621,12 +631,13 @@ class AdvertisementViewSet(ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    @action(detail=False, methods=["post"])
-    def upload_photos(self, request):
+    @action(detail=True, methods=["post"])
+    def upload_photos(self, request, pk=None):
         """
-        Upload photos for an advertisement.
+        Upload additional photos for an advertisement.
         """
         try:
+            advertisement = self.get_object()
             photos = request.FILES.getlist('photos')
             if not photos:
                 return Response(
@@ -634,26 +645,31 @@ class AdvertisementViewSet(ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            uploaded_urls = []
-            for photo in photos:
-                # Создаем временный путь для фотографии
-                temp_ad = Advertisement.objects.create(
-                    title="Temporary",
-                    description="Temporary",
-                    author=request.user.username if request.user.is_authenticated else "Anonymous",
-                    photo=photo,
-                    breed="Temporary",
-                    color="white",
-                    sex="unknown",
-                    type="cat",
-                    eye_color="yellow",
-                    face_shape="round",
-                    special_features="none",
-                    status="lost"
+            position = advertisement.photos.count()
+            uploads = []
+            for offset, photo in enumerate(photos):
+                serializer = AdvertisementPhotoSerializer(
+                    data={"image": photo, "position": position + offset},
+                    context={"request": request}
                 )
-                uploaded_urls.append(request.build_absolute_uri(temp_ad.photo.url))
+                serializer.is_valid(raise_exception=True)
+                uploads.append(serializer)
 
-            return Response({"urls": uploaded_urls}, status=status.HTTP_200_OK)
+            # Каждое фото попадает в индекс похожих животных под id объявления
+            for serializer in uploads:
+                serializer.save(advertisement=advertisement)
+
+            return Response(
+                {
+                    "photos": [serializer.data for serializer in uploads],
+                    "urls": [serializer.data["image"] for serializer in uploads],
+                },
+                status=status.HTTP_201_CREATED
+            )
+        except ValidationError as e:
+            return Response({"error": e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except Http404:
+            raise
         except Exception as e:
             return Response(
                 {"error": str(e)},
@@ -760,9 +776,6 @@ def analyze_photo_standalone(request):
         analysis = ml_response.json()
         print("ML service analysis completed successfully")
         
-        # Получаем похожие объявления из ML сервиса
-        similar_pets = analysis.get('similar_pets', [])
-        
         # УЛУЧШЕННЫЙ поиск в базе данных по характеристикам
         queryset = Advertisement.objects.all()
         
@@ -850,38 +863,15 @@ def analyze_photo_standalone(request):
         # Объединяем результаты ML сервиса с результатами из БД
         combined_results = []
         
-        # ИСПРАВЛЕНИЕ: Фильтруем результаты ML сервиса по типу животного
-        filtered_similar_pets = []
-        if 'animal_type' in analysis:
-            detected_type = analysis['animal_type']['label']
-            print(f"Detected animal type: {detected_type}")
-            
-            for pet in similar_pets:
-                try:
-                    advertisement = Advertisement.objects.get(id=pet.get('ad_id'))
-                    # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Показываем только животных того же типа
-                    if advertisement.type == detected_type:
-                        filtered_similar_pets.append(pet)
-                        print(f"Added similar pet: {advertisement.title} (type: {advertisement.type})")
-                    else:
-                        print(f"Filtered out pet: {advertisement.title} (type: {advertisement.type}, expected: {detected_type})")
-                except Advertisement.DoesNotExist:
-                    continue
-        else:
-            filtered_similar_pets = similar_pets
-        
-        # Добавляем ОТФИЛЬТРОВАННЫЕ результаты из ML сервиса (высший приоритет)
-        for pet in filtered_similar_pets:
-            ad_id = pet.get('ad_id')
-            try:
-                advertisement = Advertisement.objects.get(id=ad_id)
-                ad_serializer = AdvertisementListSerializer(advertisement)
-                ad_data = ad_serializer.data
-                ad_data['similarity'] = pet.get('similarity', 0)
-                ad_data['match_type'] = 'visual_similarity'
-                combined_results.append(ad_data)
-            except Advertisement.DoesNotExist:
-                continue
+        # Визуально похожие объявления того же типа: фильтр по типу
+        # применяется внутри запроса к векторному индексу
+        detected_type = analysis['animal_type']['label'] if 'animal_type' in analysis else None
+        visual_matches, index_warming_up = find_visual_matches(image_data, detected_type)
+        for advertisement, similarity in visual_matches:
+            ad_data = AdvertisementListSerializer(advertisement).data
+            ad_data['similarity'] = similarity
+            ad_data['match_type'] = 'visual_similarity'
+            combined_results.append(ad_data)
         
         # Добавляем совпадения по породе (высокий приоритет)
         existing_ids = {result.get('id') for result in combined_results}
@@ -920,7 +910,9 @@ def analyze_photo_standalone(request):
         return Response({
             'analysis': analysis,
             'similar_pets': combined_results[:15],  # Возвращаем топ 15 результатов
-            'total_found': len(combined_results)
+            'total_found': len(combined_results),
+            # Визуальный поиск еще недоступен: модель загружается в фоне
+            'index_warming_up': index_warming_up
         })
         
     except Exception as e:
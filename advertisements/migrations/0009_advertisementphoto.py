@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0008_alter_advertisement_photo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvertisementPhoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='advertisements/', verbose_name='Фото')),
+                ('position', models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата создания')),
+                ('advertisement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='photos', to='advertisements.advertisement', verbose_name='Объявление')),
+            ],
+            options={
+                'verbose_name': 'Фото объявления',
+                'verbose_name_plural': 'Фото объявлений',
+                'ordering': ['position', 'id'],
+            },
+        ),
+    ]
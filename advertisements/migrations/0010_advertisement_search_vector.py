@@ -0,0 +1,53 @@
+# Generated by Django 4.2 on 2026-10-18 15:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='advertisement_search_idx')
+
+# Векторы существующих объявлений; дальше их поддерживает Advertisement.save()
+BACKFILL_SQL = """
+    UPDATE advertisements_advertisement SET search_vector =
+        setweight(to_tsvector('russian', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+        || setweight(to_tsvector('russian', coalesce(special_features, '')), 'C')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    # GIN и to_tsvector есть только в PostgreSQL; на SQLite (dev_settings) поле остается пустым
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.add_index(apps.get_model('advertisements', 'Advertisement'), SEARCH_INDEX)
+    schema_editor.execute(BACKFILL_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.remove_index(apps.get_model('advertisements', 'Advertisement'), SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0009_advertisementphoto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advertisement',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='advertisement', index=SEARCH_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+        ),
+    ]
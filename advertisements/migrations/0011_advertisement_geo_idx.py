@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0010_advertisement_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='advertisement',
+            index=models.Index(fields=['status', 'type', 'latitude', 'longitude'], name='advertisement_geo_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models
 from django.utils import timezone
 
 from common.validators import phone_regex
@@ -110,6 +112,20 @@ class StatusChoices(models.TextChoices):
     FOUND = 'found', 'Найден'
 
 
+# Конфигурация полнотекстового поиска и поля, из которых строится вектор
+SEARCH_CONFIG = 'russian'
+SEARCH_FIELDS = {'title', 'description', 'special_features'}
+
+
+def search_vector_expression():
+    """Взвешенный вектор объявления: заголовок (A), описание (B), приметы (C)"""
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('special_features', weight='C', config=SEARCH_CONFIG)
+    )
+
+
 class Advertisement(models.Model):
     # Основная информация
     title = models.CharField(max_length=255, verbose_name='Заголовок')
@@ -272,14 +288,32 @@ class Advertisement(models.Model):
         blank=True,
         help_text='Общая уверенность ИИ в анализе (0.0-1.0)'
     )
+    # Полнотекстовый индекс (русская морфология) по заголовку, описанию и
+    # приметам; пересчитывается в save(), ищется через GIN-индекс
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return f'{self.title}'
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        # Полнотекстовый поиск есть только в PostgreSQL; на SQLite (dev_settings) вектор не ведется
+        if connection.vendor != 'postgresql':
+            return
+        if update_fields is None or SEARCH_FIELDS & set(update_fields):
+            # Вектор считает PostgreSQL: те же словари, что и у запросов to_tsquery
+            Advertisement.objects.filter(pk=self.pk).update(search_vector=search_vector_expression())
+
     class Meta:
         verbose_name = 'Объявление'
         verbose_name_plural = 'Объявления'
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='advertisement_search_idx'),
+            # Поиск по области: равенство по статусу и типу, диапазон по широте
+            models.Index(fields=['status', 'type', 'latitude', 'longitude'], name='advertisement_geo_idx'),
+        ]
 
     def get_unique_features_display(self):
         """Возвращает список уникальных особенностей питомца"""
@@ -321,3 +355,36 @@ class Advertisement(models.Model):
         features_text = ", ".join(unique_features) if unique_features else "стандартные характеристики"
         
         return f"Уверенность: {confidence_text}, особенности: {features_text}"
+
+    def iter_photos(self):
+        """Все фото объявления: (ключ, файл) - основное и дополнительные"""
+        if self.photo:
+            yield AdvertisementPhoto.MAIN_KEY, self.photo
+        for extra in self.photos.all():
+            if extra.image:
+                yield str(extra.pk), extra.image
+
+
+class AdvertisementPhoto(models.Model):
+    """Дополнительное фото объявления (основное лежит в Advertisement.photo)"""
+
+    # Ключ основного фото; дополнительные адресуются своим id
+    MAIN_KEY = 'main'
+
+    advertisement = models.ForeignKey(
+        Advertisement,
+        on_delete=models.CASCADE,
+        related_name='photos',
+        verbose_name='Объявление'
+    )
+    image = models.ImageField(upload_to='advertisements/', verbose_name='Фото')
+    position = models.PositiveSmallIntegerField(default=0, verbose_name='Порядок')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Дата создания')
+
+    def __str__(self):
+        return f'{self.advertisement_id}: {self.image.name}'
+
+    class Meta:
+        verbose_name = 'Фото объявления'
+        verbose_name_plural = 'Фото объявлений'
+        ordering = ['position', 'id']
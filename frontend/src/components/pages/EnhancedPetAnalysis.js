@@ -183,7 +183,7 @@ const EnhancedPetAnalysis = () => {
       console.log('📦 Данные анализа получены:', data);
       
       setAnalysisResults(data.analysis || {});
-      setSimilarPets(data || []);
+      setSimilarPets(data.results || []);
       
     } catch (error) {
       console.error('💥 Ошибка при анализе:', error);
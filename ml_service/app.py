@@ -1,17 +1,20 @@
-import json
-import io
+import base64
+import binascii
+import math
+import os
+import re
 from typing import List, Optional, Dict, Tuple
-import psycopg2
-import psycopg2.extras
-from datetime import datetime, timedelta
-import uuid
+from datetime import datetime
+from decimal import Decimal
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import sys
 
-from models import ImageAnalysis, SearchResponse, AnimalType, Breed, Feature, LostPetAd, Location, Contact
+import scoring
+from db import Database
+from models import ImageAnalysis, SearchResponse
 
 # Настройка логирования
 logging.basicConfig(
@@ -31,6 +34,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Пул соединений с БД: открывается при старте, размер и кеш выражений - из окружения
+db = Database.from_env()
+
+
+@app.on_event("startup")
+async def open_database():
+    await db.connect()
+
+
+@app.on_event("shutdown")
+async def close_database():
+    await db.close()
+
 # Словари пород для распознавания по имени файла
 DOG_BREEDS = {
     # Популярные породы собак
@@ -286,198 +302,258 @@ def detect_color_from_filename(filename: str) -> str:
     
     return "смешанный"
 
-def get_lost_pets_by_type(animal_type: str, special_features: List[str] = None, analysis_breed: str = None, analysis_color: str = None) -> List[Dict]:
-    """Простой поиск объявлений о потерянных питомцах с вычислением сходства"""
+# Размер страницы поиска по умолчанию и верхняя граница
+SEARCH_LIMIT = int(os.environ.get('ML_SEARCH_LIMIT', '50'))
+SEARCH_MAX_LIMIT = int(os.environ.get('ML_SEARCH_MAX_LIMIT', '200'))
+
+# Ключевые слова уникальных особенностей для поиска в тексте объявления
+FEATURE_KEYWORDS = {
+    'гетерохромия': ['гетерохромия', 'разные глаза', 'different eyes', 'heterochromia'],
+    'залом на ухе': ['залом', 'ухо', 'ear fold', 'fold', 'сломанное ухо', 'травма уха'],
+    'нет глаза': ['нет глаза', 'без глаза', 'missing eye', 'один глаз', 'слепой']
+}
+
+# Стоп-слова русской конфигурации, которые меняют смысл особенности: в
+# search_vector их нет, и "нет глаза" без них превратилось бы в "глаз"
+QUALIFIER_WORDS = frozenset({'не', 'нет', 'ни', 'без', 'один', 'два', 'три'})
+
+# Совпадение особенностей - пробой GIN-индекса advertisement_search_idx по
+# полнотекстовому вектору объявления (русская морфология: "разные глаза"
+# находит и "разными глазами"). $3 - tsquery из всех фраз (в нем фразы с
+# уточнениями сведены к значимым словам), $6 - tsquery из фраз без уточнений,
+# $7 - фразы с уточнениями: их кандидаты сверяются с текстом дословно, по
+# конфигурации simple, которая стоп-слова не выбрасывает
+FEATURE_HITS_SQL = """
+    SELECT id FROM advertisements_advertisement
+    WHERE $3 <> '' AND search_vector @@ to_tsquery('russian', $3)
+      AND (($6 <> '' AND search_vector @@ to_tsquery('russian', $6))
+           OR EXISTS (
+               SELECT 1 FROM unnest($7::text[]) phrase
+               WHERE to_tsvector('simple', concat_ws(' ', title, description, special_features))
+                     @@ phraseto_tsquery('simple', phrase)
+           ))
+"""
+
+EARTH_RADIUS_KM = 6371.0
+
+# Точное расстояние по большому кругу от точки поиска до объявления, км
+HAVERSINE_SQL = """
+    2 * {earth_radius} * asin(sqrt(least(1.0,
+        power(sin(radians(a.latitude - {lat}) / 2), 2)
+        + cos(radians({lat})) * cos(radians(a.latitude)) * power(sin(radians(a.longitude - {lon}) / 2), 2)
+    )))
+"""
+
+
+def bounding_box(latitude: float, longitude: float,
+                 radius_km: float) -> Tuple[float, Optional[float], float, Optional[float]]:
+    """Прямоугольник (min_lat, min_lon, max_lat, max_lon), описанный вокруг круга поиска.
+
+    Долгота None - круг задевает полюс или 180-й меридиан, и по долготе
+    не фильтруем: точный отбор все равно делает haversine.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - math.degrees(angle)
+    max_lat = latitude + math.degrees(angle)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return max(min_lat, -90.0), None, min(max_lat, 90.0), None
+    # Наибольший разброс долготы круга на сфере
+    spread = math.sin(angle) / math.cos(math.radians(latitude))
+    if spread >= 1.0:
+        return min_lat, None, max_lat, None
+    delta_lon = math.degrees(math.asin(spread))
+    if longitude - delta_lon < -180.0 or longitude + delta_lon > 180.0:
+        return min_lat, None, max_lat, None
+    return min_lat, longitude - delta_lon, max_lat, longitude + delta_lon
+
+
+def feature_phrases(special_features: List[str]) -> List[Tuple[str, ...]]:
+    """Особенности и их ключевые слова -> уникальные фразы (кортежи слов)"""
+    phrases = []
+    for feature in special_features:
+        for keyword in [feature, *FEATURE_KEYWORDS.get(feature, [])]:
+            words = tuple(re.findall(r'\w+', keyword.lower()))
+            if words and words not in phrases:
+                phrases.append(words)
+    return phrases
+
+
+def is_qualified(phrase: Tuple[str, ...]) -> bool:
+    """Есть ли во фразе уточнение ("нет", "без", "один"), которого не видит search_vector"""
+    return not QUALIFIER_WORDS.isdisjoint(phrase)
+
+
+def feature_tsquery(phrases: List[Tuple[str, ...]]) -> str:
+    """Фразы -> один tsquery.
+
+    Фраза становится цепочкой слов через <->, фразы объединяются
+    через |. Пустая строка - фраз нет.
+    """
+    return ' | '.join(f"({' <-> '.join(phrase)})" for phrase in phrases)
+
+
+def encode_cursor(row) -> str:
+    """Курсор страницы: ключ сортировки последней отданной строки"""
+    key = f"{row['match_score']}|{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Decimal, datetime, int]:
+    try:
+        score, created_at, ad_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return Decimal(score), datetime.fromisoformat(created_at), int(ad_id)
+    # Не base64, не UTF-8 или нечисловая оценка (InvalidOperation) - тоже 400, а не 500
+    except (ValueError, ArithmeticError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Некорректный курсор страницы")
+
+
+async def get_lost_pets_by_type(animal_type: str, special_features: List[str] = None, analysis_breed: str = None,
+                                analysis_color: str = None, limit: int = None, cursor: Optional[str] = None,
+                                latitude: Optional[float] = None, longitude: Optional[float] = None,
+                                radius_km: Optional[float] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Поиск объявлений о потерянных питомцах с вычислением сходства.
+
+    Кандидаты отбираются одним запросом: совпадения особенностей, породы
+    и цвета складываются в оценку, СУБД сортирует по ней и отдает не
+    больше limit строк. Следующая страница - по курсору (keyset), поэтому
+    объем ответа и работа сервиса не зависят от числа объявлений.
+    С точкой поиска кандидаты ограничены кругом radius_km: грубый отбор по
+    прямоугольнику широта/долгота идет по индексу advertisement_geo_idx,
+    точный - по haversine, а близость места входит в оценку.
+    Возвращает (объявления, курсор следующей страницы или None).
+    """
+    # Битый курсор - ошибка клиента (400), а не пустая выдача
+    keyset = decode_cursor(cursor) if cursor else None
     try:
         logger.info(f"Поиск объявлений: animal_type='{animal_type}', special_features={special_features}")
-        
-        with psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database="postgres",
-            user="postgres",
-            password="postgres",
-            cursor_factory=psycopg2.extras.RealDictCursor
-        ) as conn:
-            with conn.cursor() as cursor:
-                # Базовый запрос
-                base_query = """
-                    SELECT id, title, description, type as animal_type, breed, color, 
-                           special_features as features, photo as image_url, created_at as lost_date, 
-                           latitude as lost_location_lat, longitude as lost_location_lon, 
-                           location as lost_location_address, author as contact_name, 
-                           phone as contact_phone, status, created_at, updated_at
-                    FROM advertisements_advertisement 
-                    WHERE status = %s AND type = %s
-                """
-                
-                # Если есть особенности, делаем два запроса: с особенностями и без них
-                all_advertisements = []
-                
-                if special_features:
-                    # Первый запрос: ищем объявления с особенностями в описании
-                    like_conditions = []
-                    special_params = ['lost', animal_type]
-                    
-                    for feature in special_features:
-                        like_conditions.append("description ILIKE %s")
-                        special_params.append(f"%{feature}%")
-                    
-                    if like_conditions:
-                        special_query = f"{base_query} AND ({' OR '.join(like_conditions)})"
-                        cursor.execute(special_query, special_params)
-                        special_rows = cursor.fetchall()
-                        logger.info(f"🎯 Найдено {len(special_rows)} объявлений с особенностями")
-                        all_advertisements.extend(special_rows)
-                
-                # Всегда делаем основной запрос для получения всех объявлений типа
-                cursor.execute(base_query, ['lost', animal_type])
-                base_rows = cursor.fetchall()
-                logger.info(f"📋 Найдено {len(base_rows)} обычных объявлений")
-                
-                # Добавляем обычные объявления, избегая дубликатов
-                existing_ids = {row['id'] for row in all_advertisements}
-                for row in base_rows:
-                    if row['id'] not in existing_ids:
-                        all_advertisements.append(row)
-                
-                logger.info(f"✅ Итого объявлений для обработки: {len(all_advertisements)}")
-                
-                # Простое преобразование в нужный формат
-                advertisements = []
-                for row in all_advertisements:
-                    # Вычисляем сходство и тип совпадения
-                    similarity, match_type = calculate_similarity_and_match_type(
-                        row, analysis_breed, analysis_color, special_features
-                    )
-                    
-                    ad = {
-                        'id': str(row['id']),
-                        'title': row['title'],
-                        'description': row['description'],
-                        'animal_type': row['animal_type'],
-                        'breed': row['breed'] or 'unknown',
-                        'color': row['color'] or 'unknown',
-                        'pattern': 'solid',
-                        'features': [row['features']] if row['features'] else [],
-                        'image_url': row['image_url'],
-                        'lost_date': row['lost_date'].isoformat() if row['lost_date'] else None,
-                        'lost_location': {
-                            'latitude': float(row['lost_location_lat']) if row['lost_location_lat'] else 0.0,
-                            'longitude': float(row['lost_location_lon']) if row['lost_location_lon'] else 0.0,
-                            'address': row['lost_location_address'] or ''
-                        },
-                        'contact': {
-                            'name': row['contact_name'] or '',
-                            'phone': row['contact_phone'] or '',
-                            'email': ''
-                        },
-                        'reward': None,
-                        'status': row['status'],
-                        'created_at': row['created_at'].isoformat() if row['created_at'] else None,
-                        'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None,
-                        'similarity': similarity,
-                        'match_type': match_type
-                    }
-                    advertisements.append(ad)
-                
-                # Сортируем по сходству, потом по дате создания
-                advertisements.sort(key=lambda x: (-x['similarity'], x['created_at'] or ''), reverse=False)
-                return advertisements
-                
-    except Exception as e:
-        logger.error(f"Ошибка при получении объявлений: {str(e)}")
-        return []
+        limit = min(limit or SEARCH_LIMIT, SEARCH_MAX_LIMIT)
 
-def calculate_similarity_and_match_type(row, analysis_breed: str, analysis_color: str, special_features: List[str]) -> tuple:
-    """Вычисляет сходство и тип совпадения"""
-    import random
-    
-    similarity = 0.0
-    match_type = 'type_match'  # по умолчанию - совпадение типа
-    visual_similarity_detected = False
-    
-    # Базовое сходство за тип животного
-    similarity += 0.4
-    
-    # Проверяем наличие уникальных особенностей в загруженном изображении
-    has_unique_features = bool(special_features)
-    
-    # Особые признаки дают большой бонус и приоритет
-    if special_features:
-        logger.info(f"🔍 Обнаружены уникальные особенности: {special_features}")
-        
-        # Ищем совпадения в разных полях объявления
-        search_text = f"{row['description']} {row['title']} {row.get('special_features', '')}".lower()
-        
-        feature_keywords = {
-            'гетерохромия': ['гетерохромия', 'разные глаза', 'different eyes', 'heterochromia'],
-            'залом на ухе': ['залом', 'ухо', 'ear fold', 'fold', 'сломанное ухо', 'травма уха'],
-            'нет глаза': ['нет глаза', 'без глаза', 'missing eye', 'один глаз', 'слепой']
-        }
-        
-        for feature in special_features:
-            if feature in feature_keywords:
-                keywords = feature_keywords[feature]
-                if any(keyword in search_text for keyword in keywords):
-                    similarity += 0.35  # Большой бонус за точное совпадение уникальной особенности
-                    visual_similarity_detected = True
-                    logger.info(f"✅ Найдено точное совпадение для '{feature}'")
-                    break
+        phrases = feature_phrases(special_features or [])
+        params = [
+            'lost', animal_type,
+            feature_tsquery(phrases),
+            analysis_breed or '', analysis_color or '',
+            feature_tsquery([phrase for phrase in phrases if not is_qualified(phrase)]),
+            [' '.join(phrase) for phrase in phrases if is_qualified(phrase)],
+        ]
+
+        def bind(value) -> str:
+            params.append(value)
+            return f"${len(params)}"
+
+        score_sql = scoring.match_score_sql(analysis_breed)
+        distance_sql, geo_join, geo_where = 'NULL::float8', '', ''
+        geo = latitude is not None and longitude is not None
+        if geo:
+            min_lat, min_lon, max_lat, max_lon = bounding_box(latitude, longitude, radius_km)
+            lat, lon, radius = bind(latitude), bind(longitude), bind(radius_km)
+            distance_sql = 'd.distance_km'
+            geo_join = (
+                "CROSS JOIN LATERAL (SELECT "
+                f"{HAVERSINE_SQL.format(earth_radius=EARTH_RADIUS_KM, lat=lat, lon=lon)} AS distance_km) d"
+            )
+            geo_where = f"AND a.latitude BETWEEN {bind(min_lat)} AND {bind(max_lat)}"
+            if min_lon is not None:
+                geo_where += f" AND a.longitude BETWEEN {bind(min_lon)} AND {bind(max_lon)}"
+            geo_where += f" AND d.distance_km <= {radius}"
+            # numeric, как и остальная оценка: курсор сравнивает ее без потерь
+            score_sql += f" + ({scoring.DISTANCE} * (1 - least(d.distance_km / {radius}, 1)))::numeric"
+
+        after = ''
+        if keyset is not None:
+            score, created_at, ad_id = keyset
+            after = f"WHERE (match_score, created_at, id) < ({bind(score)}::numeric, {bind(created_at)}, {bind(ad_id)})"
+        page_size = bind(limit + 1)
+
+        rows = await db.fetch(f"""
+            SELECT * FROM (
+                SELECT a.id, a.title, a.description, a.type as animal_type, a.breed, a.color,
+                       a.special_features as features, a.photo as image_url, a.created_at as lost_date,
+                       a.latitude as lost_location_lat, a.longitude as lost_location_lon,
+                       a.location as lost_location_address, a.author as contact_name,
+                       a.phone as contact_phone, a.status, a.created_at, a.updated_at,
+                       hits.id IS NOT NULL AS feature_hit,
+                       {distance_sql} AS distance_km,
+                       {score_sql} AS match_score
+                FROM advertisements_advertisement a
+                LEFT JOIN ({FEATURE_HITS_SQL}) hits ON hits.id = a.id
+                {geo_join}
+                WHERE a.status = $1 AND a.type = $2 {geo_where}
+            ) candidates
+            {after}
+            ORDER BY match_score DESC, created_at DESC, id DESC
+            LIMIT {page_size}
+        """, *params)
+
+        # Лишняя строка говорит, что есть следующая страница
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        rows = rows[:limit]
+        logger.info(f"✅ Объявлений на странице: {len(rows)}, следующая страница: {bool(next_cursor)}")
+
+        # Сходство и тип совпадения - для всей страницы одним векторным проходом
+        similarities, match_types = scoring.CandidateBatch.from_rows(rows).score(
+            analysis_breed, analysis_color, has_features=bool(special_features),
+            radius_km=radius_km if geo else None
+        )
+
+        advertisements = []
+        for row, similarity, match_type in zip(rows, similarities.tolist(), scoring.MATCH_TYPES[match_types].tolist()):
+            ad = {
+                'id': str(row['id']),
+                'title': row['title'],
+                'description': row['description'],
+                'animal_type': row['animal_type'],
+                'breed': row['breed'] or 'unknown',
+                'color': row['color'] or 'unknown',
+                'pattern': 'solid',
+                'features': [row['features']] if row['features'] else [],
+                'image_url': row['image_url'],
+                'lost_date': row['lost_date'].isoformat() if row['lost_date'] else None,
+                'lost_location': {
+                    'latitude': float(row['lost_location_lat']) if row['lost_location_lat'] else 0.0,
+                    'longitude': float(row['lost_location_lon']) if row['lost_location_lon'] else 0.0,
+                    'address': row['lost_location_address'] or ''
+                },
+                'contact': {
+                    'name': row['contact_name'] or '',
+                    'phone': row['contact_phone'] or '',
+                    'email': ''
+                },
+                'reward': None,
+                'status': row['status'],
+                'created_at': row['created_at'].isoformat() if row['created_at'] else None,
+                'updated_at': row['updated_at'].isoformat() if row['updated_at'] else None,
+                'similarity': similarity,
+                'match_type': match_type,
+                'distance_km': round(float(row['distance_km']), 2) if row['distance_km'] is not None else None
+            }
+            advertisements.append(ad)
         
-        # Даже если не нашли точное совпадение, но есть уникальные особенности - даем бонус
-        if not visual_similarity_detected:
-            similarity += 0.25  # Средний бонус за наличие уникальных особенностей
-            visual_similarity_detected = True
-            logger.info(f"⭐ Бонус за уникальные особенности: {special_features}")
-    
-    # Устанавливаем тип совпадения с приоритетом визуального сходства
-    if visual_similarity_detected:
-        match_type = 'visual_similarity'
-    else:
-        # Бонус за породу (только если нет visual_similarity)
-        if analysis_breed and row['breed']:
-            if analysis_breed.lower() == row['breed'].lower():
-                similarity += 0.4
-                match_type = 'breed_match'
-            elif 'беспородная' in analysis_breed.lower() or 'unknown' in analysis_breed.lower():
-                similarity += 0.15
-            else:
-                # Добавляем небольшой случайный элемент для разнообразия
-                similarity += random.uniform(0.05, 0.2)
+        # Порядок задан запросом: оценка совпадения, затем свежесть
+        return advertisements, next_cursor
         
-        # Бонус за цвет (только если нет visual_similarity и breed_match)
-        if analysis_color and row['color'] and match_type != 'breed_match':
-            if analysis_color.lower() == row['color'].lower():
-                similarity += 0.2
-                if match_type == 'type_match':
-                    match_type = 'color_match'
-            else:
-                similarity += random.uniform(0.0, 0.1)
-    
-    # Добавляем случайность для реалистичности (меньше для visual_similarity)
-    if visual_similarity_detected:
-        similarity += random.uniform(-0.05, 0.05)  # Меньше случайности для уникальных особенностей
-    else:
-        similarity += random.uniform(-0.1, 0.1)
-    
-    # Ограничиваем значения (для visual_similarity минимум выше)
-    min_similarity = 0.6 if visual_similarity_detected else 0.3
-    similarity = max(min_similarity, min(1.0, similarity))
-    
-    return round(similarity, 2), match_type
+    except Exception as e:
+        logger.error(f"Ошибка при получении объявлений: {str(e)}")
+        return [], None
 
 @app.get("/")
 async def health_check():
     """Проверка работоспособности сервиса"""
     return {"status": "ok", "message": "ML service is running"}
 
+@app.get("/health/db")
+async def database_health_check():
+    """Доступность БД, задержка запроса и заполненность пула соединений"""
+    return await db.health()
+
 @app.post("/search/")
 async def search_pets(
     file: UploadFile = File(...),
     latitude: Optional[float] = Query(None, description="Широта для поиска похожих объявлений"),
     longitude: Optional[float] = Query(None, description="Долгота для поиска похожих объявлений"),
-    radius_km: Optional[float] = Query(10.0, description="Радиус поиска в километрах")
+    radius_km: Optional[float] = Query(10.0, gt=0, description="Радиус поиска в километрах"),
+    limit: Optional[int] = Query(None, ge=1, description="Размер страницы объявлений"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из прошлого ответа")
 ) -> SearchResponse:
     """Псевдо-анализ изображения и поиск похожих питомцев по имени файла"""
     try:
@@ -587,16 +663,22 @@ async def search_pets(
         }
 
         # Получаем объявления из PostgreSQL
-        similar_lost_pets = get_lost_pets_by_type(animal_type, special_features, breed, color)
+        similar_lost_pets, next_cursor = await get_lost_pets_by_type(
+            animal_type, special_features, breed, color, limit=limit, cursor=cursor,
+            latitude=latitude, longitude=longitude, radius_km=radius_km or 10.0
+        )
         
         logger.info(f"Найдено {len(similar_lost_pets)} объявлений для '{animal_type}'")
 
         response = SearchResponse(
             analysis=ImageAnalysis(**structured_analysis),
             similar_pets=[],
-            similar_lost_pets=similar_lost_pets
+            similar_lost_pets=similar_lost_pets,
+            next_cursor=next_cursor
         )
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Ошибка в псевдо-анализаторе: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+
+class Database:
+    """Пул асинхронных соединений с PostgreSQL (asyncpg).
+
+    Соединения открываются один раз при старте сервиса и переиспользуются,
+    поэтому установка соединения не попадает в обработку запроса, а
+    запросы параллельных поисков не блокируют event loop. asyncpg кеширует
+    подготовленные выражения на каждом соединении (statement_cache_size),
+    и повторяющиеся запросы не разбираются сервером заново.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 5432, database: str = 'postgres',
+                 user: str = 'postgres', password: str = 'postgres', min_size: int = 1,
+                 max_size: int = 10, statement_cache_size: int = 100, command_timeout: float = 10.0,
+                 acquire_timeout: float = 5.0, max_inactive_lifetime: float = 300.0):
+        self.host = host
+        self.port = port
+        self.database = database
+        self.user = user
+        self.password = password
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.command_timeout = command_timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_inactive_lifetime = max_inactive_lifetime
+        self.pool: Optional[asyncpg.Pool] = None
+
+    @classmethod
+    def from_env(cls) -> 'Database':
+        """Параметры из окружения: те же DB_*, что у Django, и ML_DB_* для пула"""
+        return cls(
+            host=os.environ.get('DB_HOST', '127.0.0.1'),
+            port=int(os.environ.get('DB_PORT', '5432')),
+            database=os.environ.get('DB_NAME', 'postgres'),
+            user=os.environ.get('DB_USER', 'postgres'),
+            password=os.environ.get('DB_PASSWORD', 'postgres'),
+            min_size=int(os.environ.get('ML_DB_POOL_MIN', '1')),
+            max_size=int(os.environ.get('ML_DB_POOL_MAX', '10')),
+            # 0 отключает кеш (нужно за pgbouncer в режиме transaction)
+            statement_cache_size=int(os.environ.get('ML_DB_STATEMENT_CACHE_SIZE', '100')),
+            command_timeout=float(os.environ.get('ML_DB_COMMAND_TIMEOUT', '10')),
+            acquire_timeout=float(os.environ.get('ML_DB_ACQUIRE_TIMEOUT', '5')),
+            max_inactive_lifetime=float(os.environ.get('ML_DB_MAX_IDLE_SECONDS', '300')),
+        )
+
+    async def connect(self):
+        self.pool = await asyncpg.create_pool(
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            user=self.user,
+            password=self.password,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            statement_cache_size=self.statement_cache_size,
+            command_timeout=self.command_timeout,
+            # Простаивающие соединения закрываются, пул не держит лишнего
+            max_inactive_connection_lifetime=self.max_inactive_lifetime,
+        )
+        latency = await self.ping()
+        logger.info(
+            f"Пул соединений с БД {self.host}:{self.port}/{self.database}: "
+            f"{self.min_size}-{self.max_size}, ping {latency:.1f} мс"
+        )
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def fetch(self, query: str, *args) -> List[asyncpg.Record]:
+        """Выполняет запрос на соединении из пула; ждет свободное не дольше acquire_timeout"""
+        if self.pool is None:
+            raise RuntimeError("Пул соединений с БД не открыт")
+        async with self.pool.acquire(timeout=self.acquire_timeout) as connection:
+            return await connection.fetch(query, *args)
+
+    async def ping(self) -> float:
+        """Время запроса SELECT 1, мс"""
+        if self.pool is None:
+            raise RuntimeError("Пул соединений с БД не открыт")
+        started = time.perf_counter()
+        async with self.pool.acquire(timeout=self.acquire_timeout) as connection:
+            await connection.fetchval('SELECT 1')
+        return (time.perf_counter() - started) * 1000.0
+
+    async def health(self) -> Dict[str, Any]:
+        """Доступность БД и заполненность пула"""
+        result: Dict[str, Any] = {
+            'status': 'ok',
+            'pool': {
+                'size': self.pool.get_size() if self.pool is not None else 0,
+                'idle': self.pool.get_idle_size() if self.pool is not None else 0,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'statement_cache_size': self.statement_cache_size,
+            },
+        }
+        try:
+            result['latency_ms'] = round(await self.ping(), 2)
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        return result
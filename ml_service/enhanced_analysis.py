@@ -8,7 +8,7 @@ from skimage.color import rgb2hsv, rgb2lab
 from skimage.feature import local_binary_pattern
 from skimage.measure import regionprops, label
 import logging
-from similarity_search.services.clip_service import CLIPService
+from similarity_search.services.registry import registry
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +21,11 @@ class EnhancedPetAnalyzer:
             'cat': CatAnalyzer(), 
             'bird': BirdAnalyzer()
         }
-        self.clip_service = CLIPService()
+
+    @property
+    def clip_service(self):
+        """Общий для процесса CLIP-сервис с уже построенным индексом"""
+        return registry.get()
         
     def analyze_pet(self, image):
         """Основной метод анализа питомца"""
@@ -38,8 +42,8 @@ class EnhancedPetAnalyzer:
             else:
                 specialized_analysis = self._generic_analysis(image, base_features)
             
-            # Поиск похожих животных
-            similar_pets = self.clip_service.search(image, top_k=5)
+            # Поиск похожих животных того же типа (фильтр внутри индекса)
+            similar_pets = self.clip_service.search(image, top_k=5, animal_type=animal_type)
             
             return {
                 'animal_type': {
@@ -75,6 +75,7 @@ class LostPetAd(BaseModel):
     updated_at: datetime
     similarity: Optional[float]
     match_type: Optional[str] = None
+    distance_km: Optional[float] = None
 
 class SimilarPet(BaseModel):
     id: str
@@ -89,4 +90,5 @@ class SimilarPet(BaseModel):
 class SearchResponse(BaseModel):
     analysis: ImageAnalysis
     similar_pets: List[SimilarPet]
-    similar_lost_pets: List[LostPetAd] 
\ No newline at end of file
+    similar_lost_pets: List[LostPetAd]
+    next_cursor: Optional[str] = None 
\ No newline at end of file
@@ -7,9 +7,10 @@ import numpy as np
 import cv2
 import logging
 from typing import Dict, List, Tuple
-from sklearn.metrics.pairwise import cosine_similarity
 import json
 
+from similarity_search.services.strategy import exact_top_k
+
 class PetClassifier:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
@@ -301,24 +302,25 @@ class PetClassifier:
             if len(database_features) == 0:
                 return []
             
-            # Преобразуем в numpy массивы
-            query_features = query_features.reshape(1, -1)
-            db_features = np.array(database_features)
-            
-            # Вычисляем косинусное сходство
-            similarities = cosine_similarity(query_features, db_features)[0]
+            # Нормированные векторы в одной непрерывной матрице: косинус = скалярное произведение
+            query_features = np.asarray(query_features, dtype=np.float32).reshape(-1)
+            query_features = query_features / max(np.linalg.norm(query_features), 1e-12)
+            db_features = np.ascontiguousarray(database_features, dtype=np.float32)
+            db_features /= np.maximum(np.linalg.norm(db_features, axis=1, keepdims=True), 1e-12)
             
-            # Получаем индексы отсортированные по убыванию сходства
-            sorted_indices = np.argsort(similarities)[::-1]
+            # База приходит при каждом вызове, поэтому индекс FAISS пришлось бы
+            # строить на каждый запрос; для одного запроса к плоской базе это то же
+            # умножение BLAS, только с лишней копией матрицы
+            similarities, indices = exact_top_k(db_features, query_features, top_k)
             
             # Возвращаем топ-k результатов
             results = []
-            for idx in sorted_indices[:top_k]:
-                if similarities[idx] > 0.1:  # Минимальный порог сходства
-                    results.append((int(idx), float(similarities[idx])))
+            for idx, similarity in zip(indices, similarities):
+                if idx >= 0 and similarity > 0.1:  # Минимальный порог сходства
+                    results.append((int(idx), float(similarity)))
             
             return results
             
         except Exception as e:
             self.logger.error(f"Ошибка поиска похожих питомцев: {str(e)}")
-            return [] 
\ No newline at end of file
+            return []
@@ -0,0 +1,205 @@
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Веса оценки совпадения. Их же использует SQL-ранжирование в app.py
+# (match_score_sql), поэтому порядок страниц и показанное сходство совпадают.
+BASE = 0.4                  # совпадение типа животного
+FEATURE_HIT = 0.35          # особенность найдена в тексте объявления
+FEATURE_PRESENT = 0.25      # особенности есть на фото, но в тексте не найдены
+BREED_MATCH = 0.4
+BREED_UNKNOWN = 0.15        # порода на фото не определена
+BREED_MISMATCH = 0.125      # середина прежнего random.uniform(0.05, 0.2)
+COLOR_MATCH = 0.2
+COLOR_MISMATCH = 0.05       # середина прежнего random.uniform(0.0, 0.1)
+DISTANCE = 0.1              # близость места: от 0 на границе радиуса до DISTANCE в центре
+MIN_SIMILARITY = 0.3
+MIN_VISUAL_SIMILARITY = 0.6
+
+# Типы совпадения по коду
+TYPE_MATCH, BREED_MATCH_TYPE, COLOR_MATCH_TYPE, VISUAL_SIMILARITY = range(4)
+MATCH_TYPES = np.array(['type_match', 'breed_match', 'color_match', 'visual_similarity'])
+
+UNKNOWN_BREED_MARKERS = ('беспородная', 'unknown')
+
+
+def is_unknown_breed(breed: Optional[str]) -> bool:
+    return bool(breed) and any(marker in breed.lower() for marker in UNKNOWN_BREED_MARKERS)
+
+
+def breed_mismatch_weight(analysis_breed: Optional[str]) -> float:
+    """Бонус, если порода объявления не совпала с определенной на фото"""
+    return BREED_UNKNOWN if is_unknown_breed(analysis_breed) else BREED_MISMATCH
+
+
+# Та же оценка в SQL (ранжирование в app.py) с весами выше: с особенностями
+# решает их совпадение в тексте, без них - порода, затем цвет (если порода
+# не совпала). $3 - tsquery особенностей, $4 - порода, $5 - цвет с анализа;
+# hits - объявления, где особенности нашлись в тексте
+MATCH_SCORE_SQL = """
+    {base} + CASE
+        WHEN $3 <> '' THEN
+            CASE WHEN hits.id IS NOT NULL THEN {feature_hit} ELSE {feature_present} END
+        ELSE
+            CASE WHEN $4 = '' OR coalesce(a.breed, '') = '' THEN 0
+                 WHEN lower(a.breed) = lower($4) THEN {breed_match}
+                 ELSE {breed_mismatch} END
+            + CASE WHEN $5 = '' OR coalesce(a.color, '') = ''
+                        OR ($4 <> '' AND lower(a.breed) = lower($4)) THEN 0
+                   WHEN lower(a.color) = lower($5) THEN {color_match}
+                   ELSE {color_mismatch} END
+    END
+"""
+
+
+def match_score_sql(analysis_breed: Optional[str]) -> str:
+    """Выражение оценки до ограничения снизу и округления (их делает CandidateBatch.score)"""
+    return MATCH_SCORE_SQL.format(
+        base=BASE,
+        feature_hit=FEATURE_HIT,
+        feature_present=FEATURE_PRESENT,
+        breed_match=BREED_MATCH,
+        breed_mismatch=breed_mismatch_weight(analysis_breed),
+        color_match=COLOR_MATCH,
+        color_mismatch=COLOR_MISMATCH,
+    )
+
+
+def round_score(values: np.ndarray) -> np.ndarray:
+    """Округление до сотых половиной вверх, как round(numeric, 2) в PostgreSQL.
+
+    Веса кратны 0.005, и сумма во float может оказаться чуть меньше
+    половины (0.4 + 0.125 + 0.05 -> 0.57499...); допуск убирает эту ошибку,
+    чтобы показанное сходство не расходилось с оценкой SQL.
+    """
+    return np.floor(np.asarray(values) * 100.0 + 0.5 + 1e-9) / 100.0
+
+
+def _encode(values: Sequence[Optional[str]], target: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Столбец строк -> (значение заполнено, значение совпало с target без учета регистра).
+
+    Строки кодируются словарем уникальных значений, поэтому нижний регистр и
+    сравнение выполняются один раз на значение словаря, а не на кандидата.
+    """
+    vocabulary: Dict[Optional[str], int] = {}
+    codes = np.fromiter((vocabulary.setdefault(value, len(vocabulary)) for value in values),
+                        dtype=np.int64, count=len(values))
+    target = target.lower()
+    filled = np.array([bool(value) for value in vocabulary], dtype=bool)
+    matches = np.array([bool(value) and value.lower() == target for value in vocabulary], dtype=bool)
+    return filled[codes], matches[codes]
+
+
+class CandidateBatch:
+    """Кандидаты поиска в виде столбцов NumPy: коды породы и цвета, флаг
+    особенности и расстояние до точки поиска (NaN - поиск без области)"""
+
+    def __init__(self, breeds: Sequence[Optional[str]], colors: Sequence[Optional[str]],
+                 feature_hits: Sequence[bool], distances: Optional[Sequence[Optional[float]]] = None):
+        self.breeds = list(breeds)
+        self.colors = list(colors)
+        self.feature_hit = np.asarray(feature_hits, dtype=bool)
+        if distances is None:
+            distances = [None] * len(self.breeds)
+        self.distance_km = np.array([np.nan if value is None else value for value in distances], dtype=np.float64)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence) -> 'CandidateBatch':
+        return cls(
+            [row['breed'] for row in rows],
+            [row['color'] for row in rows],
+            [bool(row.get('feature_hit')) for row in rows],
+            [row.get('distance_km') for row in rows],
+        )
+
+    def __len__(self):
+        return len(self.feature_hit)
+
+    def score(self, analysis_breed: Optional[str], analysis_color: Optional[str],
+              has_features: bool, radius_km: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Сходство (округлено до сотых) и код типа совпадения для всех кандидатов за один проход.
+
+        Оценка детерминирована: одинаковые входы дают одинаковый результат,
+        поэтому ее можно кешировать, а порядок равных оценок задает SQL
+        (created_at, id).
+        """
+        n = len(self)
+        proximity = self.proximity(radius_km)
+        if has_features:
+            similarity = BASE + np.where(self.feature_hit, FEATURE_HIT, FEATURE_PRESENT) + proximity
+            match_type = np.full(n, VISUAL_SIMILARITY, dtype=np.int8)
+            return round_score(np.clip(similarity, MIN_VISUAL_SIMILARITY, 1.0)), match_type
+
+        similarity = np.full(n, BASE) + proximity
+        match_type = np.full(n, TYPE_MATCH, dtype=np.int8)
+        breed_match = np.zeros(n, dtype=bool)
+        if analysis_breed and n:
+            has_breed, breed_match = _encode(self.breeds, analysis_breed)
+            similarity += np.where(breed_match, BREED_MATCH, np.where(has_breed, breed_mismatch_weight(analysis_breed), 0.0))
+            match_type[breed_match] = BREED_MATCH_TYPE
+        if analysis_color and n:
+            has_color, color_match = _encode(self.colors, analysis_color)
+            # Цвет учитывается, только если порода не совпала
+            eligible = has_color & ~breed_match
+            color_match &= eligible
+            similarity += np.where(color_match, COLOR_MATCH, np.where(eligible, COLOR_MISMATCH, 0.0))
+            match_type[color_match] = COLOR_MATCH_TYPE
+        return round_score(np.clip(similarity, MIN_SIMILARITY, 1.0)), match_type
+
+    def proximity(self, radius_km: Optional[float]) -> np.ndarray:
+        """Бонус за близость: линейно от DISTANCE в точке поиска до 0 на границе радиуса"""
+        if not radius_km:
+            return np.zeros(len(self))
+        closeness = 1.0 - np.clip(self.distance_km / radius_km, 0.0, 1.0)
+        return DISTANCE * np.nan_to_num(closeness, nan=0.0)
+
+
+def benchmark(rows: int = 100_000, repeats: int = 5, seed: int = 0) -> Dict[str, float]:
+    """Микробенчмарк: время оценки rows синтетических кандидатов.
+
+    Строки строятся так же, как их отдает asyncpg (отображение по имени
+    столбца); считается кодирование в столбцы и оценка, без SQL.
+    """
+    rng = np.random.default_rng(seed)
+    breeds = ['хаски', 'лабрадор', 'мейн-кун', 'Британская', 'беспородная', None]
+    colors = ['черный', 'белый', 'рыжий', 'Серый', None]
+    candidates: List[dict] = [
+        {
+            'id': i,
+            'breed': breeds[rng.integers(len(breeds))],
+            'color': colors[rng.integers(len(colors))],
+            'feature_hit': bool(rng.random() < 0.1),
+            'distance_km': float(rng.random() * 10.0),
+        }
+        for i in range(rows)
+    ]
+
+    timings = {'encode': [], 'score': []}
+    for _ in range(repeats):
+        started = time.perf_counter()
+        batch = CandidateBatch.from_rows(candidates)
+        encoded = time.perf_counter()
+        batch.score('лабрадор', 'черный', has_features=False, radius_km=10.0)
+        timings['encode'].append(encoded - started)
+        timings['score'].append(time.perf_counter() - encoded)
+
+    encode, score = min(timings['encode']), min(timings['score'])
+    return {
+        'rows': rows,
+        'encode_ms': encode * 1000.0,
+        'score_ms': score * 1000.0,
+        'ns_per_candidate': (encode + score) / rows * 1e9,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    result = benchmark()
+    logger.info(
+        f"{result['rows']} кандидатов: кодирование {result['encode_ms']:.1f} мс, "
+        f"оценка {result['score_ms']:.1f} мс, {result['ns_per_candidate']:.0f} нс на кандидата"
+    )
@@ -0,0 +1,49 @@
+import base64
+import os
+import sys
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+# Сервис импортирует свои модули без пакета (import scoring, from db import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('fastapi')
+pytest.importorskip('asyncpg')
+
+from fastapi import HTTPException  # noqa: E402
+
+import app  # noqa: E402
+
+
+def _cursor(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30)
+    cursor = _cursor(f'0.85|{created_at.isoformat()}|42'.encode())
+    assert app.decode_cursor(cursor) == (Decimal('0.85'), created_at, 42)
+
+
+@pytest.mark.parametrize('cursor', [
+    'не курсор',
+    _cursor(b'\xff\xfe\xfd'),
+    _cursor(b'abc|2024-05-01T12:30:00|42'),
+    _cursor('0.85|вчера|42'.encode()),
+    _cursor(b'0.85|2024-05-01T12:30:00'),
+])
+def test_garbage_cursor_is_client_error(cursor):
+    with pytest.raises(HTTPException) as error:
+        app.decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_feature_tsquery_keeps_qualified_phrases_apart():
+    phrases = app.feature_phrases(['нет глаза', 'Нет глаза'])
+    assert ('нет', 'глаза') in phrases and len(phrases) == len(set(phrases))
+    assert app.is_qualified(('без', 'глаза'))
+    assert not app.is_qualified(('разные', 'глаза'))
+    assert app.feature_tsquery([('разные', 'глаза'), ('слепой',)]) == '(разные <-> глаза) | (слепой)'
+    assert app.feature_tsquery([]) == ''
@@ -0,0 +1,126 @@
+import itertools
+import os
+import sqlite3
+import sys
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pytest
+
+# Сервис импортирует свои модули без пакета (import scoring, from db import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scoring  # noqa: E402
+
+BREEDS = ['Хаски', 'хаски', 'лабрадор', '', None]
+COLORS = ['Черный', 'черный', 'белый', '', None]
+
+
+def _batch(rows):
+    return scoring.CandidateBatch.from_rows(rows)
+
+
+def _rows():
+    return [
+        {'id': i, 'breed': breed, 'color': color, 'feature_hit': hit}
+        for i, (breed, color, hit) in enumerate(itertools.product(BREEDS, COLORS, [False, True]))
+    ]
+
+
+def _sql_scores(rows, features: str, breed: str, color: str) -> np.ndarray:
+    """MATCH_SCORE_SQL, вычисленный в SQLite по тем же строкам"""
+    conn = sqlite3.connect(':memory:')
+    # lower() в SQLite понимает только ASCII, в PostgreSQL - Unicode
+    conn.create_function('lower', 1, lambda value: None if value is None else value.lower())
+    conn.execute('CREATE TABLE a (id INTEGER, breed TEXT, color TEXT)')
+    conn.execute('CREATE TABLE hits (id INTEGER)')
+    conn.executemany('INSERT INTO a VALUES (?, ?, ?)', [(row['id'], row['breed'], row['color']) for row in rows])
+    conn.executemany('INSERT INTO hits VALUES (?)', [(row['id'],) for row in rows if row['feature_hit']])
+    result = conn.execute(
+        f'SELECT {scoring.match_score_sql(breed)} FROM a LEFT JOIN hits ON hits.id = a.id ORDER BY a.id',
+        {'3': features, '4': breed or '', '5': color or ''},
+    ).fetchall()
+    return np.array([value for value, in result])
+
+
+def _round_numeric(values) -> np.ndarray:
+    """round(numeric, 2) из PostgreSQL: оценка там считается точно, без ошибок float"""
+    return np.array([
+        float(Decimal(str(round(float(value), 9))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+        for value in values
+    ])
+
+
+@pytest.mark.parametrize('breed', ['хаски', 'ХАСКИ', 'беспородная', None])
+@pytest.mark.parametrize('color', ['черный', 'рыжий', None])
+@pytest.mark.parametrize('features', ['', '(глаз <-> разн)'])
+def test_scorer_matches_sql_ranking(breed, color, features):
+    rows = _rows()
+    similarity, _ = _batch(rows).score(breed, color, has_features=bool(features))
+    floor = scoring.MIN_VISUAL_SIMILARITY if features else scoring.MIN_SIMILARITY
+    expected = _round_numeric(np.clip(_sql_scores(rows, features, breed, color), floor, 1.0))
+    np.testing.assert_array_equal(similarity, expected)
+
+
+def test_match_types():
+    rows = [
+        {'breed': 'Хаски', 'color': 'черный'},
+        {'breed': 'лабрадор', 'color': 'Черный'},
+        {'breed': 'лабрадор', 'color': 'белый'},
+        {'breed': None, 'color': None},
+    ]
+    _, match_type = _batch(rows).score('хаски', 'черный', has_features=False)
+    assert scoring.MATCH_TYPES[match_type].tolist() == ['breed_match', 'color_match', 'type_match', 'type_match']
+
+    _, match_type = _batch(rows).score('хаски', 'черный', has_features=True)
+    assert set(scoring.MATCH_TYPES[match_type]) == {'visual_similarity'}
+
+
+def test_breed_match_skips_color():
+    similarity, _ = _batch([{'breed': 'хаски', 'color': 'белый'}]).score('хаски', 'черный', has_features=False)
+    assert similarity[0] == round(scoring.BASE + scoring.BREED_MATCH, 2)
+
+
+def test_unknown_breed_weight():
+    assert scoring.breed_mismatch_weight('беспородная') == scoring.BREED_UNKNOWN
+    assert scoring.breed_mismatch_weight('Unknown mix') == scoring.BREED_UNKNOWN
+    assert scoring.breed_mismatch_weight('хаски') == scoring.BREED_MISMATCH
+
+
+def test_score_is_deterministic_and_order_independent():
+    rows = _rows()
+    first = _batch(rows).score('хаски', 'черный', has_features=False)
+    second = _batch(rows).score('хаски', 'черный', has_features=False)
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+
+    order = np.random.default_rng(0).permutation(len(rows))
+    shuffled = _batch([rows[i] for i in order]).score('хаски', 'черный', has_features=False)
+    for a, b in zip(first, shuffled):
+        np.testing.assert_array_equal(a[order], b)
+
+
+def test_proximity():
+    batch = scoring.CandidateBatch(['', '', '', ''], ['', '', '', ''], [False] * 4, [0.0, 5.0, 20.0, None])
+    np.testing.assert_allclose(batch.proximity(10.0), [scoring.DISTANCE, scoring.DISTANCE / 2, 0.0, 0.0])
+    np.testing.assert_array_equal(batch.proximity(None), np.zeros(4))
+
+    similarity, _ = batch.score(None, None, has_features=False, radius_km=10.0)
+    assert similarity.tolist() == [round(scoring.BASE + scoring.DISTANCE, 2), round(scoring.BASE + scoring.DISTANCE / 2, 2),
+                                   scoring.BASE, scoring.BASE]
+
+
+def test_round_score_is_half_up():
+    np.testing.assert_array_equal(scoring.round_score([0.4 + 0.125 + 0.05, 0.574, 0.995, 0.3]),
+                                  [0.58, 0.57, 1.0, 0.3])
+
+
+def test_empty_batch():
+    similarity, match_type = _batch([]).score('хаски', 'черный', has_features=False)
+    assert len(similarity) == len(match_type) == 0
+
+
+def test_benchmark_runs():
+    result = scoring.benchmark(rows=1000, repeats=1)
+    assert result['rows'] == 1000
+    assert result['ns_per_candidate'] > 0
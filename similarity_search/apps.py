@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class SimilaritySearchConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'similarity_search'
+
+    def ready(self):
+        import similarity_search.signals    # noqa: F401
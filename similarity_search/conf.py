@@ -0,0 +1,86 @@
+from django.conf import settings
+
+DEFAULTS = {
+    # Имя CLIP-модели, которую используют поиск и индекс
+    'MODEL_NAME': 'ViT-B/32',
+    # Как часто воркер перечитывает активную версию модели из БД, сек
+    # (переключение командой activate_embedding_model)
+    'ACTIVE_MODEL_POLL_SECONDS': 30,
+    # Загружать модель и строить индекс в фоне сразу при старте воркера
+    'WARMUP_ON_STARTUP': False,
+    # Размер пакета для forward-прохода при массовом кодировании фото
+    'ENCODE_BATCH_SIZE': 32,
+    # Число потоков чтения и предобработки фото (None - по числу ядер)
+    'ENCODE_WORKERS': None,
+    # Тип элементов векторов в хранилище: float16 (вдвое компактнее) или float32
+    'STORE_DTYPE': 'float16',
+    # Тип индекса: auto (по размеру каталога и калибровке), flat (точный),
+    # flat_fp16, ivf_flat, ivf_pq, opq_ivf_pq или hnsw
+    'INDEX_TYPE': 'auto',
+    # Приближенный индекс, который выбирает auto для больших каталогов
+    'ANN_INDEX_TYPE': 'hnsw',
+    # JSON с точками перехода NumPy / IndexFlat / ANN (команда calibrate_search_engine)
+    'CALIBRATION_FILE': None,
+    # Переопределение параметров индекса: nlist, pq_m, pq_bits, hnsw_m,
+    # ef_construction, nprobe / ef_search (отключают автоподбор), а также
+    # rerank_factor для сжатых индексов (0 - без точного переранжирования)
+    'INDEX_PARAMS': {},
+    # Целевой recall@10 относительно точного поиска при подборе nprobe / efSearch
+    'TARGET_RECALL': 0.95,
+    # Деление индекса на шарды: [] - один индекс, ['type'] - по типу животного,
+    # ['type', 'geo'] - еще и по ячейке сетки координат
+    'SHARD_BY': [],
+    # Размер геоячейки шарда, градусы широты/долготы (1 градус широты ~ 111 км)
+    'SHARD_GEO_CELL_DEGREES': 1.0,
+    # Потоков для параллельного опроса шардов
+    'SHARD_WORKERS': 4,
+    # Свертка сходства нескольких фото объявления: max (лучшее фото) или mean
+    'PHOTO_AGGREGATION': 'max',
+    # Сколько векторов текстовых запросов держать в LRU-кеше (0 - без кеша)
+    'TEXT_CACHE_SIZE': 10000,
+    # LRU-кеш векторов загруженных фото по хешу содержимого: размер и TTL, сек
+    'IMAGE_CACHE_SIZE': 2048,
+    'IMAGE_CACHE_TTL': 3600,
+    # Порог сходства поиска по фото и предел числа найденных объявлений
+    'RANGE_THRESHOLD': 0.75,
+    'RANGE_MAX_RESULTS': 200,
+    # Сколько секунд хранится список результатов для постраничной выдачи по курсору
+    'RESULTS_CURSOR_TTL': 300,
+    # Где искать похожие векторы: faiss (индекс в памяти воркера) или
+    # pgvector (общий HNSW-индекс в PostgreSQL, см. команду setup_pgvector)
+    'VECTOR_BACKEND': 'faiss',
+    # Параметры pgvector: размерность колонки, построение и поиск HNSW
+    'PGVECTOR_DIMENSION': 512,
+    'PGVECTOR_HNSW_M': 16,
+    'PGVECTOR_EF_CONSTRUCTION': 64,
+    'PGVECTOR_EF_SEARCH': 100,
+    # Режим итеративного обхода при фильтрах (pgvector >= 0.8); None - не задавать
+    'PGVECTOR_ITERATIVE_SCAN': 'relaxed_order',
+    # Кандидатов на объявление при свертке нескольких фото
+    'PGVECTOR_ROWS_PER_AD': 4,
+    # Каталог снимков индекса; None - каждый воркер строит индекс сам
+    'SNAPSHOT_DIR': None,
+    # Сколько последних версий снимка хранить на диске
+    'SNAPSHOT_KEEP': 3,
+    # Как часто воркер проверяет, не появилась ли новая версия снимка, сек
+    'SNAPSHOT_POLL_SECONDS': 30,
+    # Как часто воркер догоняет изменения объявлений, сделанные в других
+    # воркерах (по updated_at), сек; 0 - только при открытии снимка
+    'CATCH_UP_SECONDS': 10,
+    # Ночное сопоставление потерянных и найденных (команда match_lost_found):
+    # сколько лучших пар хранить на потерянное объявление и минимальное сходство фото
+    'MATCH_TOP_K': 20,
+    'MATCH_MIN_SIMILARITY': 0.7,
+    # Строк векторов в блоке матрицы сходства (блок - не больше CHUNK x CHUNK float32)
+    'MATCH_CHUNK_SIZE': 2048,
+    # Веса итоговой оценки пары: сходство фото, близость мест и дат
+    'MATCH_WEIGHTS': {'similarity': 0.7, 'distance': 0.2, 'date': 0.1},
+    # Масштабы затухания близости: километры и дни
+    'MATCH_DISTANCE_SCALE_KM': 10.0,
+    'MATCH_DATE_SCALE_DAYS': 14.0,
+}
+
+
+def get_setting(name):
+    """Возвращает параметр из settings.SIMILARITY_SEARCH или значение по умолчанию"""
+    return getattr(settings, 'SIMILARITY_SEARCH', {}).get(name, DEFAULTS[name])
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from similarity_search.conf import get_setting
+from similarity_search.models import EmbeddingModelVersion
+from similarity_search.services import versions
+
+
+class Command(BaseCommand):
+    help = 'Переключает поиск на построенную версию модели или откатывает на предыдущую'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', nargs='?', help='Версия, которую сделать активной')
+        parser.add_argument('--rollback', action='store_true', help='Вернуть последнюю выведенную версию')
+        parser.add_argument('--list', action='store_true', help='Показать версии и их состояние')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for version in EmbeddingModelVersion.objects.all():
+                self.stdout.write(
+                    f'{version.model_name:30} {version.state:9} векторов {version.vectors:8} '
+                    f'фото {version.photos_done:8} {version.error}'
+                )
+            return
+
+        try:
+            if options['rollback']:
+                model_name = versions.rollback()
+            elif options['model']:
+                model_name = options['model']
+                versions.activate(model_name)
+            else:
+                raise CommandError('Укажите версию модели, --rollback или --list')
+        except versions.VersionError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Активная версия: {model_name}. Воркеры переключатся в течение '
+            f'{get_setting("ACTIVE_MODEL_POLL_SECONDS")} с, прежняя модель отвечает до загрузки новой'
+        ))
@@ -0,0 +1,102 @@
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from similarity_search.services.vector_index import INDEX_TYPES, VectorIndex, recall_at_k
+
+
+def synthetic_vectors(count: int, centers: np.ndarray, rng) -> np.ndarray:
+    """Нормированные векторы, сгруппированные вокруг центров, как у CLIP"""
+    clusters, dimension = centers.shape
+    vectors = np.empty((count, dimension), dtype=np.float32)
+    step = 100_000
+    for start in range(0, count, step):
+        end = min(start + step, count)
+        assignment = rng.integers(0, clusters, size=end - start)
+        noise = rng.standard_normal((end - start, dimension), dtype=np.float32)
+        vectors[start:end] = centers[assignment] + 0.6 * noise
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def index_bytes(index: VectorIndex) -> int:
+    """Память индекса: структура FAISS плюс точные векторы для переранжирования"""
+    total = faiss.serialize_index(index.index).nbytes
+    if index.exact is not None:
+        total += index.exact.nbytes
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает типы векторного индекса: recall@k, задержка запроса, '
+        'память на вектор и экономию относительно float32'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--types', nargs='+', default=list(INDEX_TYPES), choices=INDEX_TYPES)
+        parser.add_argument('--dimension', type=int, default=512)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--target-recall', type=float, default=0.95)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--rerank-factor', type=int, default=None,
+                            help='Кандидатов на переранжирование для ivf_pq/opq_ivf_pq, в разах от k (0 - выключить)')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+
+        params = {}
+        if options['rerank_factor'] is not None:
+            params['rerank_factor'] = options['rerank_factor']
+        raw_bytes = 4 * options['dimension']
+
+        header = (
+            f"{'N':>9} {'index':>11} {'recall@' + str(k):>10} {'p50, ms':>9} {'p99, ms':>9} "
+            f"{'B/vector':>9} {'saved':>7} {'GB/1M':>7} {'build, s':>9}"
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        for size in options['sizes']:
+            centers = rng.standard_normal((max(10, size // 100), options['dimension']), dtype=np.float32)
+            vectors = synthetic_vectors(size, centers, rng)
+            queries = synthetic_vectors(options['queries'], centers, rng)
+            ids = np.arange(size, dtype=np.int64)
+
+            exact_ids = None
+            for index_type in options['types']:
+                started = time.perf_counter()
+                index = VectorIndex.build(
+                    ids, vectors, index_type, params=params, target_recall=options['target_recall']
+                )
+                build_seconds = time.perf_counter() - started
+
+                latencies = []
+                found = []
+                for query in queries:
+                    query_started = time.perf_counter()
+                    hits = index.search(query, k)
+                    latencies.append((time.perf_counter() - query_started) * 1000)
+                    found.append([ad_id for ad_id, _ in hits] + [-1] * (k - len(hits)))
+                found = np.array(found, dtype=np.int64)
+
+                if exact_ids is None:
+                    exact = faiss.IndexFlatIP(options['dimension'])
+                    exact.add(vectors)
+                    _, exact_ids = exact.search(queries, k)
+                recall = recall_at_k(found, exact_ids)
+                bytes_per_vector = index_bytes(index) / size
+                saved = 1.0 - bytes_per_vector / raw_bytes
+
+                self.stdout.write(
+                    f"{size:>9} {index.index_type:>11} {recall:>10.3f} "
+                    f"{np.percentile(latencies, 50):>9.3f} {np.percentile(latencies, 99):>9.3f} "
+                    f"{bytes_per_vector:>9.1f} {saved:>7.0%} {bytes_per_vector * 1e6 / 2 ** 30:>7.2f} "
+                    f"{build_seconds:>9.1f}"
+                )
+                del index
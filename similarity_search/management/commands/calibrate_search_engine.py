@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from similarity_search.conf import get_setting
+from similarity_search.management.commands.benchmark_vector_index import synthetic_vectors
+from similarity_search.services.strategy import Calibration
+from similarity_search.services.vector_index import FLAT, INDEX_TYPES, VectorIndex
+
+
+def median_latency(index: VectorIndex, queries: np.ndarray, k: int) -> float:
+    """Медиана задержки одного запроса через VectorIndex.search, мс"""
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return float(np.median(latencies))
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет задержку поиска NumPy, IndexFlat и приближенного индекса на этой '
+        'машине и сохраняет размеры каталога, где один движок обгоняет другой'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[100, 1_000, 10_000, 30_000, 100_000, 300_000, 1_000_000])
+        parser.add_argument('--dimension', type=int, default=512)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--ann-type', default=None, choices=[t for t in INDEX_TYPES if t != FLAT],
+                            help='Приближенный индекс (по умолчанию ANN_INDEX_TYPE)')
+        parser.add_argument('--output', default=None, help='Файл калибровки (по умолчанию CALIBRATION_FILE)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        output = options['output'] or get_setting('CALIBRATION_FILE')
+        if not output:
+            raise CommandError('Не задан файл калибровки: --output или SIMILARITY_SEARCH["CALIBRATION_FILE"]')
+        ann_type = options['ann_type'] or get_setting('ANN_INDEX_TYPE')
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+
+        header = f"{'N':>9} {'numpy, ms':>10} {'flat, ms':>10} {ann_type + ', ms':>12}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        measurements = []
+        for size in sorted(options['sizes']):
+            centers = rng.standard_normal((max(10, size // 100), options['dimension']), dtype=np.float32)
+            vectors = synthetic_vectors(size, centers, rng)
+            queries = synthetic_vectors(options['queries'], centers, rng)
+            ids = np.arange(size, dtype=np.int64)
+
+            # Один и тот же плоский индекс: через умножение NumPy и через FAISS
+            flat = VectorIndex.build(ids, vectors, FLAT)
+            flat.exact_max_rows = size
+            exact_ms = median_latency(flat, queries, k)
+            flat.exact_max_rows = 0
+            flat_ms = median_latency(flat, queries, k)
+            del flat
+
+            ann = VectorIndex.build(ids, vectors, ann_type, target_recall=get_setting('TARGET_RECALL'))
+            ann_ms = median_latency(ann, queries, k)
+            del ann
+
+            measurements.append({'rows': size, 'exact': exact_ms, 'flat': flat_ms, 'ann': ann_ms})
+            self.stdout.write(f"{size:>9} {exact_ms:>10.3f} {flat_ms:>10.3f} {ann_ms:>12.3f}")
+
+        calibration = Calibration.from_measurements(measurements, options['dimension'])
+        calibration.save(output)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ NumPy до {calibration.exact_max_rows} векторов, IndexFlat до '
+            f'{calibration.flat_max_rows}, дальше {ann_type}. Сохранено в {output}'
+        ))
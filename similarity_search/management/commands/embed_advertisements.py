@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from similarity_search.services.clip_service import CLIPService
+from similarity_search.services.versions import active_model_name
+
+
+class Command(BaseCommand):
+    help = 'Кодирует фотографии объявлений через CLIP и сохраняет векторы в хранилище'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help='CLIP-модель (по умолчанию активная версия)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Размер пакета forward-прохода')
+        parser.add_argument('--workers', type=int, default=None, help='Число потоков декодирования фото')
+        parser.add_argument('--force', action='store_true', help='Перекодировать все фото, игнорируя сохраненные векторы')
+
+    def handle(self, *args, **options):
+        model_name = options['model'] or active_model_name()
+        self.stdout.write(f'Загрузка модели {model_name}...')
+        service = CLIPService(model_name)
+
+        started = time.perf_counter()
+
+        def progress(done, total):
+            elapsed = time.perf_counter() - started
+            rate = done / elapsed if elapsed else 0.0
+            self.stdout.write(f'  {done}/{total if total is not None else "?"} фото, {rate:.1f} фото/с')
+
+        service.build_index(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            force=options['force'],
+            progress=progress,
+        )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Проиндексировано {service.index.ntotal} фото за {elapsed:.1f} с')
+        )
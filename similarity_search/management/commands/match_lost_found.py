@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from similarity_search.services.matching import LostFoundMatcher
+
+
+class Command(BaseCommand):
+    help = (
+        'Сопоставляет все потерянные объявления с найденными и пересчитывает таблицу совпадений. '
+        'Запускается планировщиком раз в сутки, например cron: '
+        '0 3 * * * python manage.py match_lost_found'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help='CLIP-модель (по умолчанию из настроек)')
+        parser.add_argument('--top-k', type=int, default=None,
+                            help='Лучших найденных на потерянное объявление (по умолчанию MATCH_TOP_K)')
+        parser.add_argument('--min-similarity', type=float, default=None,
+                            help='Минимальное сходство фото (по умолчанию MATCH_MIN_SIMILARITY)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Строк векторов в блоке матрицы сходства (по умолчанию MATCH_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        matcher = LostFoundMatcher(
+            model_name=options['model'],
+            top_k=options['top_k'],
+            min_similarity=options['min_similarity'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(f'Сопоставление потерянных и найденных (модель {matcher.model_name})...')
+        stats = matcher.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {stats['lost']} потерянных x {stats['found']} найденных: "
+            f"{stats['pairs']} пар за {stats['seconds']:.1f} с"
+        ))
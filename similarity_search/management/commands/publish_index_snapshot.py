@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from similarity_search.conf import get_setting
+from similarity_search.services.clip_service import CLIPService
+from similarity_search.services.versions import active_model_name
+
+
+class Command(BaseCommand):
+    help = 'Строит индекс из хранилища векторов и публикует его новой версией снимка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help='CLIP-модель (по умолчанию активная версия)')
+        parser.add_argument('--force', action='store_true', help='Перекодировать все фото, игнорируя сохраненные векторы')
+        parser.add_argument('--shard', default=None,
+                            help='Перестроить только один шард (например cat или cat/55_37), '
+                                 'остальные взять из актуального снимка')
+
+    def handle(self, *args, **options):
+        if not get_setting('SNAPSHOT_DIR'):
+            raise CommandError("Не задан каталог снимков: SIMILARITY_SEARCH['SNAPSHOT_DIR'] или CLIP_SNAPSHOT_DIR")
+
+        model_name = options['model'] or active_model_name()
+        self.stdout.write(f'Загрузка модели {model_name}...')
+        service = CLIPService(model_name)
+
+        started = time.perf_counter()
+        if options['shard'] is not None and service.load_snapshot():
+            vectors = service.rebuild_shard(options['shard'], force=options['force'])
+            self.stdout.write(f"Шард {options['shard']}: {vectors} векторов")
+        else:
+            service.build_index(force=options['force'])
+        version = service.save_snapshot()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Снимок {version}: {service.index.ntotal} векторов за {elapsed:.1f} с. '
+            f'Воркеры переключатся на него в течение {get_setting("SNAPSHOT_POLL_SECONDS")} с'
+        ))
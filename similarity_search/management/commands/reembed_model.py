@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from similarity_search.conf import get_setting
+from similarity_search.services import versions
+from similarity_search.services.clip_service import CLIPService
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит векторы и индекс новой версии модели, пока поиск обслуживает текущая. '
+        'Прерванный запуск продолжается с места остановки: готовые векторы уже в хранилище'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Новая версия: имя CLIP-модели, при смене предобработки - с ревизией, например ViT-L/14@2')
+        parser.add_argument('--batch-size', type=int, default=None, help='Размер пакета forward-прохода')
+        parser.add_argument('--workers', type=int, default=None, help='Число потоков декодирования фото')
+        parser.add_argument('--activate', action='store_true', help='Сразу переключить поиск на новую версию')
+
+    def handle(self, *args, **options):
+        model_name = options['model']
+        versions.start_build(model_name)
+        started = time.perf_counter()
+        try:
+            self.stdout.write(f'Загрузка модели {model_name}...')
+            service = CLIPService(model_name)
+
+            def progress(done, total):
+                versions.record_progress(model_name, done)
+                elapsed = time.perf_counter() - started
+                rate = done / elapsed if elapsed else 0.0
+                self.stdout.write(f'  {done} фото, {rate:.1f} фото/с')
+
+            service.build_index(batch_size=options['batch_size'], workers=options['workers'], progress=progress)
+            if get_setting('SNAPSHOT_DIR'):
+                # Воркеры откроют новую версию из снимка, а не будут строить индекс сами
+                service.save_snapshot()
+        except Exception as e:
+            versions.fail_build(model_name, str(e))
+            raise CommandError(f'Не удалось построить версию {model_name}: {e}')
+
+        versions.finish_build(model_name, service.index.ntotal)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Версия {model_name}: {service.index.ntotal} векторов за {elapsed:.1f} с'
+        ))
+
+        if options['activate']:
+            previous = versions.activate(model_name)
+            self.stdout.write(self.style.SUCCESS(
+                f'Поиск переключен на {model_name} (прежняя {previous}); '
+                f'воркеры перейдут в течение {get_setting("ACTIVE_MODEL_POLL_SECONDS")} с'
+            ))
+        else:
+            self.stdout.write(f'Переключение: python manage.py activate_embedding_model {model_name}')
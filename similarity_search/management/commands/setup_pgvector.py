@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from similarity_search.services.embedding_store import EmbeddingStore
+from similarity_search.services.pgvector_backend import PgVectorBackend
+from similarity_search.services.versions import active_model_name
+
+
+class Command(BaseCommand):
+    help = 'Создает таблицу pgvector с HNSW-индексом и переносит в нее сохраненные векторы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=None, help='CLIP-модель (по умолчанию активная версия)')
+        parser.add_argument('--dimension', type=int, default=None,
+                            help='Размерность векторов (по умолчанию PGVECTOR_DIMENSION)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Строк в одной пачке вставки')
+
+    def handle(self, *args, **options):
+        model_name = options['model'] or active_model_name()
+        backend = PgVectorBackend(model_name, dimension=options['dimension'])
+
+        self.stdout.write(f'Создание схемы pgvector (размерность {backend.dimension})...')
+        backend.ensure_schema()
+
+        started = time.perf_counter()
+        stored = EmbeddingStore(model_name).load()
+        total = backend.backfill(
+            ((ad_id, photo_key, vector) for (ad_id, photo_key), (_, vector) in stored.items()),
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Перенесено {total} векторов модели {model_name} за {elapsed:.1f} с. '
+            f"Включите поиск через SIMILARITY_SEARCH['VECTOR_BACKEND'] = 'pgvector'"
+        ))
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('advertisements', '0008_alter_advertisement_photo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=50, verbose_name='Модель')),
+                ('content_hash', models.CharField(help_text='SHA-256 содержимого файла, по которому был посчитан вектор', max_length=64, verbose_name='Хеш фото')),
+                ('vector', models.BinaryField(verbose_name='Вектор')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('advertisement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embeddings', to='advertisements.advertisement', verbose_name='Объявление')),
+            ],
+            options={
+                'verbose_name': 'Эмбеддинг фото',
+                'verbose_name_plural': 'Эмбеддинги фото',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='photoembedding',
+            constraint=models.UniqueConstraint(fields=('advertisement', 'model_name'), name='unique_embedding_per_model'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('similarity_search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photoembedding',
+            name='dtype',
+            field=models.CharField(default='float32', help_text='float32 или float16; при чтении вектор приводится к float32', max_length=10, verbose_name='Тип элементов'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('similarity_search', '0002_photoembedding_dtype'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='photoembedding',
+            name='unique_embedding_per_model',
+        ),
+        migrations.AddField(
+            model_name='photoembedding',
+            name='photo_key',
+            field=models.CharField(default='main', help_text='main для основного фото или id дополнительного фото объявления', max_length=32, verbose_name='Фото'),
+        ),
+        migrations.AddConstraint(
+            model_name='photoembedding',
+            constraint=models.UniqueConstraint(fields=('advertisement', 'photo_key', 'model_name'), name='unique_photo_embedding_per_model'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertisements', '0009_advertisementphoto'),
+        ('similarity_search', '0003_photoembedding_photo_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvertisementMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=50, verbose_name='Модель')),
+                ('similarity', models.FloatField(verbose_name='Сходство фото')),
+                ('distance_km', models.FloatField(blank=True, help_text='Пусто, если у одного из объявлений нет координат', null=True, verbose_name='Расстояние, км')),
+                ('days_apart', models.FloatField(help_text='Дата найденного минус дата потерянного', verbose_name='Разница дат, дней')),
+                ('score', models.FloatField(verbose_name='Оценка')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место среди пар потерянного')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата расчета')),
+                ('found', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lost_matches', to='advertisements.advertisement', verbose_name='Найденное')),
+                ('lost', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='found_matches', to='advertisements.advertisement', verbose_name='Потерянное')),
+            ],
+            options={
+                'verbose_name': 'Совпадение объявлений',
+                'verbose_name_plural': 'Совпадения объявлений',
+                'ordering': ['-score'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='advertisementmatch',
+            index=models.Index(fields=['lost', '-score'], name='match_lost_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='advertisementmatch',
+            index=models.Index(fields=['found', '-score'], name='match_found_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='advertisementmatch',
+            constraint=models.UniqueConstraint(fields=('lost', 'found', 'model_name'), name='unique_advertisement_match_per_model'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('similarity_search', '0004_advertisementmatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingModelVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(help_text='Имя CLIP-модели, с необязательной ревизией предобработки через @, например ViT-L/14@2', max_length=50, unique=True, verbose_name='Модель')),
+                ('state', models.CharField(choices=[('building', 'Строится'), ('ready', 'Готова'), ('active', 'Активна'), ('retired', 'Выведена'), ('failed', 'Ошибка')], default='building', max_length=10, verbose_name='Состояние')),
+                ('photos_done', models.PositiveIntegerField(default=0, verbose_name='Обработано фото')),
+                ('vectors', models.PositiveIntegerField(default=0, verbose_name='Векторов в индексе')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало построения')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Конец построения')),
+                ('activated_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата активации')),
+            ],
+            options={
+                'verbose_name': 'Версия модели эмбеддингов',
+                'verbose_name_plural': 'Версии модели эмбеддингов',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='embeddingmodelversion',
+            constraint=models.UniqueConstraint(condition=models.Q(('state', 'active')), fields=('state',), name='single_active_embedding_model'),
+        ),
+    ]
@@ -0,0 +1,139 @@
+from django.db import models
+
+from advertisements.models import Advertisement
+
+
+class PhotoEmbedding(models.Model):
+    """Сохраненный CLIP-вектор фотографии объявления"""
+
+    advertisement = models.ForeignKey(
+        Advertisement,
+        on_delete=models.CASCADE,
+        related_name='embeddings',
+        verbose_name='Объявление'
+    )
+    photo_key = models.CharField(
+        max_length=32,
+        default='main',
+        verbose_name='Фото',
+        help_text='main для основного фото или id дополнительного фото объявления'
+    )
+    model_name = models.CharField(max_length=50, verbose_name='Модель')
+    content_hash = models.CharField(
+        max_length=64,
+        verbose_name='Хеш фото',
+        help_text='SHA-256 содержимого файла, по которому был посчитан вектор'
+    )
+    vector = models.BinaryField(verbose_name='Вектор')
+    dtype = models.CharField(
+        max_length=10,
+        default='float32',
+        verbose_name='Тип элементов',
+        help_text='float32 или float16; при чтении вектор приводится к float32'
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    def __str__(self):
+        return f'{self.advertisement_id}/{self.photo_key} ({self.model_name})'
+
+    class Meta:
+        verbose_name = 'Эмбеддинг фото'
+        verbose_name_plural = 'Эмбеддинги фото'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['advertisement', 'photo_key', 'model_name'],
+                name='unique_photo_embedding_per_model'
+            ),
+        ]
+
+
+class AdvertisementMatch(models.Model):
+    """Кандидат в пару потерянное - найденное из ночного сопоставления"""
+
+    lost = models.ForeignKey(
+        Advertisement,
+        on_delete=models.CASCADE,
+        related_name='found_matches',
+        verbose_name='Потерянное'
+    )
+    found = models.ForeignKey(
+        Advertisement,
+        on_delete=models.CASCADE,
+        related_name='lost_matches',
+        verbose_name='Найденное'
+    )
+    model_name = models.CharField(max_length=50, verbose_name='Модель')
+    similarity = models.FloatField(verbose_name='Сходство фото')
+    distance_km = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name='Расстояние, км',
+        help_text='Пусто, если у одного из объявлений нет координат'
+    )
+    days_apart = models.FloatField(
+        verbose_name='Разница дат, дней',
+        help_text='Дата найденного минус дата потерянного'
+    )
+    score = models.FloatField(verbose_name='Оценка')
+    rank = models.PositiveSmallIntegerField(verbose_name='Место среди пар потерянного')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата расчета')
+
+    def __str__(self):
+        return f'{self.lost_id} -> {self.found_id} ({self.score:.3f})'
+
+    class Meta:
+        verbose_name = 'Совпадение объявлений'
+        verbose_name_plural = 'Совпадения объявлений'
+        ordering = ['-score']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['lost', 'found', 'model_name'],
+                name='unique_advertisement_match_per_model'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['lost', '-score'], name='match_lost_score_idx'),
+            models.Index(fields=['found', '-score'], name='match_found_score_idx'),
+        ]
+
+
+class EmbeddingModelVersion(models.Model):
+    """Версия модели эмбеддингов: фоновая переиндексация и активная версия поиска"""
+
+    class State(models.TextChoices):
+        BUILDING = 'building', 'Строится'
+        READY = 'ready', 'Готова'
+        ACTIVE = 'active', 'Активна'
+        RETIRED = 'retired', 'Выведена'
+        FAILED = 'failed', 'Ошибка'
+
+    model_name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name='Модель',
+        help_text='Имя CLIP-модели, с необязательной ревизией предобработки через @, например ViT-L/14@2'
+    )
+    state = models.CharField(max_length=10, choices=State.choices, default=State.BUILDING, verbose_name='Состояние')
+    photos_done = models.PositiveIntegerField(default=0, verbose_name='Обработано фото')
+    vectors = models.PositiveIntegerField(default=0, verbose_name='Векторов в индексе')
+    error = models.TextField(blank=True, default='', verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начало построения')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Конец построения')
+    activated_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата активации')
+
+    def __str__(self):
+        return f'{self.model_name} ({self.state})'
+
+    class Meta:
+        verbose_name = 'Версия модели эмбеддингов'
+        verbose_name_plural = 'Версии модели эмбеддингов'
+        ordering = ['-created_at']
+        constraints = [
+            # Поиск в каждый момент обслуживает ровно одна версия
+            models.UniqueConstraint(
+                fields=['state'],
+                condition=models.Q(state='active'),
+                name='single_active_embedding_model'
+            ),
+        ]
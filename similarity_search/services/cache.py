@@ -0,0 +1,86 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Ключ кеша для текстового запроса: регистр, пробелы и формы символов"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кеш векторов с ограничением по числу записей.
+
+    ttl - время жизни записи в секундах (None - без срока). Значения
+    отдаются только для чтения, чтобы вызывающий код не мог испортить
+    закешированный вектор.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # ключ -> (вектор, момент истечения или None)
+        self._items: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] is not None and item[1] <= time.monotonic():
+                del self._items[key]
+                self.expired += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: np.ndarray):
+        if self.max_size <= 0:
+            return
+        value.setflags(write=False)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Значение из кеша или посчитанное compute() и сохраненное"""
+        value = self.get(key)
+        if value is None:
+            # Считаем вне блокировки: кодирование занимает десятки миллисекунд
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, float]:
+        # Размер и счетчики - одним снимком, согласованным между собой
+        with self._lock:
+            size, hits, misses, expired = len(self._items), self.hits, self.misses, self.expired
+        requests = hits + misses
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'hits': hits,
+            'misses': misses,
+            'expired': expired,
+            'ttl': self.ttl,
+            'hit_rate': hits / requests if requests else 0.0,
+        }
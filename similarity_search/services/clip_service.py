@@ -2,39 +2,111 @@ import torch
 import clip
 from PIL import Image
 import numpy as np
-import faiss
-from typing import List, Tuple, Union
+from typing import List, Optional, Sequence, Tuple, Union
 import os
 from advertisements.models import Advertisement
-from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+import hashlib
 import io
+from datetime import datetime, timedelta, timezone as dt_timezone
+import logging
+import threading
+import time
+
+from similarity_search.conf import get_setting
+
+from .cache import LRUCache, normalize_query
+from .embedding_store import EmbeddingStore
+from .locks import ReadWriteLock
+from .results import RESULT_FIELDS, resolve
+from .encoding import encode_advertisements
+from .snapshots import SnapshotError, SnapshotStore
+from .strategy import ANN, Calibration
+from .shards import ShardedIndex
+from .vector_index import FLAT, VectorIndex
+from .versions import backbone
+
+logger = logging.getLogger(__name__)
+
+# Вид запроса в search / range_search
+QUERY_TEXT = 'text'
+QUERY_IMAGE = 'image'
+
+# Запас при догонке по updated_at: правка, чья транзакция закоммитилась
+# позже начала прошлой проверки, все равно попадет в следующую
+CATCH_UP_OVERLAP = timedelta(seconds=30)
 
 class CLIPService:
-    def __init__(self):
+    def __init__(self, model_name: str = "ViT-B/32"):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model, self.preprocess = clip.load("ViT-B/32", device=self.device)
+        self.model_name = model_name
+        # Имя версии может содержать ревизию предобработки: ViT-L/14@2
+        self.model, self.preprocess = clip.load(backbone(model_name), device=self.device)
+        self.store = EmbeddingStore(model_name)
+        # Бэкенд pgvector: поиск идет в PostgreSQL, индекс в памяти не строится
+        self.pgvector = self.store.pgvector
         self.index = None
-        self.advertisements = []
+        # id объявления -> отпечаток его фото, по которому посчитаны векторы в индексе
+        self._hashes = {}
+        # Индекс меняется из сигналов, поиск идет из потоков запросов:
+        # поиски выполняются параллельно, изменения - монопольно
+        self._lock = ReadWriteLock()
+        # Частые текстовые запросы не прогоняются через текстовый энкодер повторно
+        self.text_cache = LRUCache(get_setting('TEXT_CACHE_SIZE'))
+        # Повторно загруженное фото (ретраи, пагинация, другие фильтры) не
+        # декодируется и не прогоняется через модель
+        self.image_cache = LRUCache(get_setting('IMAGE_CACHE_SIZE'), ttl=get_setting('IMAGE_CACHE_TTL'))
+        snapshot_dir = get_setting('SNAPSHOT_DIR')
+        self.snapshots = SnapshotStore(snapshot_dir, model_name) if snapshot_dir else None
+        # Версия снимка, из которого открыт индекс, и время последней проверки
+        self.snapshot_version = None
+        # Время публикации этого снимка (unix time), от него догоняются изменения
+        self.snapshot_created_at = None
+        self._snapshot_checked_at = 0.0
+        # Момент, до которого изменения объявлений уже в индексе: от него
+        # catch_up догоняет правки, сделанные в других воркерах
+        self.synced_at: Optional[datetime] = None
+        self._catch_up_checked_at = 0.0
+        self._catch_up_running = threading.Lock()
+        # Точки перехода NumPy / IndexFlat / ANN, измеренные на этой машине
+        self.calibration = Calibration.load(get_setting('CALIBRATION_FILE'))
         
     def encode_image(self, image_input: Union[str, bytes, Image.Image]) -> np.ndarray:
-        """Кодирует изображение в вектор с помощью CLIP"""
+        """Кодирует изображение в вектор с помощью CLIP.
+
+        Векторы кешируются по хешу содержимого: для пути и байтов повторный
+        запрос не требует ни декодирования, ни инференса.
+        """
         if isinstance(image_input, str):
             # Если передан путь к файлу
-            image = Image.open(image_input)
-        elif isinstance(image_input, bytes):
+            with open(image_input, 'rb') as image_file:
+                image_input = image_file.read()
+
+        if isinstance(image_input, bytes):
             # Если передан байтовый объект
-            image = Image.open(io.BytesIO(image_input))
+            key = hashlib.sha256(image_input).hexdigest()
         elif isinstance(image_input, Image.Image):
-            # Если передан объект PIL.Image
-            image = image_input
+            # Если передан объект PIL.Image - хешируем пиксели
+            digest = hashlib.sha256(f'{image_input.mode}{image_input.size}'.encode())
+            digest.update(image_input.tobytes())
+            key = digest.hexdigest()
         else:
             raise ValueError("Неподдерживаемый тип входных данных для изображения")
-            
-        image = self.preprocess(image).unsqueeze(0).to(self.device)
+
+        def compute():
+            image = image_input if isinstance(image_input, Image.Image) else Image.open(io.BytesIO(image_input))
+            return self.encode_image_batch([self.preprocess(image)])
+
+        return self.image_cache.get_or_compute(key, compute)
+
+    def encode_image_batch(self, tensors: List[torch.Tensor]) -> np.ndarray:
+        """Кодирует пакет предобработанных изображений одним проходом модели"""
+        images = torch.stack(tensors).to(self.device)
         with torch.no_grad():
-            image_features = self.model.encode_image(image)
+            image_features = self.model.encode_image(images)
             image_features /= image_features.norm(dim=-1, keepdim=True)
-        return image_features.cpu().numpy()
+        return image_features.float().cpu().numpy()
     
     def encode_text(self, text: str) -> np.ndarray:
         """Кодирует текст в вектор с помощью CLIP"""
@@ -42,41 +114,459 @@ class CLIPService:
         with torch.no_grad():
             text_features = self.model.encode_text(text_tokens)
             text_features /= text_features.norm(dim=-1, keepdim=True)
-        return text_features.cpu().numpy()
+        return text_features.float().cpu().numpy()
+
+    def embed_query_text(self, text: str) -> np.ndarray:
+        """Вектор текстового запроса через LRU-кеш по нормализованной строке"""
+        key = normalize_query(text)
+        return self.text_cache.get_or_compute(key, lambda: self.encode_text(key))
     
-    def build_index(self):
-        """Строит индекс FAISS для быстрого поиска"""
-        # Получаем все объявления с фотографиями
-        self.advertisements = Advertisement.objects.exclude(photo='')
+    def _new_index(self) -> VectorIndex:
+        """Пустой индекс, в котором строки адресуются id объявления"""
+        index = VectorIndex.empty(self.model.visual.output_dim)
+        index.exact_max_rows = self.calibration.exact_max_rows
+        return index
+
+    def _index_type(self, rows: int) -> str:
+        """Тип индекса из настроек; для auto - по размеру каталога и калибровке"""
+        index_type = get_setting('INDEX_TYPE')
+        if index_type != 'auto':
+            return index_type
+        engine = self.calibration.choose(rows)
+        index_type = get_setting('ANN_INDEX_TYPE') if engine == ANN else FLAT
+        logger.info(f"Каталог {rows} векторов: движок {engine}, индекс {index_type}")
+        return index_type
+
+    @staticmethod
+    def read_photo(photo, ad_id: Optional[int] = None) -> Optional[bytes]:
+        """Читает файл фото, None если фото нет или оно недоступно"""
+        if not photo:
+            return None
+        try:
+            with photo.open('rb') as photo_file:
+                return photo_file.read()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать фото объявления {ad_id}: {e}")
+            return None
+
+    @staticmethod
+    def fingerprint(photo_hashes: dict) -> str:
+        """Общий хеш набора фото объявления (ключ фото -> хеш содержимого)"""
+        joined = '\n'.join(f'{key}:{value}' for key, value in sorted(photo_hashes.items()))
+        return hashlib.sha256(joined.encode()).hexdigest()
+
+    @staticmethod
+    def ad_attributes(ad) -> dict:
+        """Атрибуты объявления, по которым фильтруется поиск"""
+        return {
+            'type': ad.type or '',
+            'status': ad.status or '',
+            'latitude': np.nan if ad.latitude is None else ad.latitude,
+            'longitude': np.nan if ad.longitude is None else ad.longitude,
+        }
+
+    def _encode_rows(self, queryset, batch_size: Optional[int] = None, workers: Optional[int] = None,
+                     force: bool = False, progress=None):
+        """Векторы фото объявлений из queryset: кодируются только новые или измененные.
+
+        Возвращает (id объявления по строкам, векторы, атрибуты строк,
+        отпечатки фото по id объявления).
+        """
+        stored = {} if force else self.store.load()
+        photo_hashes = {}
+        row_ids = []
+        attribute_rows = []
         features = []
-        
-        for ad in self.advertisements:
-            if ad.photo:
-                feature = self.encode_image(ad.photo.path)
-                features.append(feature)
-            
-        if features:
-            features = np.vstack(features)
-            self.index = faiss.IndexFlatIP(features.shape[1])
-            self.index.add(features)
+        fresh = []
+        fresh_total = 0
+
+        encoded = encode_advertisements(
+            self,
+            queryset,
+            stored=stored,
+            batch_size=batch_size or get_setting('ENCODE_BATCH_SIZE'),
+            workers=workers or get_setting('ENCODE_WORKERS'),
+            force=force,
+            progress=progress,
+        )
+        for ad, photo_key, content_hash, feature, is_fresh in encoded:
+            photo_hashes.setdefault(ad.id, {})[photo_key] = content_hash
+            row_ids.append(ad.id)
+            attribute_rows.append(self.ad_attributes(ad))
+            features.append(feature)
+            if is_fresh:
+                fresh.append((ad.id, photo_key, content_hash, feature))
+            # Сохраняем по мере кодирования, чтобы прерванная сборка не пропадала
+            if len(fresh) >= 500:
+                self.store.save_many(fresh)
+                fresh_total += len(fresh)
+                fresh = []
+
+        self.store.save_many(fresh)
+        fresh_total += len(fresh)
+        logger.info(
+            f"Индекс: {len(features)} фото {len(photo_hashes)} объявлений, "
+            f"из них заново закодировано {fresh_total}"
+        )
+        hashes = {ad_id: self.fingerprint(photos) for ad_id, photos in photo_hashes.items()}
+
+        ids = np.array(row_ids, dtype=np.int64)
+        vectors = np.vstack(features).astype(np.float32) if features else np.empty((0, self.model.visual.output_dim), dtype=np.float32)
+        attributes = {
+            'type': np.array([row['type'] for row in attribute_rows], dtype='U20'),
+            'status': np.array([row['status'] for row in attribute_rows], dtype='U10'),
+            'latitude': np.array([row['latitude'] for row in attribute_rows], dtype=np.float32),
+            'longitude': np.array([row['longitude'] for row in attribute_rows], dtype=np.float32),
+        }
+        return ids, vectors, attributes, hashes
+
+    @staticmethod
+    def _queryset():
+        """Объявления с фотографиями (основной или дополнительными)"""
+        return Advertisement.objects.filter(
+            Q(photo__gt='') | Q(photos__isnull=False)
+        ).distinct().only(
+            'id', 'photo', 'type', 'status', 'latitude', 'longitude'
+        ).prefetch_related('photos')
+
+    def _build_shard(self, ids: np.ndarray, vectors: np.ndarray, attributes: dict) -> VectorIndex:
+        """Индекс одного шарда; тип индекса подбирается по размеру шарда"""
+        index = VectorIndex.build(
+            ids,
+            vectors,
+            index_type=self._index_type(len(vectors)),
+            params=get_setting('INDEX_PARAMS'),
+            target_recall=get_setting('TARGET_RECALL'),
+            attributes=attributes,
+        )
+        index.exact_max_rows = self.calibration.exact_max_rows
+        return index
+
+    def _new_sharded_index(self) -> ShardedIndex:
+        return ShardedIndex(
+            self.model.visual.output_dim,
+            shard_by=get_setting('SHARD_BY'),
+            cell_degrees=get_setting('SHARD_GEO_CELL_DEGREES'),
+            factory=self._new_index,
+        )
+
+    def build_index(self, batch_size: Optional[int] = None, workers: Optional[int] = None,
+                    force: bool = False, progress=None):
+        """Строит индекс FAISS для быстрого поиска.
+
+        Векторы берутся из персистентного хранилища; через CLIP пакетами
+        прогоняются только фотографии, которых там нет или чей хеш
+        содержимого изменился (или все, если force=True). Строки
+        раскладываются по шардам (SHARD_BY), каждый шард строится отдельно.
+        """
+        started = datetime.now(dt_timezone.utc)
+        ids, vectors, attributes, hashes = self._encode_rows(
+            self._queryset(), batch_size=batch_size, workers=workers, force=force, progress=progress
+        )
+        index = ShardedIndex.build(
+            ids, vectors, attributes, self._build_shard,
+            dimension=self.model.visual.output_dim,
+            shard_by=get_setting('SHARD_BY'),
+            cell_degrees=get_setting('SHARD_GEO_CELL_DEGREES'),
+            factory=self._new_index,
+        )
+        logger.info(f"Шарды индекса: {index.describe()}")
+
+        with self._lock.write():
+            self.index = index
+            self._hashes = hashes
+            self.synced_at = started
+
+    def rebuild_shard(self, key: str, force: bool = False) -> int:
+        """Перестраивает один шард, не трогая остальные; возвращает число его векторов"""
+        with self._lock.write():
+            if self.index is None:
+                self.index = self._new_sharded_index()
+            sharded = self.index
+        queryset = self._queryset()
+        parts = sharded.key_parts(key)
+        if 'type' in parts:
+            queryset = queryset.filter(type=parts['type'])
+        ids, vectors, attributes, hashes = self._encode_rows(queryset, force=force)
+
+        keys = np.array([
+            sharded.shard_key({name: values[row] for name, values in attributes.items()})
+            for row in range(len(ids))
+        ], dtype=object)
+        rows = np.flatnonzero(keys == key)
+        shard = self._build_shard(ids[rows], vectors[rows], {name: values[rows] for name, values in attributes.items()})
+
+        with self._lock.write():
+            previous = sharded.shards.get(key)
+            if previous is not None:
+                for ad_id in np.unique(previous.row_ids[previous.row_ids >= 0]):
+                    self._hashes.pop(int(ad_id), None)
+            sharded.replace_shard(key, shard)
+            for ad_id in np.unique(ids[rows]):
+                self._hashes[int(ad_id)] = hashes[int(ad_id)]
+        logger.info(f"Шард {key or '(единственный)'} перестроен: {shard.ntotal} векторов")
+        return shard.ntotal
+
+    def save_snapshot(self) -> str:
+        """Публикует текущий индекс новой версией снимка"""
+        if self.snapshots is None:
+            raise SnapshotError("Каталог снимков не задан (SIMILARITY_SEARCH['SNAPSHOT_DIR'])")
+        with self._lock.write():
+            version = self.snapshots.save(self.index, self._hashes, keep=get_setting('SNAPSHOT_KEEP'))
+            self.snapshot_version = version
+        return version
+
+    def load_snapshot(self) -> bool:
+        """Открывает актуальный снимок вместо построения индекса.
+
+        Возвращает False, если снимков нет или снимок не подходит модели.
+        """
+        if self.snapshots is None:
+            return False
+        self._snapshot_checked_at = time.monotonic()
+        try:
+            version, meta, index, hashes = self.snapshots.load(
+                dimension=self.model.visual.output_dim,
+                shard_by=get_setting('SHARD_BY'),
+                cell_degrees=get_setting('SHARD_GEO_CELL_DEGREES'),
+            )
+        except (SnapshotError, OSError) as e:
+            logger.warning(f"Снимок индекса не загружен: {e}")
+            return False
+        index.factory = self._new_index
+        for shard in index.shards.values():
+            shard.exact_max_rows = self.calibration.exact_max_rows
+
+        with self._lock.write():
+            self.index = index
+            self._hashes = hashes
+            self.snapshot_version = version
+            self.snapshot_created_at = meta.get('created_at')
+            self.synced_at = None
+            if self.snapshot_created_at is not None:
+                self.synced_at = datetime.fromtimestamp(self.snapshot_created_at, tz=dt_timezone.utc)
+        logger.info(
+            f"Индекс открыт из снимка {version}: {index.ntotal} векторов в {len(index.shards)} шардах, "
+            f"mmap={'да' if index.read_only else 'нет'}"
+        )
+        return True
+
+    def refresh_snapshot(self):
+        """Переключается на новую версию снимка, если она появилась.
+
+        Проверка не чаще раза в SNAPSHOT_POLL_SECONDS; новая версия
+        открывается вне блокировки и подменяет индекс одним присваиванием.
+        """
+        if self.snapshots is None:
+            return
+        now = time.monotonic()
+        if now - self._snapshot_checked_at < get_setting('SNAPSHOT_POLL_SECONDS'):
+            return
+        self._snapshot_checked_at = now
+        current = self.snapshots.current_version()
+        if current is not None and current != self.snapshot_version:
+            self.load_snapshot()
+
+    def catch_up(self) -> int:
+        """Применяет к индексу изменения, сделанные после synced_at.
+
+        Так индекс из снимка догоняет правки после его публикации, а каждый
+        воркер - правки, которые сигналы применили только в другом воркере.
+        Объявления, обновленные позже synced_at (с запасом на еще не
+        закоммиченные транзакции), переиндексируются (векторы берутся из
+        хранилища), удаленные - убираются. Возвращает число обновленных
+        объявлений.
+        """
+        since = self.synced_at
+        if since is None:
+            return 0
+        started = datetime.now(dt_timezone.utc)
+        updated = 0
+        changed = self._queryset().filter(updated_at__gte=since - CATCH_UP_OVERLAP)
+        for ad in changed.iterator(chunk_size=200):
+            self.upsert_advertisement(ad)
+            updated += 1
+        with self._lock.read():
+            indexed = list(self._hashes)
+        existing = set(Advertisement.objects.filter(id__in=indexed).values_list('id', flat=True))
+        for ad_id in set(indexed) - existing:
+            self.remove_advertisement(ad_id)
+        with self._lock.write():
+            # Пока шла проверка, индекс мог смениться снимком со своим synced_at
+            if self.synced_at == since:
+                self.synced_at = started
+        if updated:
+            logger.info(f"Догнаны изменения с {since.isoformat()}: обновлено объявлений {updated}")
+        return updated
+
+    def poll_changes(self):
+        """Запускает catch_up в фоне не чаще раза в CATCH_UP_SECONDS.
+
+        Вызывается на пути поиска: запрос не ждет догонки, а следующий уже
+        видит изменения, сделанные в других воркерах.
+        """
+        interval = get_setting('CATCH_UP_SECONDS')
+        if not interval or self.synced_at is None:
+            return
+        now = time.monotonic()
+        if now - self._catch_up_checked_at < interval:
+            return
+        self._catch_up_checked_at = now
+        if not self._catch_up_running.acquire(blocking=False):
+            return
+        threading.Thread(target=self._catch_up_in_background, name='clip-catch-up', daemon=True).start()
+
+    def _catch_up_in_background(self):
+        try:
+            self.catch_up()
+        except Exception as e:
+            logger.error(f"Не удалось догнать изменения объявлений: {e}")
+        finally:
+            self._catch_up_running.release()
+            close_old_connections()
+
+    def upsert_advertisement(self, ad) -> bool:
+        """Добавляет, заменяет или убирает векторы фото одного объявления.
+
+        Кодируются только новые или измененные фото: если отпечаток набора
+        фото не изменился, обновляются только данные объявления. Возвращает
+        True, если векторы в индексе были заменены.
+        """
+        photos = {}
+        for photo_key, photo_file in ad.iter_photos():
+            content = self.read_photo(photo_file, ad.id)
+            if content is not None:
+                photos[photo_key] = content
+        if not photos:
+            self.remove_advertisement(ad.id)
+            self.store.delete_missing(ad.id, [])
+            return False
+
+        photo_hashes = {key: self.store.hash_content(content) for key, content in photos.items()}
+        fingerprint = self.fingerprint(photo_hashes)
+        # Фото те же, но могли поменяться статус, тип или координаты. Отпечаток
+        # сверяется под той же блокировкой, что и обновление индекса, чтобы
+        # параллельная замена векторов не проскочила между ними. Если
+        # set_attributes вернул False, объявление переезжает в другой шард:
+        # векторы возьмем из хранилища
+        with self._lock.write():
+            if self._hashes.get(ad.id) == fingerprint and self.index.set_attributes(ad.id, self.ad_attributes(ad)):
+                return False
+
+        # Векторы, уже посчитанные раньше или другим воркером, не пересчитываем
+        cached = self.store.get(ad.id)
+        features = {
+            key: cached[key][1]
+            for key, content_hash in photo_hashes.items()
+            if key in cached and cached[key][0] == content_hash
+        }
+        missing = [key for key in photos if key not in features]
+        if missing:
+            tensors = [self.preprocess(Image.open(io.BytesIO(photos[key]))) for key in missing]
+            encoded = self.encode_image_batch(tensors)
+            features.update(zip(missing, encoded))
+            self.store.save_many([(ad.id, key, photo_hashes[key], features[key]) for key in missing])
+        self.store.delete_missing(ad.id, list(photos))
+        if self.pgvector is not None:
+            # Хранилище уже записало векторы в таблицу pgvector
+            return True
+
+        keys = list(photos)
+        vectors = np.vstack([features[key] for key in keys]).astype(np.float32)
+        with self._lock.write():
+            if self.index is None:
+                self.index = self._new_sharded_index()
+            self.index.remove([ad.id])
+            attributes = {name: [value] * len(keys) for name, value in self.ad_attributes(ad).items()}
+            self.index.add([ad.id] * len(keys), vectors, attributes)
+            self._hashes[ad.id] = fingerprint
+        return True
+
+    def remove_advertisement(self, ad_id: int):
+        """Убирает объявление из индекса"""
+        with self._lock.write():
+            if self.index is not None and ad_id in self._hashes:
+                self.index.remove([ad_id])
+            self._hashes.pop(ad_id, None)
     
-    def search(self, query: Union[str, bytes, Image.Image], top_k: int = 5) -> List[Tuple[Advertisement, float]]:
-        """Поиск похожих животных по тексту или изображению"""
-        if isinstance(query, str):
-            if os.path.isfile(query):
-                query_vector = self.encode_image(query)
-            else:
-                query_vector = self.encode_text(query)
-        else:
-            query_vector = self.encode_image(query)
-            
-        distances, indices = self.index.search(query_vector, top_k)
-        
-        results = []
-        for idx, distance in zip(indices[0], distances[0]):
-            if idx != -1:  # FAISS возвращает -1 для пустых результатов
-                # Преобразуем numpy.int64 в обычный int
-                idx = int(idx)
-                results.append((self.advertisements[idx], float(distance)))
-                
-        return results 
\ No newline at end of file
+    def _query_vector(self, query: Union[str, bytes, Image.Image], kind: Optional[str] = None) -> np.ndarray:
+        """Вектор запроса.
+
+        kind=text - строка всегда текст, kind=image - изображение. Без kind
+        строка с путем к существующему файлу читается как изображение: это
+        только для внутренних вызовов, пользовательский текст передается с
+        kind=text, чтобы запрос не мог открыть файл на сервере.
+        """
+        if kind == QUERY_TEXT:
+            return self.embed_query_text(str(query))
+        if kind == QUERY_IMAGE or not isinstance(query, str):
+            return self.encode_image(query)
+        if os.path.isfile(query):
+            return self.encode_image(query)
+        return self.embed_query_text(query)
+
+    def search(self, query: Union[str, bytes, Image.Image], top_k: int = 5,
+               animal_type: Optional[str] = None, status: Optional[str] = None,
+               bbox: Optional[Tuple[float, float, float, float]] = None,
+               fields: Sequence[str] = RESULT_FIELDS,
+               aggregate: Optional[str] = None, kind: Optional[str] = None) -> List[Tuple[Advertisement, float]]:
+        """Поиск похожих животных по тексту или изображению.
+
+        animal_type, status и bbox (min_lat, min_lon, max_lat, max_lon)
+        ограничивают кандидатов внутри запроса к индексу, до ранжирования.
+        fields - колонки объявлений, которые загружаются для результатов.
+        aggregate - max или mean по фото объявления (по умолчанию из настроек).
+        kind - text или image, см. _query_vector.
+        """
+        query_vector = self._query_vector(query, kind)
+        aggregate = aggregate or get_setting('PHOTO_AGGREGATION')
+
+        if self.pgvector is not None:
+            hits = self.pgvector.search(
+                query_vector, top_k, animal_type, status, bbox, aggregate=aggregate
+            )
+            return resolve(hits, fields)
+
+        self.refresh_snapshot()
+        self.poll_changes()
+        with self._lock.read():
+            if self.index is None:
+                return []
+            # Запрос уходит только в шарды под фильтры, остальные опрашиваются параллельно
+            hits = self.index.search(
+                query_vector, top_k, animal_type=animal_type, status=status, bbox=bbox, aggregate=aggregate
+            )
+
+        return resolve(hits, fields)
+
+    def range_search(self, query: Union[str, bytes, Image.Image], threshold: Optional[float] = None,
+                     max_results: Optional[int] = None, animal_type: Optional[str] = None,
+                     status: Optional[str] = None,
+                     bbox: Optional[Tuple[float, float, float, float]] = None,
+                     aggregate: Optional[str] = None, kind: Optional[str] = None) -> List[Tuple[int, float]]:
+        """Все объявления со сходством не ниже threshold (не больше max_results).
+
+        Возвращает пары (id объявления, сходство) по убыванию сходства без
+        обращения к БД: список можно сохранить и отдавать страницами через
+        results.resolve(), не повторяя запрос к индексу.
+        """
+        query_vector = self._query_vector(query, kind)
+        threshold = get_setting('RANGE_THRESHOLD') if threshold is None else threshold
+        max_results = max_results or get_setting('RANGE_MAX_RESULTS')
+        aggregate = aggregate or get_setting('PHOTO_AGGREGATION')
+
+        if self.pgvector is not None:
+            return self.pgvector.search(
+                query_vector, max_results, animal_type, status, bbox,
+                threshold=threshold, aggregate=aggregate,
+            )
+
+        self.refresh_snapshot()
+        self.poll_changes()
+        with self._lock.read():
+            if self.index is None:
+                return []
+            return self.index.range_search(
+                query_vector, threshold, max_results,
+                animal_type=animal_type, status=status, bbox=bbox, aggregate=aggregate,
+            )
@@ -0,0 +1,48 @@
+import uuid
+from typing import List, Optional, Tuple
+
+from django.core.cache import cache
+
+from similarity_search.conf import get_setting
+
+CACHE_PREFIX = 'similarity_search:results:'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def save_results(hits: List[Tuple[int, float]]) -> str:
+    """Сохраняет упорядоченный список (id, сходство) и возвращает его токен.
+
+    Список лежит в кеше Django (CACHES в настройках): он общий для всех
+    воркеров, поэтому следующую страницу может отдать любой из них.
+    """
+    token = uuid.uuid4().hex
+    cache.set(CACHE_PREFIX + token, hits, get_setting('RESULTS_CURSOR_TTL'))
+    return token
+
+
+def make_cursor(token: str, offset: int) -> str:
+    return f'{token}.{offset}'
+
+
+def load_page(cursor: str, page_size: int) -> Tuple[List[Tuple[int, float]], Optional[str], int]:
+    """Страница результатов по курсору: (пары id-сходство, следующий курсор, всего)"""
+    try:
+        token, offset = cursor.split('.', 1)
+        offset = int(offset)
+    except ValueError:
+        raise InvalidCursor('Некорректный курсор')
+
+    hits = cache.get(CACHE_PREFIX + token)
+    if hits is None:
+        raise InvalidCursor('Курсор устарел, повторите поиск')
+    return page(hits, token, offset, page_size)
+
+
+def page(hits: List[Tuple[int, float]], token: str, offset: int,
+         page_size: int) -> Tuple[List[Tuple[int, float]], Optional[str], int]:
+    end = offset + page_size
+    next_cursor = make_cursor(token, end) if end < len(hits) else None
+    return hits[offset:end], next_cursor, len(hits)
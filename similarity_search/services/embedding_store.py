@@ -0,0 +1,99 @@
+import hashlib
+import logging
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from similarity_search.conf import get_setting
+from similarity_search.models import PhotoEmbedding
+
+from .pgvector_backend import PgVectorBackend
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingStore:
+    """Персистентное хранилище CLIP-векторов фотографий объявлений.
+
+    Векторы хранятся в таблице PhotoEmbedding по ключу (объявление, фото,
+    модель) вместе с хешем содержимого фото, поэтому при перестроении индекса
+    заново кодируются только новые или измененные фотографии.
+
+    Векторы пишутся в STORE_DTYPE (по умолчанию float16 - 1 КБ вместо 2 КБ
+    на фото для ViT-B/32), тип записан в каждой строке, а при чтении вектор
+    приводится к float32, так что старые float32-строки читаются как есть.
+    """
+
+    def __init__(self, model_name: str, dtype: Optional[str] = None):
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype or get_setting('STORE_DTYPE'))
+        # При бэкенде pgvector векторы дублируются в таблицу с HNSW-индексом
+        self.pgvector = PgVectorBackend(model_name) if get_setting('VECTOR_BACKEND') == 'pgvector' else None
+
+    @staticmethod
+    def decode(vector, dtype: str) -> np.ndarray:
+        """Вектор из байтов строки, приведенный к float32"""
+        return np.frombuffer(bytes(vector), dtype=dtype).astype(np.float32)
+
+    @staticmethod
+    def hash_content(content: bytes) -> str:
+        """Хеш содержимого файла фотографии"""
+        return hashlib.sha256(content).hexdigest()
+
+    def load(self) -> Dict[Tuple[int, str], Tuple[str, np.ndarray]]:
+        """Загружает все сохраненные векторы модели одним запросом.
+
+        Ключ - (id объявления, ключ фото), значение - (хеш фото, вектор).
+        """
+        rows = PhotoEmbedding.objects.filter(model_name=self.model_name).values_list(
+            'advertisement_id', 'photo_key', 'content_hash', 'vector', 'dtype'
+        )
+        return {
+            (ad_id, photo_key): (content_hash, self.decode(vector, dtype))
+            for ad_id, photo_key, content_hash, vector, dtype in rows.iterator()
+        }
+
+    def get(self, ad_id: int) -> Dict[str, Tuple[str, np.ndarray]]:
+        """Сохраненные векторы всех фото одного объявления по ключу фото"""
+        rows = PhotoEmbedding.objects.filter(
+            advertisement_id=ad_id, model_name=self.model_name
+        ).values_list('photo_key', 'content_hash', 'vector', 'dtype')
+        return {
+            photo_key: (content_hash, self.decode(vector, dtype))
+            for photo_key, content_hash, vector, dtype in rows
+        }
+
+    def delete_missing(self, ad_id: int, photo_keys: Sequence[str]):
+        """Удаляет векторы фото, которых у объявления больше нет"""
+        PhotoEmbedding.objects.filter(
+            advertisement_id=ad_id, model_name=self.model_name
+        ).exclude(photo_key__in=list(photo_keys)).delete()
+        if self.pgvector is not None:
+            self.pgvector.delete_missing(ad_id, photo_keys)
+
+    def save_many(self, items: Iterable[Tuple[int, str, str, np.ndarray]]):
+        """Сохраняет или обновляет векторы (id объявления, ключ фото, хеш фото, вектор)"""
+        items = list(items)
+        embeddings = [
+            PhotoEmbedding(
+                advertisement_id=ad_id,
+                photo_key=photo_key,
+                model_name=self.model_name,
+                content_hash=content_hash,
+                vector=np.ascontiguousarray(vector, dtype=self.dtype).tobytes(),
+                dtype=self.dtype.name,
+            )
+            for ad_id, photo_key, content_hash, vector in items
+        ]
+        if not embeddings:
+            return
+        PhotoEmbedding.objects.bulk_create(
+            embeddings,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['advertisement', 'photo_key', 'model_name'],
+            update_fields=['content_hash', 'vector', 'dtype', 'updated_at'],
+        )
+        if self.pgvector is not None:
+            self.pgvector.upsert((ad_id, photo_key, vector) for ad_id, photo_key, _, vector in items)
+        logger.info(f"Сохранено {len(embeddings)} векторов модели {self.model_name}")
@@ -0,0 +1,108 @@
+import io
+import logging
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Результат кодирования одной фотографии: fresh=True, если вектор посчитан заново
+EncodedPhoto = namedtuple('EncodedPhoto', ['advertisement', 'photo_key', 'content_hash', 'vector', 'fresh'])
+
+_Prepared = namedtuple('_Prepared', ['advertisement', 'photo_key', 'content_hash', 'vector', 'tensor'])
+
+
+def _chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _photos(advertisements: Iterable) -> Iterator[tuple]:
+    """Разворачивает объявления в фото: (объявление, ключ фото, файл)"""
+    for ad in advertisements:
+        for photo_key, photo_file in ad.iter_photos():
+            yield ad, photo_key, photo_file
+
+
+def _prepare(service, stored: Dict[Tuple[int, str], Tuple[str, np.ndarray]], force: bool,
+             ad, photo_key: str, photo_file) -> Optional[_Prepared]:
+    """Читает, хеширует и при необходимости предобрабатывает фото (в потоке пула)"""
+    content = service.read_photo(photo_file, ad.id)
+    if content is None:
+        return None
+
+    content_hash = service.store.hash_content(content)
+    cached = stored.get((ad.id, photo_key))
+    if not force and cached is not None and cached[0] == content_hash:
+        return _Prepared(ad, photo_key, content_hash, cached[1], None)
+
+    try:
+        image = Image.open(io.BytesIO(content))
+        tensor = service.preprocess(image)
+    except Exception as e:
+        logger.warning(f"Не удалось декодировать фото {photo_key} объявления {ad.id}: {e}")
+        return None
+    return _Prepared(ad, photo_key, content_hash, None, tensor)
+
+
+def encode_advertisements(
+    service,
+    advertisements: Iterable,
+    stored: Optional[Dict[Tuple[int, str], Tuple[str, np.ndarray]]] = None,
+    batch_size: int = 32,
+    workers: Optional[int] = None,
+    force: bool = False,
+    progress: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> Iterator[EncodedPhoto]:
+    """Пакетно кодирует все фотографии объявлений (основные и дополнительные).
+
+    Пул потоков читает и декодирует фото следующего пакета, пока основной
+    поток прогоняет текущий пакет через CLIP одним forward-проходом.
+    Фото с неизменившимся хешем берутся из stored без инференса.
+    """
+    stored = stored or {}
+    workers = workers or os.cpu_count() or 1
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='clip-decode') as pool:
+        pending = None
+        for chunk in _chunked(_photos(advertisements), batch_size):
+            futures = [pool.submit(_prepare, service, stored, force, *photo) for photo in chunk]
+            if pending is not None:
+                yield from _finish(service, pending)
+                done += len(pending)
+                if progress:
+                    progress(done, None)
+            pending = futures
+
+        if pending is not None:
+            yield from _finish(service, pending)
+            done += len(pending)
+            if progress:
+                progress(done, None)
+
+
+def _finish(service, futures) -> Iterator[EncodedPhoto]:
+    prepared = [future.result() for future in futures]
+    prepared = [item for item in prepared if item is not None]
+
+    to_encode = [item for item in prepared if item.vector is None]
+    vectors = {}
+    if to_encode:
+        batch = service.encode_image_batch([item.tensor for item in to_encode])
+        vectors = {id(item): vector for item, vector in zip(to_encode, batch)}
+
+    for item in prepared:
+        if item.vector is not None:
+            yield EncodedPhoto(item.advertisement, item.photo_key, item.content_hash, item.vector, False)
+        else:
+            yield EncodedPhoto(item.advertisement, item.photo_key, item.content_hash, vectors[id(item)], True)
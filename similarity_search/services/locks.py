@@ -0,0 +1,49 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """Блокировка с общим чтением и монопольной записью.
+
+    Поиски по индексу идут параллельно (FAISS и NumPy отпускают GIL), а
+    изменение индекса ждет, пока закончатся начатые поиски, и не пускает
+    новые. Ожидающая запись имеет приоритет, чтобы поток поисков не
+    откладывал обновления из сигналов бесконечно. Не реентерабельна.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
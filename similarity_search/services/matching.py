@@ -0,0 +1,236 @@
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+
+from advertisements.models import Advertisement, StatusChoices
+from similarity_search.conf import get_setting
+from similarity_search.models import AdvertisementMatch
+
+from .embedding_store import EmbeddingStore
+from .versions import active_model_name
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+# Близость мест, если у одного из объявлений нет координат
+UNKNOWN_DISTANCE_PROXIMITY = 0.5
+
+
+class _Side:
+    """Векторы фото одной стороны (потерянные или найденные) одного типа животного.
+
+    Строки матрицы сгруппированы по объявлению: фото объявления i занимают
+    строки starts[i]..starts[i + 1], поэтому свертка в сходство объявлений -
+    один reduceat по блоку.
+    """
+
+    def __init__(self, ad_ids: List[int], vectors: List[List[np.ndarray]], coordinates, days):
+        self.ad_ids = np.asarray(ad_ids, dtype=np.int64)
+        counts = np.array([len(rows) for rows in vectors], dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(counts)])
+        self.matrix = np.ascontiguousarray(np.vstack([row for rows in vectors for row in rows]), dtype=np.float32)
+        self.counts = counts
+        # Координаты без значения - NaN
+        self.latitude = np.array([lat if lat is not None else np.nan for lat, _ in coordinates], dtype=np.float64)
+        self.longitude = np.array([lon if lon is not None else np.nan for _, lon in coordinates], dtype=np.float64)
+        self.days = np.asarray(days, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ad_ids)
+
+    def chunks(self, max_rows: int):
+        """Диапазоны объявлений [begin, end), в каждом не больше max_rows строк
+        (но хотя бы одно объявление)"""
+        begin = 0
+        while begin < len(self):
+            end = begin + 1
+            while end < len(self) and self.starts[end + 1] - self.starts[begin] <= max_rows:
+                end += 1
+            yield begin, end
+            begin = end
+
+
+def haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Расстояние по большому кругу, км; аргументы транслируются как в NumPy"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class LostFoundMatcher:
+    """Сопоставление всех потерянных объявлений со всеми найденными.
+
+    Для каждого типа животного сходство фото считается блоками матриц
+    (не больше chunk_size x chunk_size строк за раз), сворачивается по
+    фото объявлений и смешивается с близостью мест и дат. Для каждого
+    потерянного объявления хранится top_k лучших найденных.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, top_k: Optional[int] = None,
+                 min_similarity: Optional[float] = None, chunk_size: Optional[int] = None,
+                 aggregate: Optional[str] = None):
+        self.model_name = model_name or active_model_name()
+        self.top_k = top_k or get_setting('MATCH_TOP_K')
+        self.min_similarity = get_setting('MATCH_MIN_SIMILARITY') if min_similarity is None else min_similarity
+        self.chunk_size = chunk_size or get_setting('MATCH_CHUNK_SIZE')
+        self.aggregate = aggregate or get_setting('PHOTO_AGGREGATION')
+        self.weights = get_setting('MATCH_WEIGHTS')
+        self.distance_scale = get_setting('MATCH_DISTANCE_SCALE_KM')
+        self.date_scale = get_setting('MATCH_DATE_SCALE_DAYS')
+
+    def load_sides(self) -> Dict[str, Tuple[_Side, _Side]]:
+        """Потерянные и найденные объявления с векторами, по типу животного"""
+        vectors: Dict[int, List[np.ndarray]] = {}
+        for (ad_id, _), (_, vector) in sorted(EmbeddingStore(self.model_name).load().items()):
+            vectors.setdefault(ad_id, []).append(vector)
+
+        groups: Dict[Tuple[str, str], dict] = {}
+        ads = Advertisement.objects.filter(id__in=list(vectors)).values_list(
+            'id', 'type', 'status', 'latitude', 'longitude', 'created_at'
+        ).order_by('id')
+        for ad_id, animal_type, ad_status, latitude, longitude, created_at in ads.iterator():
+            group = groups.setdefault((animal_type, ad_status), {'ids': [], 'vectors': [], 'coordinates': [], 'days': []})
+            group['ids'].append(ad_id)
+            group['vectors'].append(vectors[ad_id])
+            group['coordinates'].append((latitude, longitude))
+            group['days'].append(created_at.timestamp() / 86400.0)
+
+        sides = {}
+        for animal_type in {animal_type for animal_type, _ in groups}:
+            lost = groups.get((animal_type, StatusChoices.LOST.value))
+            found = groups.get((animal_type, StatusChoices.FOUND.value))
+            if lost and found:
+                sides[animal_type] = (
+                    _Side(lost['ids'], lost['vectors'], lost['coordinates'], lost['days']),
+                    _Side(found['ids'], found['vectors'], found['coordinates'], found['days']),
+                )
+        return sides
+
+    def _fold(self, block: np.ndarray, lost: _Side, found: _Side,
+              lost_range: Tuple[int, int], found_range: Tuple[int, int]) -> np.ndarray:
+        """Сходство фото (строки x строки) -> сходство объявлений (max или mean по фото)"""
+        lost_starts = lost.starts[lost_range[0]:lost_range[1]] - lost.starts[lost_range[0]]
+        found_starts = found.starts[found_range[0]:found_range[1]] - found.starts[found_range[0]]
+        if self.aggregate == 'mean':
+            folded = np.add.reduceat(np.add.reduceat(block, lost_starts, axis=0), found_starts, axis=1)
+            pairs = np.outer(lost.counts[slice(*lost_range)], found.counts[slice(*found_range)])
+            return folded / pairs
+        return np.maximum.reduceat(np.maximum.reduceat(block, lost_starts, axis=0), found_starts, axis=1)
+
+    def _context(self, lost: _Side, found: _Side, lost_index, found_index):
+        """Расстояние (км, NaN без координат) и разница дат (дней) для пар объявлений"""
+        distance = haversine_km(
+            lost.latitude[lost_index], lost.longitude[lost_index],
+            found.latitude[found_index], found.longitude[found_index],
+        )
+        days = found.days[found_index] - lost.days[lost_index]
+        return distance, days
+
+    def _score(self, similarity: np.ndarray, distance: np.ndarray, days: np.ndarray) -> np.ndarray:
+        """Итоговая оценка пары; пары ниже порога сходства получают -inf"""
+        distance_proximity = np.where(
+            np.isnan(distance), UNKNOWN_DISTANCE_PROXIMITY, np.exp(-np.nan_to_num(distance) / self.distance_scale)
+        )
+        date_proximity = np.exp(-np.abs(days) / self.date_scale)
+        score = (
+            self.weights.get('similarity', 0.0) * similarity
+            + self.weights.get('distance', 0.0) * distance_proximity
+            + self.weights.get('date', 0.0) * date_proximity
+        )
+        return np.where(similarity >= self.min_similarity, score, -np.inf)
+
+    def match_side(self, lost: _Side, found: _Side) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Лучшие найденные для каждого потерянного.
+
+        Возвращает (номер потерянного, номер найденного, сходство, оценка)
+        по парам с конечной оценкой, отсортированные по потерянному и
+        убыванию оценки.
+        """
+        k = min(self.top_k, len(found))
+        lost_rows, found_rows, similarities, scores = [], [], [], []
+        for lost_begin, lost_end in lost.chunks(self.chunk_size):
+            left = lost.matrix[lost.starts[lost_begin]:lost.starts[lost_end]]
+            lost_index = np.arange(lost_begin, lost_end)[:, None]
+            best_scores = np.full((lost_end - lost_begin, 0), -np.inf, dtype=np.float64)
+            best_found = np.empty((lost_end - lost_begin, 0), dtype=np.int64)
+            best_similarity = np.empty((lost_end - lost_begin, 0), dtype=np.float32)
+
+            for found_begin, found_end in found.chunks(self.chunk_size):
+                right = found.matrix[found.starts[found_begin]:found.starts[found_end]]
+                # Один вызов BLAS на блок; память - не больше chunk_size^2 float32
+                similarity = self._fold(left @ right.T, lost, found, (lost_begin, lost_end), (found_begin, found_end))
+                found_index = np.broadcast_to(np.arange(found_begin, found_end), similarity.shape)
+                distance, days = self._context(lost, found, lost_index, found_index)
+                block_scores = self._score(similarity, distance, days)
+
+                best_scores = np.concatenate([best_scores, block_scores], axis=1)
+                best_found = np.concatenate([best_found, found_index], axis=1)
+                best_similarity = np.concatenate([best_similarity, similarity], axis=1)
+                if best_scores.shape[1] > k:
+                    keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                    best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                    best_found = np.take_along_axis(best_found, keep, axis=1)
+                    best_similarity = np.take_along_axis(best_similarity, keep, axis=1)
+
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            valid = np.isfinite(best_scores)
+            rows = np.broadcast_to(lost_index, best_scores.shape)
+            lost_rows.append(rows[valid])
+            found_rows.append(np.take_along_axis(best_found, order, axis=1)[valid])
+            similarities.append(np.take_along_axis(best_similarity, order, axis=1)[valid])
+            scores.append(best_scores[valid])
+
+        if not scores:
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty.astype(np.int64), empty, empty
+        return (np.concatenate(lost_rows), np.concatenate(found_rows),
+                np.concatenate(similarities), np.concatenate(scores))
+
+    def run(self) -> Dict[str, float]:
+        """Пересчитывает таблицу совпадений модели целиком"""
+        started = time.perf_counter()
+        sides = self.load_sides()
+        matches = []
+        stats = {'lost': 0, 'found': 0, 'pairs': 0}
+        for animal_type, (lost, found) in sides.items():
+            lost_rows, found_rows, similarities, scores = self.match_side(lost, found)
+            distances, days = self._context(lost, found, lost_rows, found_rows)
+            # Место пары среди найденных для одного потерянного
+            ranks = np.arange(len(lost_rows)) - np.searchsorted(lost_rows, lost_rows)
+            for lost_row, found_row, similarity, score, distance, day, rank in zip(
+                lost_rows, found_rows, similarities, scores, distances, days, ranks
+            ):
+                matches.append(AdvertisementMatch(
+                    lost_id=int(lost.ad_ids[lost_row]),
+                    found_id=int(found.ad_ids[found_row]),
+                    model_name=self.model_name,
+                    similarity=float(similarity),
+                    distance_km=None if np.isnan(distance) else float(distance),
+                    days_apart=float(day),
+                    score=float(score),
+                    rank=int(rank) + 1,
+                ))
+            stats['lost'] += len(lost)
+            stats['found'] += len(found)
+            logger.info(
+                f"Тип {animal_type}: {len(lost)} потерянных x {len(found)} найденных, "
+                f"{len(lost_rows)} пар"
+            )
+
+        # Читатели видят либо прошлый расчет, либо новый целиком
+        with transaction.atomic():
+            AdvertisementMatch.objects.filter(model_name=self.model_name).delete()
+            AdvertisementMatch.objects.bulk_create(matches, batch_size=1000)
+        stats['pairs'] = len(matches)
+        stats['seconds'] = time.perf_counter() - started
+        logger.info(f"Сопоставление потерянных и найденных: {stats}")
+        return stats
+
+
+def run_matching(model_name: Optional[str] = None) -> Dict[str, float]:
+    """Точка входа для планировщика (cron, celery beat): полный пересчет совпадений"""
+    return LostFoundMatcher(model_name).run()
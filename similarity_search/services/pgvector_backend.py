@@ -0,0 +1,173 @@
+import logging
+import re
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import connection, transaction
+
+from similarity_search.conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'similarity_search_vector'
+AD_TABLE = 'advertisements_advertisement'
+
+
+def vector_literal(vector: np.ndarray) -> str:
+    """Текстовое представление вектора для приведения ::vector"""
+    return '[' + ','.join(repr(float(value)) for value in np.asarray(vector).reshape(-1)) + ']'
+
+
+class PgVectorBackend:
+    """Векторы фото в PostgreSQL (расширение pgvector) с индексом HNSW.
+
+    Сходство, фильтры по объявлению и LIMIT выполняются одним SQL-запросом
+    с JOIN к таблице объявлений, а индекс общий для всех воркеров Django и
+    FastAPI и не занимает память процессов. Векторы нормированы, поэтому
+    используется скалярное произведение (оператор <#>, vector_ip_ops).
+    """
+
+    def __init__(self, model_name: str, dimension: Optional[int] = None):
+        self.model_name = model_name
+        self.dimension = dimension or get_setting('PGVECTOR_DIMENSION')
+        # Версия расширения vector в БД (читается при первом поиске)
+        self._extension_version: Optional[Tuple[int, ...]] = None
+
+    def ensure_schema(self):
+        """Создает расширение, таблицу и HNSW-индекс, если их еще нет"""
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS vector')
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {TABLE} (
+                    advertisement_id bigint NOT NULL REFERENCES {AD_TABLE} (id) ON DELETE CASCADE,
+                    photo_key varchar(32) NOT NULL,
+                    model_name varchar(50) NOT NULL,
+                    embedding vector({int(self.dimension)}) NOT NULL,
+                    PRIMARY KEY (advertisement_id, photo_key, model_name)
+                )
+            ''')
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS {TABLE}_hnsw ON {TABLE}
+                USING hnsw (embedding vector_ip_ops)
+                WITH (m = {int(get_setting('PGVECTOR_HNSW_M'))},
+                      ef_construction = {int(get_setting('PGVECTOR_EF_CONSTRUCTION'))})
+            ''')
+
+    def upsert(self, items: Iterable[Tuple[int, str, np.ndarray]]):
+        """Сохраняет векторы (id объявления, ключ фото, вектор)"""
+        rows = [
+            (ad_id, photo_key, self.model_name, vector_literal(vector))
+            for ad_id, photo_key, vector in items
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'''
+                INSERT INTO {TABLE} (advertisement_id, photo_key, model_name, embedding)
+                VALUES (%s, %s, %s, %s::vector)
+                ON CONFLICT (advertisement_id, photo_key, model_name)
+                DO UPDATE SET embedding = EXCLUDED.embedding
+            ''', rows)
+
+    def delete_missing(self, ad_id: int, photo_keys: Sequence[str]):
+        """Удаляет векторы фото, которых у объявления больше нет"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'''
+                DELETE FROM {TABLE}
+                WHERE advertisement_id = %s AND model_name = %s AND NOT (photo_key = ANY(%s))
+            ''', [ad_id, self.model_name, list(photo_keys)])
+
+    def search(self, query: np.ndarray, k: int, animal_type: Optional[str] = None,
+               status: Optional[str] = None,
+               bbox: Optional[Tuple[float, float, float, float]] = None,
+               threshold: Optional[float] = None, aggregate: str = 'max') -> List[Tuple[int, float]]:
+        """До k пар (id объявления, сходство) одним запросом с фильтрами и LIMIT.
+
+        Объявления-кандидаты находит индекс HNSW по лучшему фото; оценка -
+        лучшее фото (max) или среднее по всем фото объявления (mean).
+        """
+        conditions = ['e.model_name = %s']
+        params = [self.model_name]
+        if animal_type is not None:
+            conditions.append('a.type = %s')
+            params.append(animal_type)
+        if status is not None:
+            conditions.append('a.status = %s')
+            params.append(status)
+        if bbox is not None:
+            conditions.append('a.latitude BETWEEN %s AND %s AND a.longitude BETWEEN %s AND %s')
+            min_lat, min_lon, max_lat, max_lon = bbox
+            params.extend([min_lat, max_lat, min_lon, max_lon])
+        if threshold is not None:
+            conditions.append('(e.embedding <#> %s::vector) <= %s')
+            params.extend([vector_literal(query), -threshold])
+
+        query_literal = vector_literal(query)
+        candidates_sql = f'''
+            SELECT e.advertisement_id AS ad_id, -(e.embedding <#> %s::vector) AS similarity
+            FROM {TABLE} e
+            JOIN {AD_TABLE} a ON a.id = e.advertisement_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY e.embedding <#> %s::vector
+            LIMIT %s
+        '''
+        # Строк берем с запасом: у объявления может быть несколько фото
+        candidates = k * get_setting('PGVECTOR_ROWS_PER_AD')
+        sql_params = [query_literal, *params, query_literal, candidates]
+        if aggregate == 'mean':
+            # Среднее по всем фото объявления, а не только по попавшим в кандидаты
+            having = ''
+            if threshold is not None:
+                having = 'HAVING avg(-(e.embedding <#> %s::vector)) >= %s'
+            sql = f'''
+                SELECT e.advertisement_id AS ad_id, avg(-(e.embedding <#> %s::vector)) AS score
+                FROM {TABLE} e
+                WHERE e.model_name = %s
+                  AND e.advertisement_id IN (SELECT ad_id FROM ({candidates_sql}) candidates)
+                GROUP BY e.advertisement_id
+                {having}
+                ORDER BY score DESC
+                LIMIT %s
+            '''
+            sql_params = [query_literal, self.model_name, *sql_params]
+            if threshold is not None:
+                sql_params.extend([query_literal, threshold])
+        else:
+            sql = f'''
+                SELECT ad_id, max(similarity) AS score
+                FROM ({candidates_sql}) candidates
+                GROUP BY ad_id
+                ORDER BY score DESC
+                LIMIT %s
+            '''
+        with transaction.atomic(), connection.cursor() as cursor:
+            # set_config(..., true) действует до конца транзакции, как SET LOCAL
+            ef_search = max(get_setting('PGVECTOR_EF_SEARCH'), candidates)
+            cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+            iterative_scan = get_setting('PGVECTOR_ITERATIVE_SCAN')
+            if iterative_scan and self.extension_version(cursor) >= (0, 8):
+                # pgvector >= 0.8: при фильтрах индекс продолжает обход, пока не наберет LIMIT
+                cursor.execute("SELECT set_config('hnsw.iterative_scan', %s, true)", [iterative_scan])
+            cursor.execute(sql, [*sql_params, k])
+            return [(ad_id, float(score)) for ad_id, score in cursor.fetchall()]
+
+    def extension_version(self, cursor) -> Tuple[int, ...]:
+        """Версия pgvector: до 0.8 параметра hnsw.iterative_scan нет, и set_config падает"""
+        if self._extension_version is None:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cursor.fetchone()
+            self._extension_version = tuple(int(part) for part in re.findall(r'\d+', row[0])) if row else ()
+        return self._extension_version
+
+    def backfill(self, vectors: Iterable[Tuple[int, str, np.ndarray]], batch_size: int = 500) -> int:
+        """Переносит векторы из хранилища PhotoEmbedding, возвращает их число"""
+        batch = []
+        total = 0
+        for item in vectors:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self.upsert(batch)
+                total += len(batch)
+                batch = []
+        self.upsert(batch)
+        return total + len(batch)
@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from similarity_search.conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+class ModelState:
+    NOT_LOADED = 'not_loaded'
+    LOADING = 'loading'
+    READY = 'ready'
+    FAILED = 'failed'
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.service = None
+        self.state = ModelState.NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self.index_seconds = None
+        self.ready_at = None
+
+
+class ModelRegistry:
+    """Реестр CLIP-сервисов на уровне процесса.
+
+    Каждая модель загружается один раз на воркер, и все запросы получают
+    один и тот же CLIPService вместе с его индексом FAISS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        # Сервис, который сейчас отвечает на запросы без явной модели
+        self._serving = None
+        # Фоновые потоки прогрева по имени модели (None - активная версия)
+        self._warming: Dict[Optional[str], threading.Thread] = {}
+
+    def _entry(self, model_name: str) -> _Entry:
+        with self._lock:
+            if model_name not in self._entries:
+                self._entries[model_name] = _Entry()
+            return self._entries[model_name]
+
+    def get(self, model_name: Optional[str] = None):
+        """Возвращает готовый сервис, при необходимости загружая его.
+
+        Без явной модели - сервис активной версии. Пока активированная
+        версия загружается в фоне, запросы обслуживает прежняя, поэтому
+        переключение модели проходит без простоя.
+        """
+        if model_name is None:
+            return self._get_active()
+        entry = self._entry(model_name)
+        if entry.state == ModelState.READY:
+            return entry.service
+
+        # Параллельные запросы ждут одну загрузку, а не запускают свои
+        with entry.lock:
+            if entry.state != ModelState.READY:
+                self._load(model_name, entry)
+        return entry.service
+
+    def _get_active(self):
+        # Импорт здесь: версии читаются из БД, а модуль подключается и вне Django
+        from similarity_search.services.versions import active_model_name
+
+        model_name = active_model_name()
+        entry = self._entry(model_name)
+        serving = self._serving
+        if entry.state != ModelState.READY and serving is not None and serving.model_name != model_name:
+            if entry.state == ModelState.NOT_LOADED:
+                logger.info(f"Переключение на модель {model_name}, пока отвечает {serving.model_name}")
+                entry.state = ModelState.LOADING
+                self.warm_up(model_name)
+            return serving
+
+        service = self.get(model_name)
+        if serving is not service:
+            self._serving = service
+            if serving is not None:
+                self._release(serving.model_name)
+        return service
+
+    def _release(self, model_name: str):
+        """Выгружает прежнюю модель после переключения, освобождая память"""
+        entry = self._entries.get(model_name)
+        if entry is None:
+            return
+        with entry.lock:
+            entry.service = None
+            entry.state = ModelState.NOT_LOADED
+        logger.info(f"Модель {model_name} выгружена после переключения версии")
+
+    def peek(self, model_name: Optional[str] = None):
+        """Возвращает сервис, только если он уже загружен, не блокируясь"""
+        if model_name is None:
+            return self._serving
+        entry = self._entries.get(model_name)
+        if entry is not None and entry.state == ModelState.READY:
+            return entry.service
+        return None
+
+    def warm_up(self, model_name: Optional[str] = None):
+        """Загружает модель и строит индекс в фоновом потоке.
+
+        Пока прогрев идет, повторные вызовы возвращают тот же поток, поэтому
+        его можно запускать из каждого запроса.
+        """
+        with self._lock:
+            thread = self._warming.get(model_name)
+            if thread is not None and thread.is_alive():
+                return thread
+            thread = threading.Thread(
+                target=self._warm_up,
+                args=(model_name,),
+                name='clip-warmup',
+                daemon=True,
+            )
+            self._warming[model_name] = thread
+            thread.start()
+        return thread
+
+    def _warm_up(self, model_name):
+        try:
+            self.get(model_name)
+        except Exception:
+            # Ошибка уже записана в состояние модели и залогирована
+            pass
+
+    def _load(self, model_name: str, entry: _Entry):
+        # Импорт здесь, чтобы модуль можно было подключать без torch/clip
+        from similarity_search.services.clip_service import CLIPService
+
+        entry.state = ModelState.LOADING
+        entry.error = None
+        try:
+            started = time.perf_counter()
+            service = CLIPService(model_name)
+            loaded = time.perf_counter()
+            # Готовый снимок открывается за доли секунды; без него строим
+            # индекс из хранилища векторов и публикуем для остальных воркеров
+            if service.pgvector is not None:
+                logger.info(f"Индекс модели {model_name} хранится в PostgreSQL (pgvector)")
+            elif service.load_snapshot():
+                # Изменения, сделанные после публикации снимка (например, пока
+                # новая версия модели ждала активации)
+                service.catch_up()
+            else:
+                service.build_index()
+                if service.snapshots is not None:
+                    service.save_snapshot()
+            finished = time.perf_counter()
+        except Exception as e:
+            entry.state = ModelState.FAILED
+            entry.error = str(e)
+            logger.error(f"Не удалось загрузить модель {model_name}: {e}")
+            raise
+
+        entry.service = service
+        entry.load_seconds = loaded - started
+        entry.index_seconds = finished - loaded
+        entry.ready_at = time.time()
+        entry.state = ModelState.READY
+        logger.info(
+            f"Модель {model_name} готова: загрузка {entry.load_seconds:.2f} с, "
+            f"индекс {entry.index_seconds:.2f} с"
+        )
+
+    def status(self) -> Dict[str, dict]:
+        """Состояние всех известных моделей и время их прогрева"""
+        from similarity_search.services.versions import active_model_name
+
+        active = active_model_name()
+        self._entry(active)
+        result = {}
+        for model_name, entry in list(self._entries.items()):
+            index = entry.service.index if entry.service is not None else None
+            result[model_name] = {
+                'active': model_name == active,
+                'state': entry.state,
+                'error': entry.error,
+                'load_seconds': entry.load_seconds,
+                'index_seconds': entry.index_seconds,
+                'ready_at': entry.ready_at,
+                'indexed_vectors': index.ntotal if index is not None else 0,
+                'index_type': index.index_type if index is not None else None,
+                'search_engine': index.engine if index is not None else None,
+                'shards': index.describe() if index is not None else {},
+                'snapshot_version': entry.service.snapshot_version if entry.service is not None else None,
+                'text_cache': entry.service.text_cache.stats() if entry.service is not None else None,
+                'image_cache': entry.service.image_cache.stats() if entry.service is not None else None,
+            }
+        return result
+
+
+registry = ModelRegistry()
+
+
+def warm_up_on_startup():
+    """Запускает фоновый прогрев, если он включен в настройках"""
+    if get_setting('WARMUP_ON_STARTUP'):
+        registry.warm_up()
@@ -0,0 +1,26 @@
+from typing import List, Sequence, Tuple
+
+from advertisements.models import Advertisement
+
+# Колонки объявления, которые нужны ответам поиска (и AdvertisementListSerializer)
+RESULT_FIELDS = (
+    'id', 'title', 'description', 'author', 'photo', 'phone', 'breed', 'color',
+    'type', 'status', 'location', 'latitude', 'longitude', 'created_at',
+)
+
+
+def resolve(hits: List[Tuple[int, float]], fields: Sequence[str] = RESULT_FIELDS) -> List[Tuple[Advertisement, float]]:
+    """Превращает пары (id, сходство) в объявления одним запросом к БД.
+
+    Порядок по сходству сохраняется; объявления, удаленные после
+    построения индекса, пропускаются. Модель CLIP для этого не нужна,
+    поэтому страницы по курсору не ждут ее загрузки.
+    """
+    if not hits:
+        return []
+    advertisements = Advertisement.objects.only(*fields).in_bulk([ad_id for ad_id, _ in hits])
+    return [
+        (advertisements[ad_id], score)
+        for ad_id, score in hits
+        if ad_id in advertisements
+    ]
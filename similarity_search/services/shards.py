@@ -0,0 +1,256 @@
+import heapq
+import logging
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from similarity_search.conf import get_setting
+
+from .vector_index import AGGREGATE_MAX, VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Признаки, по которым делится индекс
+SHARD_BY_TYPE = 'type'
+SHARD_BY_GEO = 'geo'
+SHARD_KEYS = (SHARD_BY_TYPE, SHARD_BY_GEO)
+
+# Ячейка для объявлений без координат
+NO_GEO_CELL = 'nogeo'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def fan_out_executor() -> ThreadPoolExecutor:
+    """Общий на процесс пул потоков для параллельного поиска по шардам.
+
+    FAISS и BLAS отпускают GIL, поэтому шарды действительно ищутся
+    параллельно; пул один на процесс, а не на каждую версию индекса.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_setting('SHARD_WORKERS'), thread_name_prefix='clip-shard'
+            )
+        return _executor
+
+
+def geo_cell(latitude: float, longitude: float, cell_degrees: float) -> str:
+    """Грубая ячейка сетки широта/долгота, в которую попадает точка"""
+    if latitude is None or longitude is None or math.isnan(latitude) or math.isnan(longitude):
+        return NO_GEO_CELL
+    return f'{math.floor(latitude / cell_degrees)}_{math.floor(longitude / cell_degrees)}'
+
+
+def geo_cells(bbox: Tuple[float, float, float, float], cell_degrees: float) -> set:
+    """Все ячейки сетки, пересекающие область (min_lat, min_lon, max_lat, max_lon)"""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    rows = range(math.floor(min_lat / cell_degrees), math.floor(max_lat / cell_degrees) + 1)
+    columns = range(math.floor(min_lon / cell_degrees), math.floor(max_lon / cell_degrees) + 1)
+    return {f'{row}_{column}' for row in rows for column in columns}
+
+
+class ShardedIndex:
+    """Индекс, разделенный на шарды по типу животного и (опционально) геоячейке.
+
+    Каждый шард - самостоятельный VectorIndex со своим типом индекса,
+    подобранным по его размеру. Запрос с фильтром по типу или области
+    идет только в подходящие шарды, остальные опрашиваются параллельно, а
+    их результаты сливаются в общий top-k. Объявление целиком лежит в
+    одном шарде, поэтому слияние не требует повторной свертки по фото.
+    Без признаков шардирования индекс состоит из одного шарда с ключом ''.
+    """
+
+    def __init__(self, dimension: int, shard_by: Sequence[str] = (), cell_degrees: float = 1.0,
+                 factory: Optional[Callable[[], VectorIndex]] = None):
+        unknown = set(shard_by) - set(SHARD_KEYS)
+        if unknown:
+            raise ValueError(f"Неизвестные признаки шардирования: {', '.join(sorted(unknown))}")
+        self.dimension = dimension
+        self.shard_by = tuple(key for key in SHARD_KEYS if key in shard_by)
+        self.cell_degrees = cell_degrees
+        self.factory = factory or (lambda: VectorIndex.empty(dimension))
+        self.shards: Dict[str, VectorIndex] = {}
+        # id объявления -> ключ шарда, в котором лежат его строки
+        self._locations: Dict[int, str] = {}
+
+    def shard_key(self, attributes: Dict[str, object]) -> str:
+        """Ключ шарда для атрибутов объявления, например cat/55_37"""
+        parts = []
+        if SHARD_BY_TYPE in self.shard_by:
+            parts.append(str(attributes.get('type') or '-'))
+        if SHARD_BY_GEO in self.shard_by:
+            parts.append(geo_cell(attributes.get('latitude'), attributes.get('longitude'), self.cell_degrees))
+        return '/'.join(parts)
+
+    def key_parts(self, key: str) -> Dict[str, str]:
+        """Ключ шарда по частям: {'type': 'cat', 'geo': '55_37'}"""
+        return dict(zip(self.shard_by, key.split('/')))
+
+    @classmethod
+    def build(cls, ids: np.ndarray, vectors: np.ndarray, attributes: Dict[str, np.ndarray],
+              build_shard: Callable[[np.ndarray, np.ndarray, Dict[str, np.ndarray]], VectorIndex],
+              dimension: int, shard_by: Sequence[str] = (), cell_degrees: float = 1.0,
+              factory: Optional[Callable[[], VectorIndex]] = None) -> 'ShardedIndex':
+        """Раскладывает строки по шардам и строит каждый шард через build_shard"""
+        index = cls(dimension, shard_by, cell_degrees, factory)
+        keys = np.array([
+            index.shard_key({name: values[row] for name, values in attributes.items()})
+            for row in range(len(ids))
+        ])
+        for key in np.unique(keys):
+            rows = np.flatnonzero(keys == key)
+            index.shards[str(key)] = build_shard(
+                ids[rows], vectors[rows], {name: values[rows] for name, values in attributes.items()}
+            )
+        index.reindex_locations()
+        return index
+
+    def reindex_locations(self):
+        """Пересчитывает, в каком шарде лежит каждое объявление"""
+        self._locations = {
+            int(ad_id): key
+            for key, shard in self.shards.items()
+            for ad_id in np.unique(shard.row_ids[shard.row_ids >= 0])
+        }
+
+    def replace_shard(self, key: str, shard: VectorIndex):
+        """Подменяет один шард целиком (перестроенный независимо от остальных)"""
+        # Объявления, переехавшие в этот шард, убираем из прежних
+        moved = np.unique(shard.row_ids[shard.row_ids >= 0])
+        for other_key, other in self.shards.items():
+            if other_key != key and len(moved):
+                other.remove(moved)
+        self.shards[key] = shard
+        self.reindex_locations()
+
+    @property
+    def read_only(self) -> bool:
+        """Все шарды открыты из снимка через mmap"""
+        return bool(self.shards) and all(shard.read_only for shard in self.shards.values())
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards.values())
+
+    @property
+    def index_type(self) -> Optional[str]:
+        """Тип индекса шардов; через запятую, если у шардов разные типы"""
+        types = sorted({shard.index_type for shard in self.shards.values()})
+        return ','.join(types) if types else None
+
+    @property
+    def engine(self) -> Optional[str]:
+        engines = sorted({shard.engine for shard in self.shards.values()})
+        return ','.join(engines) if engines else None
+
+    def describe(self) -> Dict[str, dict]:
+        """Размер, тип индекса и движок каждого шарда"""
+        return {
+            key: {'vectors': shard.ntotal, 'index_type': shard.index_type, 'engine': shard.engine}
+            for key, shard in sorted(self.shards.items())
+        }
+
+    def locate(self, ad_id: int) -> Optional[str]:
+        return self._locations.get(ad_id)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray, attributes: Dict[str, np.ndarray]):
+        """Добавляет строки одного объявления в его шард"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return
+        key = self.shard_key({name: values[0] for name, values in attributes.items()})
+        previous = self._locations.get(int(ids[0]))
+        if previous is not None and previous != key:
+            # Объявление сменило тип или место - переезжает в другой шард
+            self.shards[previous].remove(ids[:1])
+        if key not in self.shards:
+            self.shards[key] = self.factory()
+        self.shards[key].add(ids, vectors, attributes)
+        self._locations[int(ids[0])] = key
+
+    def set_attributes(self, ad_id: int, values: Dict[str, object]) -> bool:
+        """Обновляет атрибуты объявления на месте.
+
+        Возвращает False, если с новыми атрибутами объявление должно лежать
+        в другом шарде: тогда его строки нужно добавить заново через add().
+        """
+        key = self._locations.get(ad_id)
+        if key is None or key != self.shard_key(values):
+            return False
+        self.shards[key].set_attributes(ad_id, values)
+        return True
+
+    def remove(self, ids) -> int:
+        removed = 0
+        for ad_id in ids:
+            key = self._locations.pop(int(ad_id), None)
+            if key is not None:
+                removed += self.shards[key].remove([ad_id])
+        return removed
+
+    def route(self, animal_type: Optional[str] = None,
+              bbox: Optional[Tuple[float, float, float, float]] = None) -> List[str]:
+        """Шарды, в которых могут быть объявления под фильтры"""
+        cells = geo_cells(bbox, self.cell_degrees) if bbox is not None and SHARD_BY_GEO in self.shard_by else None
+        keys = []
+        for key in self.shards:
+            parts = self.key_parts(key)
+            if animal_type is not None and SHARD_BY_TYPE in parts and parts[SHARD_BY_TYPE] != animal_type:
+                continue
+            if cells is not None and parts[SHARD_BY_GEO] not in cells:
+                continue
+            keys.append(key)
+        return keys
+
+    def _shard_filters(self, animal_type, status, bbox) -> dict:
+        # Тип внутри шарда по типу одинаков - фильтр не нужен, поиск идет без маски
+        if SHARD_BY_TYPE in self.shard_by:
+            animal_type = None
+        return {'animal_type': animal_type, 'status': status, 'bbox': bbox}
+
+    def _fan_out(self, keys: List[str], call: Callable[[VectorIndex], List[Tuple[int, float]]]) -> List[List[Tuple[int, float]]]:
+        if len(keys) == 1:
+            return [call(self.shards[keys[0]])]
+        return list(fan_out_executor().map(lambda key: call(self.shards[key]), keys))
+
+    def search(self, query: np.ndarray, k: int, animal_type: Optional[str] = None,
+               status: Optional[str] = None, bbox: Optional[Tuple[float, float, float, float]] = None,
+               aggregate: str = AGGREGATE_MAX) -> List[Tuple[int, float]]:
+        """Top-k пар (id объявления, сходство) по подходящим шардам"""
+        keys = self.route(animal_type, bbox)
+        if not keys or k <= 0:
+            return []
+        filters = self._shard_filters(animal_type, status, bbox)
+        results = self._fan_out(
+            keys, lambda shard: shard.search(query, k, mask=shard.filter_mask(**filters), aggregate=aggregate)
+        )
+        return _merge(results, k)
+
+    def range_search(self, query: np.ndarray, threshold: float, limit: int,
+                     animal_type: Optional[str] = None, status: Optional[str] = None,
+                     bbox: Optional[Tuple[float, float, float, float]] = None,
+                     aggregate: str = AGGREGATE_MAX) -> List[Tuple[int, float]]:
+        """Все объявления со сходством не ниже threshold по подходящим шардам"""
+        keys = self.route(animal_type, bbox)
+        if not keys or limit <= 0:
+            return []
+        filters = self._shard_filters(animal_type, status, bbox)
+        results = self._fan_out(
+            keys,
+            lambda shard: shard.range_search(
+                query, threshold, limit, mask=shard.filter_mask(**filters), aggregate=aggregate
+            ),
+        )
+        return _merge(results, limit)
+
+
+def _merge(results: List[List[Tuple[int, float]]], k: int) -> List[Tuple[int, float]]:
+    """Слияние отсортированных по убыванию списков шардов в общий top-k"""
+    merged = heapq.merge(*results, key=lambda hit: hit[1], reverse=True)
+    return [hit for _, hit in zip(range(k), merged)]
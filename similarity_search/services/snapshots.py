@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from .shards import ShardedIndex
+from .vector_index import VectorIndex, apply_search_params, enable_reconstruct
+
+logger = logging.getLogger(__name__)
+
+CURRENT = 'CURRENT'
+INDEX_FILE = 'index.faiss'
+META_FILE = 'meta.json'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SnapshotStore:
+    """Версионированные снимки индекса на диске.
+
+    Каждая версия - отдельный каталог <root>/<модель>/<версия>/ с
+    подкаталогом на каждый шард индекса (файл FAISS, массивы row_ids и
+    атрибутов .npy), хешами фото и meta.json.
+    Файл CURRENT указывает на актуальную версию и заменяется атомарно
+    (os.replace), поэтому читатель видит либо старую, либо новую версию
+    целиком. Воркеры открывают файлы через mmap и делят страницы между
+    собой через page cache.
+    """
+
+    def __init__(self, root: str, model_name: str):
+        self.model_name = model_name
+        self.directory = os.path.join(root, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+
+    def current_version(self) -> Optional[str]:
+        """Имя актуальной версии или None, если снимков еще нет"""
+        try:
+            with open(os.path.join(self.directory, CURRENT)) as current_file:
+                return current_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def save(self, index: ShardedIndex, hashes: Dict[int, str], keep: int = 3) -> str:
+        """Пишет новую версию и атомарно делает ее актуальной"""
+        version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        target = os.path.join(self.directory, version)
+        staging = os.path.join(self.directory, f'.{version}.tmp')
+        os.makedirs(staging)
+
+        shards = []
+        for number, (key, shard) in enumerate(sorted(index.shards.items())):
+            directory = f'shard_{number:03d}'
+            os.makedirs(os.path.join(staging, directory))
+            shards.append({'key': key, 'directory': directory, **_write_shard(shard, os.path.join(staging, directory))})
+        np.save(os.path.join(staging, 'hash_ids.npy'), np.fromiter(hashes.keys(), dtype=np.int64, count=len(hashes)))
+        np.save(os.path.join(staging, 'hash_values.npy'), np.array(list(hashes.values()), dtype='S64'))
+
+        meta = {
+            'version': version,
+            'model_name': self.model_name,
+            'dimension': index.dimension,
+            'shard_by': list(index.shard_by),
+            'cell_degrees': index.cell_degrees,
+            'shards': shards,
+            'vectors': index.ntotal,
+            'created_at': time.time(),
+        }
+        with open(os.path.join(staging, META_FILE), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+        os.rename(staging, target)
+        pointer = os.path.join(self.directory, f'.{CURRENT}.tmp')
+        with open(pointer, 'w') as pointer_file:
+            pointer_file.write(version)
+            pointer_file.flush()
+            os.fsync(pointer_file.fileno())
+        os.replace(pointer, os.path.join(self.directory, CURRENT))
+        logger.info(
+            f"Снимок индекса {self.model_name} версии {version}: {index.ntotal} векторов, "
+            f"шардов {len(shards)}"
+        )
+
+        self._cleanup(keep)
+        return version
+
+    def load(self, version: Optional[str] = None, dimension: Optional[int] = None,
+             shard_by: Optional[Sequence[str]] = None,
+             cell_degrees: Optional[float] = None) -> Tuple[str, dict, ShardedIndex, Dict[int, str]]:
+        """Открывает версию (по умолчанию актуальную) через mmap.
+
+        Возвращает (версия, метаданные, индекс, хеши фото по id объявления).
+        Если заданы shard_by / cell_degrees, снимок с другим разбиением на
+        шарды отклоняется.
+        """
+        version = version or self.current_version()
+        if version is None:
+            raise SnapshotError(f"Нет снимков индекса для модели {self.model_name}")
+        path = os.path.join(self.directory, version)
+
+        with open(os.path.join(path, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        if meta['model_name'] != self.model_name:
+            raise SnapshotError(f"Снимок {version} построен моделью {meta['model_name']}")
+        if dimension is not None and meta['dimension'] != dimension:
+            raise SnapshotError(f"Размерность снимка {version} {meta['dimension']}, ожидается {dimension}")
+
+        # Снимки до шардирования - один индекс в корне версии
+        shards = meta.get('shards') or [{'key': '', 'directory': '', **meta}]
+        snapshot_shard_by = tuple(meta.get('shard_by', ()))
+        snapshot_cell = meta.get('cell_degrees', cell_degrees)
+        if shard_by is not None and (snapshot_shard_by != tuple(shard_by) or snapshot_cell != cell_degrees):
+            raise SnapshotError(
+                f"Снимок {version} разбит на шарды по {list(snapshot_shard_by)} "
+                f"(ячейка {snapshot_cell}), ожидается {list(shard_by)} (ячейка {cell_degrees})"
+            )
+
+        index = ShardedIndex(meta['dimension'], snapshot_shard_by, snapshot_cell or 1.0)
+        for shard in shards:
+            index.shards[shard['key']] = _read_shard(os.path.join(path, shard['directory']), shard, meta['dimension'])
+        index.reindex_locations()
+
+        hash_ids = np.load(os.path.join(path, 'hash_ids.npy'))
+        hash_values = np.load(os.path.join(path, 'hash_values.npy'))
+        hashes = {int(ad_id): value.decode() for ad_id, value in zip(hash_ids, hash_values)}
+        return version, meta, index, hashes
+
+    def _cleanup(self, keep: int):
+        """Удаляет старые версии, оставляя keep последних"""
+        versions = sorted(
+            name for name in os.listdir(self.directory)
+            if not name.startswith('.') and name != CURRENT
+        )
+        current = self.current_version()
+        for name in versions[:-keep] if keep > 0 else []:
+            if name != current:
+                # Уже открытые через mmap файлы остаются доступны до закрытия
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+def _write_shard(shard: VectorIndex, path: str) -> dict:
+    """Пишет файлы одного шарда, возвращает его метаданные"""
+    faiss.write_index(shard.index, os.path.join(path, INDEX_FILE))
+    np.save(os.path.join(path, 'row_ids.npy'), shard.row_ids)
+    for name, values in shard.attributes.items():
+        np.save(os.path.join(path, f'attr_{name}.npy'), values)
+    if shard.exact is not None:
+        np.save(os.path.join(path, 'exact.npy'), shard.exact)
+    return {
+        'index_type': shard.index_type,
+        'params': shard.params,
+        'attributes': sorted(shard.attributes),
+        'exact': shard.exact is not None,
+        'tombstones': shard.tombstones,
+        'max_rows_per_ad': shard.max_rows_per_ad,
+        'vectors': shard.ntotal,
+    }
+
+
+def _read_shard(path: str, meta: dict, dimension: int) -> VectorIndex:
+    """Открывает файлы одного шарда через mmap"""
+    faiss_index, mmapped = _read_index(os.path.join(path, INDEX_FILE))
+    apply_search_params(faiss_index, meta['index_type'], meta['params'])
+    # Снимки, записанные до появления карты IVF, получают ее при открытии
+    enable_reconstruct(faiss_index, meta['index_type'])
+    shard = VectorIndex(faiss_index, meta['index_type'], dimension, meta['params'])
+    shard.read_only = mmapped
+    # mmap_mode='c': страницы общие, пока воркер не изменит строку
+    shard.row_ids = np.load(os.path.join(path, 'row_ids.npy'), mmap_mode='c')
+    shard.attributes = {
+        name: np.load(os.path.join(path, f'attr_{name}.npy'), mmap_mode='c')
+        for name in meta['attributes']
+    }
+    if meta.get('exact'):
+        shard.exact = np.load(os.path.join(path, 'exact.npy'), mmap_mode='c')
+    shard.tombstones = meta['tombstones']
+    shard.max_rows_per_ad = meta.get('max_rows_per_ad', 1)
+    return shard
+
+
+def _read_index(path: str):
+    """Читает индекс через mmap, если тип индекса это позволяет.
+
+    IO_FLAG_MMAP_IFC (faiss >= 1.10) отображает в память векторы flat,
+    HNSW и списки IVF прямо из файла, и страницы делятся между воркерами.
+    Такой индекс нельзя менять на месте: первая запись копирует его в
+    память процесса (VectorIndex._materialize). IO_FLAG_MMAP сюда не
+    подходит: flat и HNSW он все равно читает в память, а списки IVF
+    оставляет отображенными только для чтения, и запись в них падает.
+    """
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC), True
+    except RuntimeError as e:
+        logger.info(f"Индекс {path} не поддерживает mmap, читается в память: {e}")
+        return faiss.read_index(path), False
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Движки поиска ближайших векторов
+EXACT = 'exact'     # матричное умножение NumPy (BLAS) по непрерывной матрице
+FLAT = 'flat'       # точный поиск FAISS (IndexFlatIP)
+ANN = 'ann'         # приближенный индекс FAISS (HNSW / IVF)
+
+ENGINES = (EXACT, FLAT, ANN)
+
+# Пороги по умолчанию, пока калибровка на этой машине не выполнена
+DEFAULT_EXACT_MAX_ROWS = 20_000
+DEFAULT_FLAT_MAX_ROWS = 200_000
+
+
+class Calibration:
+    """Точки перехода между движками поиска, измеренные на конкретной машине.
+
+    До exact_max_rows векторов быстрее всего матричное умножение NumPy
+    (нет накладных расходов вызова FAISS), до flat_max_rows - точный
+    IndexFlat, дальше выигрывает приближенный индекс.
+    """
+
+    def __init__(self, exact_max_rows: int = DEFAULT_EXACT_MAX_ROWS,
+                 flat_max_rows: int = DEFAULT_FLAT_MAX_ROWS,
+                 dimension: Optional[int] = None, measured_at: Optional[float] = None,
+                 measurements: Optional[List[dict]] = None):
+        self.exact_max_rows = exact_max_rows
+        self.flat_max_rows = flat_max_rows
+        self.dimension = dimension
+        self.measured_at = measured_at
+        self.measurements = measurements or []
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> 'Calibration':
+        """Калибровка из файла или значения по умолчанию, если файла нет"""
+        if not path or not os.path.exists(path):
+            return cls()
+        try:
+            with open(path) as calibration_file:
+                data = json.load(calibration_file)
+            return cls(
+                exact_max_rows=int(data['exact_max_rows']),
+                flat_max_rows=int(data['flat_max_rows']),
+                dimension=data.get('dimension'),
+                measured_at=data.get('measured_at'),
+                measurements=data.get('measurements'),
+            )
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Файл калибровки {path} не прочитан, используются пороги по умолчанию: {e}")
+            return cls()
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as calibration_file:
+            json.dump(self.as_dict(), calibration_file, indent=2)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            'exact_max_rows': self.exact_max_rows,
+            'flat_max_rows': self.flat_max_rows,
+            'dimension': self.dimension,
+            'measured_at': self.measured_at,
+            'measurements': self.measurements,
+        }
+
+    def choose(self, rows: int, ann_available: bool = True) -> str:
+        """Движок для корпуса из rows векторов"""
+        if rows <= self.exact_max_rows:
+            return EXACT
+        if rows <= self.flat_max_rows or not ann_available:
+            return FLAT
+        return ANN
+
+    @classmethod
+    def from_measurements(cls, measurements: List[dict], dimension: int) -> 'Calibration':
+        """Точки перехода по замерам [{rows, exact, flat, ann}] (медианы задержки, мс)"""
+        rows = sorted(measurements, key=lambda item: item['rows'])
+        # Переход - последний размер подряд идущих замеров, где движок еще выигрывает
+        exact_max_rows = 0
+        for row in rows:
+            if row['exact'] > min(row['flat'], row.get('ann', float('inf'))):
+                break
+            exact_max_rows = row['rows']
+        flat_max_rows = exact_max_rows
+        for row in rows:
+            if min(row['exact'], row['flat']) > row.get('ann', float('inf')):
+                break
+            flat_max_rows = max(flat_max_rows, row['rows'])
+        return cls(
+            exact_max_rows=exact_max_rows,
+            flat_max_rows=flat_max_rows,
+            dimension=dimension,
+            measured_at=time.time(),
+            measurements=measurements,
+        )
+
+
+def exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int,
+                valid: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Точный top-k по скалярному произведению одним вызовом BLAS.
+
+    matrix - непрерывная матрица нормированных векторов (N x d), valid -
+    булева маска допустимых строк. Возвращает (сходства, номера строк) по
+    убыванию сходства; недопустимые строки не попадают в результат.
+    """
+    scores = matrix @ np.asarray(query, dtype=np.float32).reshape(-1)
+    if valid is not None:
+        scores = np.where(valid, scores, -np.inf)
+        k = min(k, int(np.count_nonzero(valid)))
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        rows = np.argpartition(-scores, k - 1)[:k]
+    else:
+        rows = np.arange(len(scores))
+    rows = rows[np.argsort(-scores[rows])]
+    return scores[rows], rows.astype(np.int64)
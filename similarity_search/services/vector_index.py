@@ -0,0 +1,491 @@
+import logging
+import math
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from .strategy import ANN, EXACT, FLAT as FLAT_ENGINE, exact_top_k
+
+logger = logging.getLogger(__name__)
+
+FLAT = 'flat'
+FLAT_FP16 = 'flat_fp16'
+IVF_FLAT = 'ivf_flat'
+IVF_PQ = 'ivf_pq'
+OPQ_IVF_PQ = 'opq_ivf_pq'
+HNSW = 'hnsw'
+
+INDEX_TYPES = (FLAT, FLAT_FP16, IVF_FLAT, IVF_PQ, OPQ_IVF_PQ, HNSW)
+# Индексы, где метка строки - ее позиция и удаление сдвигает строки
+FLAT_TYPES = (FLAT, FLAT_FP16)
+IVF_TYPES = (IVF_FLAT, IVF_PQ, OPQ_IVF_PQ)
+# Сжатые индексы: финальный top-k переранжируется по точным векторам
+PQ_TYPES = (IVF_PQ, OPQ_IVF_PQ)
+
+# Во сколько раз больше кандидатов берется из сжатого индекса для переранжирования
+DEFAULT_RERANK_FACTOR = 4
+
+# Запас по порогу для range_search по сжатому индексу до точного переранжирования
+RANGE_MARGIN = 0.05
+
+# Как сводить сходство нескольких фото одного объявления в одну оценку
+AGGREGATE_MAX = 'max'
+AGGREGATE_MEAN = 'mean'
+
+# Меньше этого числа векторов IVF не на чем обучать, используется точный индекс
+MIN_TRAINING_VECTORS = 1000
+
+NPROBE_GRID = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+EF_SEARCH_GRID = (16, 32, 64, 128, 256, 512)
+
+
+def default_params(index_type: str, count: int, dimension: int) -> Dict[str, int]:
+    """Параметры построения индекса в зависимости от размера каталога"""
+    if index_type in IVF_TYPES:
+        # Обычная рекомендация FAISS: nlist ~ 4*sqrt(N), не меньше 39 точек на кластер
+        nlist = int(4 * math.sqrt(max(count, 1)))
+        nlist = max(1, min(nlist, count // 39 or 1))
+        params = {'nlist': nlist}
+        if index_type in PQ_TYPES:
+            # 8 измерений на подквантизатор, m должно делить размерность
+            pq_m = max(1, dimension // 8)
+            while dimension % pq_m:
+                pq_m -= 1
+            params.update({'pq_m': pq_m, 'pq_bits': 8, 'rerank_factor': DEFAULT_RERANK_FACTOR})
+        return params
+    if index_type == HNSW:
+        return {'hnsw_m': 32, 'ef_construction': 80}
+    return {}
+
+
+def create_faiss_index(index_type: str, dimension: int, params: Dict[str, int]):
+    """Создает пустой (еще не обученный) индекс по скалярному произведению"""
+    metric = faiss.METRIC_INNER_PRODUCT
+    if index_type == FLAT:
+        return faiss.IndexFlatIP(dimension)
+    if index_type == FLAT_FP16:
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, metric)
+    if index_type == IVF_FLAT:
+        quantizer = faiss.IndexFlatIP(dimension)
+        return enable_reconstruct(faiss.IndexIVFFlat(quantizer, dimension, params['nlist'], metric), index_type)
+    if index_type == IVF_PQ:
+        quantizer = faiss.IndexFlatIP(dimension)
+        return enable_reconstruct(faiss.IndexIVFPQ(
+            quantizer, dimension, params['nlist'], params['pq_m'], params['pq_bits'], metric
+        ), index_type)
+    if index_type == OPQ_IVF_PQ:
+        # Поворот OPQ выравнивает дисперсию по подпространствам PQ
+        opq = faiss.OPQMatrix(dimension, params['pq_m'])
+        quantizer = faiss.IndexFlatIP(dimension)
+        ivf = faiss.IndexIVFPQ(
+            quantizer, dimension, params['nlist'], params['pq_m'], params['pq_bits'], metric
+        )
+        return enable_reconstruct(faiss.IndexPreTransform(opq, ivf), index_type)
+    if index_type == HNSW:
+        index = faiss.IndexHNSWFlat(dimension, params['hnsw_m'], metric)
+        index.hnsw.efConstruction = params['ef_construction']
+        return index
+    raise ValueError(f"Неизвестный тип индекса: {index_type}")
+
+
+def enable_reconstruct(index, index_type: str):
+    """Включает у IVF карту метка -> строка списка, чтобы работал reconstruct.
+
+    Хеш-таблица, в отличие от массива, переживает remove_ids. Нужна для
+    свертки mean, которая пересчитывает сходство по всем фото объявления.
+    """
+    if index_type in IVF_TYPES:
+        ivf = faiss.extract_index_ivf(index)
+        if ivf.direct_map.type != faiss.DirectMap.Hashtable:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def apply_search_params(index, index_type: str, params: Dict[str, int]):
+    """Выставляет параметры поиска (nprobe / efSearch) на индексе"""
+    if index_type in IVF_TYPES and 'nprobe' in params:
+        faiss.extract_index_ivf(index).nprobe = params['nprobe']
+    elif index_type == HNSW and 'ef_search' in params:
+        index.hnsw.efSearch = params['ef_search']
+
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """Доля точных k ближайших соседей, найденных приближенным поиском"""
+    k = exact_ids.shape[1]
+    hits = sum(len(np.intersect1d(a[a >= 0], e[e >= 0])) for a, e in zip(approx_ids, exact_ids))
+    return hits / float(k * len(exact_ids))
+
+
+def rerank(queries: np.ndarray, labels: np.ndarray, exact: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Пересчитывает сходство кандидатов по точным векторам и оставляет k лучших.
+
+    labels - строки-кандидаты (-1 для пустых), exact - точные векторы строк
+    (float16 приводится к float32 на лету). Возвращает (сходства, строки).
+    """
+    candidates = exact[np.maximum(labels, 0)].astype(np.float32)
+    scores = np.einsum('qcd,qd->qc', candidates, queries.astype(np.float32))
+    scores[labels < 0] = -np.inf
+    order = np.argsort(-scores, axis=1)[:, :k]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(labels, order, axis=1)
+
+
+def tune_search_params(index, index_type: str, vectors: np.ndarray, params: Dict[str, int],
+                       target_recall: float = 0.95, k: int = 10, sample: int = 256) -> Dict[str, int]:
+    """Подбирает минимальный nprobe / efSearch, дающий target_recall@k.
+
+    Запросами служит случайная выборка самих векторов, эталон - точный поиск.
+    Для сжатых индексов recall меряется после переранжирования.
+    """
+    if index_type not in IVF_TYPES and index_type != HNSW:
+        return {}
+
+    rng = np.random.default_rng(0)
+    k = min(k, len(vectors))
+    queries = vectors[rng.choice(len(vectors), size=min(sample, len(vectors)), replace=False)]
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, exact_ids = exact.search(queries, k)
+
+    if index_type in IVF_TYPES:
+        name, grid = 'nprobe', [n for n in NPROBE_GRID if n <= params['nlist']] or [1]
+    else:
+        name, grid = 'ef_search', [ef for ef in EF_SEARCH_GRID if ef >= k] or [EF_SEARCH_GRID[-1]]
+
+    rerank_factor = params.get('rerank_factor', 0) if index_type in PQ_TYPES else 0
+    chosen, recall = grid[-1], 0.0
+    for value in grid:
+        apply_search_params(index, index_type, {name: value})
+        if rerank_factor:
+            _, candidates = index.search(queries, k * rerank_factor)
+            _, approx_ids = rerank(queries, candidates, vectors, k)
+        else:
+            _, approx_ids = index.search(queries, k)
+        recall = recall_at_k(approx_ids, exact_ids)
+        if recall >= target_recall:
+            chosen = value
+            break
+
+    apply_search_params(index, index_type, {name: chosen})
+    logger.info(f"Индекс {index_type}: {name}={chosen}, recall@{k}={recall:.3f}")
+    return {name: chosen}
+
+
+class VectorIndex:
+    """Индекс FAISS, строки которого сопоставлены id объявлений.
+
+    FAISS нумерует строки сам, а row_ids хранит id объявления для каждой
+    строки (-1 для удаленных). Так удаление и замена векторов одинаково
+    работают для всех типов индекса, включая HNSW, который удалять строки
+    не умеет. У объявления может быть несколько строк - по одной на фото;
+    поиск сводит их в одну оценку на объявление.
+    """
+
+    def __init__(self, index, index_type: str, dimension: int, params: Optional[Dict[str, int]] = None):
+        self.index = index
+        self.index_type = index_type
+        self.dimension = dimension
+        self.params = params or {}
+        self.row_ids = np.empty(0, dtype=np.int64)
+        # Атрибуты строк для фильтрации (тип, статус, координаты), выровнены с row_ids
+        self.attributes: Dict[str, np.ndarray] = {}
+        # Строки, помеченные удаленными, но физически оставшиеся в индексе
+        # (HNSW и индексы, открытые из снимка через mmap)
+        self.tombstones = 0
+        # Индекс открыт только для чтения (mmap снимка): удаление через
+        # tombstones, добавление сначала копирует индекс в память
+        self.read_only = False
+        # Точные векторы строк в float16 для переранжирования сжатого индекса
+        self.exact: Optional[np.ndarray] = None
+        # Верхняя оценка числа фото у одного объявления: во столько раз больше
+        # строк запрашивается у FAISS, чтобы после свертки осталось k объявлений
+        self.max_rows_per_ad = 1
+        # До стольких строк плоский индекс ищется умножением NumPy по его же
+        # матрице, без вызова FAISS (порог из калибровки, 0 - всегда FAISS)
+        self.exact_max_rows = 0
+
+    @classmethod
+    def empty(cls, dimension: int) -> 'VectorIndex':
+        return cls(create_faiss_index(FLAT, dimension, {}), FLAT, dimension)
+
+    @classmethod
+    def build(cls, ids: np.ndarray, vectors: np.ndarray, index_type: str = FLAT,
+              params: Optional[Dict[str, int]] = None, target_recall: float = 0.95,
+              attributes: Optional[Dict[str, np.ndarray]] = None) -> 'VectorIndex':
+        """Строит, обучает и настраивает индекс нужного типа"""
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Неизвестный тип индекса: {index_type}")
+
+        dimension = vectors.shape[1]
+        count = len(vectors)
+        if index_type in IVF_TYPES and count < MIN_TRAINING_VECTORS:
+            logger.info(f"Мало векторов ({count}) для обучения {index_type}, используется flat")
+            index_type = FLAT
+
+        build_params = default_params(index_type, count, dimension)
+        build_params.update(params or {})
+        index = create_faiss_index(index_type, dimension, build_params)
+        if not index.is_trained:
+            index.train(vectors)
+
+        vector_index = cls(index, index_type, dimension, build_params)
+        vector_index.add(ids, vectors, attributes)
+
+        # Явно заданные nprobe / efSearch важнее автоподбора
+        if 'nprobe' in build_params or 'ef_search' in build_params:
+            apply_search_params(index, index_type, build_params)
+        else:
+            build_params.update(tune_search_params(index, index_type, vectors, build_params, target_recall))
+        return vector_index
+
+    @property
+    def rerank_factor(self) -> int:
+        if self.index_type not in PQ_TYPES:
+            return 0
+        return int(self.params.get('rerank_factor', 0))
+
+    @property
+    def engine(self) -> str:
+        """Движок, которым сейчас выполняется поиск"""
+        if self.index_type == FLAT and len(self.row_ids) <= self.exact_max_rows:
+            return EXACT
+        return FLAT_ENGINE if self.index_type in FLAT_TYPES else ANN
+
+    def _flat_matrix(self) -> np.ndarray:
+        """Векторы IndexFlat как матрица NumPy без копирования"""
+        count = self.index.ntotal
+        return faiss.rev_swig_ptr(self.index.get_xb(), count * self.dimension).reshape(count, self.dimension)
+
+    @property
+    def ntotal(self) -> int:
+        """Число живых векторов в индексе"""
+        return int(np.count_nonzero(self.row_ids >= 0))
+
+    def contains(self, ad_id: int) -> bool:
+        return bool(np.any(self.row_ids == ad_id))
+
+    def _materialize(self):
+        """Копирует индекс, открытый через mmap, в память процесса.
+
+        Копия владеет своими векторами и списками IVF (ArrayInvertedLists),
+        поэтому в нее можно добавлять строки и сохранять ее снимком.
+        """
+        if self.read_only:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            apply_search_params(self.index, self.index_type, self.params)
+            self.read_only = False
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray, attributes: Optional[Dict[str, np.ndarray]] = None):
+        self._materialize()
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.index_type in IVF_TYPES:
+            # Метки IVF не сдвигаются при удалении, поэтому выдаем их сами
+            start = len(self.row_ids)
+            self.index.add_with_ids(vectors, np.arange(start, start + len(ids), dtype=np.int64))
+        else:
+            # Для flat и HNSW метка совпадает с позицией строки
+            self.index.add(vectors)
+        if len(ids):
+            unique_ids, counts = np.unique(ids, return_counts=True)
+            if len(self.row_ids) and len(unique_ids) <= 64:
+                # Обычный случай - одно объявление из сигнала: считаем только его строки
+                counts = counts + np.array([np.count_nonzero(self.row_ids == ad_id) for ad_id in unique_ids])
+            elif len(self.row_ids):
+                _, counts = np.unique(np.concatenate([self.row_ids[self.row_ids >= 0], ids]), return_counts=True)
+            self.max_rows_per_ad = max(self.max_rows_per_ad, int(counts.max()))
+        self.row_ids = np.concatenate([self.row_ids, ids])
+        if self.rerank_factor:
+            exact = self.exact if self.exact is not None else np.empty((0, self.dimension), dtype=np.float16)
+            self.exact = np.concatenate([exact, vectors.astype(np.float16)])
+
+        attributes = attributes or {}
+        for name in set(self.attributes) | set(attributes):
+            values = np.asarray(attributes[name]) if name in attributes else None
+            current = self.attributes.get(name)
+            if values is None:
+                values = np.full(len(ids), _missing(current.dtype), dtype=current.dtype)
+            if current is None:
+                current = np.full(len(self.row_ids) - len(ids), _missing(values.dtype), dtype=values.dtype)
+            self.attributes[name] = np.concatenate([current, values])
+
+    def set_attributes(self, ad_id: int, values: Dict[str, object]):
+        """Обновляет атрибуты всех строк объявления без замены вектора"""
+        rows = self.row_ids == ad_id
+        for name, value in values.items():
+            if name in self.attributes:
+                self.attributes[name][rows] = _missing(self.attributes[name].dtype) if value is None else value
+
+    def remove(self, ids) -> int:
+        """Удаляет все строки указанных объявлений, возвращает их число"""
+        rows = np.flatnonzero(np.isin(self.row_ids, np.asarray(ids, dtype=np.int64)))
+        if not len(rows):
+            return 0
+        rows = rows.astype(np.int64)
+        if self.read_only or self.index_type == HNSW:
+            self.row_ids[rows] = -1
+            self.tombstones += len(rows)
+        elif self.index_type in FLAT_TYPES:
+            # IndexFlat сдвигает оставшиеся строки, row_ids и атрибуты сдвигаем так же
+            self.index.remove_ids(rows)
+            self.row_ids = np.delete(self.row_ids, rows)
+            for name, values in self.attributes.items():
+                self.attributes[name] = np.delete(values, rows)
+        elif self.index_type in IVF_TYPES:
+            self.index.remove_ids(rows)
+            self.row_ids[rows] = -1
+        return len(rows)
+
+    def filter_mask(self, animal_type: Optional[str] = None, status: Optional[str] = None,
+                    bbox: Optional[Tuple[float, float, float, float]] = None) -> Optional[np.ndarray]:
+        """Булева маска строк под фильтры по атрибутам; None, если фильтров нет"""
+        if not self.attributes or (animal_type is None and status is None and bbox is None):
+            return None
+
+        mask = np.ones(len(self.row_ids), dtype=bool)
+        if animal_type is not None:
+            mask &= self.attributes['type'] == animal_type
+        if status is not None:
+            mask &= self.attributes['status'] == status
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            latitude, longitude = self.attributes['latitude'], self.attributes['longitude']
+            mask &= (latitude >= min_lat) & (latitude <= max_lat)
+            mask &= (longitude >= min_lon) & (longitude <= max_lon)
+        return mask
+
+    def _search_params(self, allowed_rows: np.ndarray, k: int):
+        """Параметры поиска, ограничивающие кандидатов заданными строками"""
+        # IDSelectorBatch копирует метки к себе, массив можно не удерживать
+        selector = faiss.IDSelectorBatch(len(allowed_rows), faiss.swig_ptr(allowed_rows))
+        if self.index_type in IVF_TYPES:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(self.index).nprobe)
+        if self.index_type == HNSW:
+            # При узком фильтре графу нужно больше кандидатов, чтобы набрать k
+            selectivity = len(allowed_rows) / float(len(self.row_ids))
+            ef_search = min(1024, max(self.index.hnsw.efSearch, int(k / max(selectivity, 1e-3))))
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+        return faiss.SearchParameters(sel=selector)
+
+    def search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+               aggregate: str = AGGREGATE_MAX) -> List[Tuple[int, float]]:
+        """Возвращает до k пар (id объявления, сходство) по убыванию сходства.
+
+        mask - булев массив по строкам: кандидатами будут только отмеченные
+        строки, фильтр применяется внутри FAISS до ранжирования.
+        aggregate - свертка сходства фото одного объявления: max - лучшее
+        фото, mean - среднее по всем фото объявления. Объявления-кандидаты
+        в обоих случаях отбираются индексом по лучшему фото.
+        """
+        total_rows = len(self.row_ids)
+        if not total_rows or k <= 0:
+            return []
+        query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, -1)
+        # Из сжатого индекса берем больше кандидатов и ранжируем их точно
+        wanted = k * max(self.rerank_factor, 1) * self.max_rows_per_ad
+
+        if self.engine == EXACT:
+            # На малом корпусе одно умножение матрицы быстрее накладных расходов FAISS
+            valid = self.row_ids >= 0
+            if mask is not None:
+                valid &= mask
+            scores, labels = exact_top_k(self._flat_matrix(), query, wanted, valid)
+            return self._aggregate(query, labels, scores, aggregate)[:k]
+
+        if mask is None:
+            fetch = min(wanted + self.tombstones, total_rows)
+            scores, labels = self.index.search(query, fetch)
+        else:
+            allowed_rows = np.flatnonzero(mask & (self.row_ids >= 0)).astype(np.int64)
+            if not len(allowed_rows):
+                return []
+            fetch = min(wanted, len(allowed_rows))
+            scores, labels = self.index.search(query, fetch, params=self._search_params(allowed_rows, fetch))
+
+        if self.rerank_factor and self.exact is not None:
+            scores, labels = rerank(query, labels, self.exact, fetch)
+
+        return self._aggregate(query, labels[0], scores[0], aggregate)[:k]
+
+    def range_search(self, query: np.ndarray, threshold: float, limit: int,
+                     mask: Optional[np.ndarray] = None, aggregate: str = AGGREGATE_MAX) -> List[Tuple[int, float]]:
+        """Все объявления со сходством не ниже threshold, не больше limit, по убыванию.
+
+        Отсечение по порогу делает сам индекс, поэтому сильные совпадения не
+        теряются за фиксированным top-k, а слабый запрос возвращает мало строк.
+        """
+        total_rows = len(self.row_ids)
+        if not total_rows or limit <= 0:
+            return []
+        query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, -1)
+
+        params = None
+        if mask is not None:
+            allowed_rows = np.flatnonzero(mask & (self.row_ids >= 0)).astype(np.int64)
+            if not len(allowed_rows):
+                return []
+            params = self._search_params(allowed_rows, limit)
+
+        # Сходство по PQ-кодам приближенное: берем с запасом и уточняем по точным векторам
+        radius = threshold - RANGE_MARGIN if self.rerank_factor else threshold
+        try:
+            _, scores, labels = self.index.range_search(query, radius, params=params)
+        except RuntimeError as e:
+            # range_search есть не у всех индексов (например, HNSW в старых версиях FAISS)
+            logger.debug(f"range_search недоступен для {self.index_type}: {e}")
+            hits = self.search(query, limit, mask=mask, aggregate=aggregate)
+            return [(ad_id, score) for ad_id, score in hits if score >= threshold]
+
+        if self.rerank_factor and self.exact is not None and len(labels):
+            scores, labels = rerank(query, labels.reshape(1, -1), self.exact, len(labels))
+            scores, labels = scores[0], labels[0]
+        else:
+            order = np.argsort(-scores)
+            scores, labels = scores[order], labels[order]
+
+        hits = self._aggregate(query, labels, scores, aggregate)
+        return [(ad_id, score) for ad_id, score in hits if score >= threshold][:limit]
+
+    def _aggregate(self, query: np.ndarray, labels: np.ndarray, scores: np.ndarray,
+                   aggregate: str) -> List[Tuple[int, float]]:
+        """Сводит строки-кандидаты в (id объявления, сходство) по убыванию сходства"""
+        # Кандидаты идут по убыванию сходства, поэтому первое фото объявления - лучшее
+        best: Dict[int, float] = {}
+        for label, score in zip(labels, scores):
+            if label < 0:  # FAISS возвращает -1 для пустых результатов
+                continue
+            ad_id = int(self.row_ids[label])
+            if ad_id < 0:
+                continue
+            best.setdefault(ad_id, float(score))
+
+        if aggregate == AGGREGATE_MEAN and best:
+            return self._mean_over_photos(query, np.fromiter(best, dtype=np.int64, count=len(best)))
+        return list(best.items())
+
+    def _mean_over_photos(self, query: np.ndarray, ad_ids: np.ndarray) -> List[Tuple[int, float]]:
+        """Среднее сходство по всем фото каждого объявления, по убыванию.
+
+        Среди кандидатов индекса есть не все фото объявления, поэтому
+        сходство пересчитывается по векторам всех его живых строк.
+        """
+        rows = np.flatnonzero(np.isin(self.row_ids, ad_ids))
+        similarities = self._row_vectors(rows) @ query.reshape(-1)
+        owners, inverse = np.unique(self.row_ids[rows], return_inverse=True)
+        means = np.bincount(inverse, weights=similarities) / np.bincount(inverse)
+        order = np.argsort(-means, kind='stable')
+        return [(int(owners[i]), float(means[i])) for i in order]
+
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Векторы строк индекса (float32); у сжатых - точные, если они хранятся"""
+        if self.exact is not None:
+            return self.exact[rows].astype(np.float32)
+        if self.index_type == FLAT:
+            return self._flat_matrix()[rows]
+        # Метка строки во всех индексах - ее позиция в row_ids
+        return self.index.reconstruct_batch(rows.astype(np.int64))
+
+
+def _missing(dtype) -> object:
+    """Значение атрибута для строк, у которых он не задан"""
+    return np.nan if np.issubdtype(dtype, np.floating) else ''
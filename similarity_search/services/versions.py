@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from similarity_search.conf import get_setting
+from similarity_search.models import EmbeddingModelVersion
+
+logger = logging.getLogger(__name__)
+
+State = EmbeddingModelVersion.State
+
+# Разделитель ревизии предобработки в имени версии: ViT-L/14@2
+REVISION_SEPARATOR = '@'
+
+_active_lock = threading.Lock()
+_active = {'model_name': None, 'checked_at': float('-inf')}
+
+
+class VersionError(Exception):
+    pass
+
+
+def backbone(model_name: str) -> str:
+    """Имя CLIP-модели для clip.load без ревизии предобработки"""
+    return model_name.split(REVISION_SEPARATOR, 1)[0]
+
+
+def active_model_name() -> str:
+    """Версия, которая сейчас обслуживает поиск.
+
+    Читается из БД не чаще раза в ACTIVE_MODEL_POLL_SECONDS, поэтому все
+    воркеры переключаются на новую версию в пределах этого интервала. Пока
+    ни одна версия не активирована - MODEL_NAME из настроек.
+    """
+    now = time.monotonic()
+    with _active_lock:
+        if now - _active['checked_at'] < get_setting('ACTIVE_MODEL_POLL_SECONDS'):
+            return _active['model_name']
+        try:
+            model_name = EmbeddingModelVersion.objects.filter(
+                state=State.ACTIVE
+            ).values_list('model_name', flat=True).first()
+        except DatabaseError as e:
+            # Например, миграции еще не применены
+            logger.debug(f"Активная версия модели не прочитана: {e}")
+            model_name = None
+        _active['model_name'] = model_name or get_setting('MODEL_NAME')
+        _active['checked_at'] = now
+        return _active['model_name']
+
+
+def invalidate_active():
+    """Сбрасывает закешированную активную версию (после переключения в этом процессе)"""
+    with _active_lock:
+        _active['checked_at'] = float('-inf')
+
+
+def start_build(model_name: str) -> EmbeddingModelVersion:
+    """Отмечает начало (или продолжение) построения версии"""
+    version, _ = EmbeddingModelVersion.objects.get_or_create(model_name=model_name)
+    if version.state != State.ACTIVE:
+        # Повторный запуск продолжает работу: готовые векторы уже в хранилище
+        version.state = State.BUILDING
+    version.error = ''
+    version.started_at = timezone.now()
+    version.finished_at = None
+    version.save(update_fields=['state', 'error', 'started_at', 'finished_at'])
+    return version
+
+
+def record_progress(model_name: str, photos_done: int):
+    EmbeddingModelVersion.objects.filter(model_name=model_name).update(photos_done=photos_done)
+
+
+def finish_build(model_name: str, vectors: int):
+    """Версия построена и может быть активирована"""
+    EmbeddingModelVersion.objects.filter(model_name=model_name).exclude(state=State.ACTIVE).update(state=State.READY)
+    EmbeddingModelVersion.objects.filter(model_name=model_name).update(vectors=vectors, finished_at=timezone.now())
+
+
+def fail_build(model_name: str, error: str):
+    EmbeddingModelVersion.objects.filter(model_name=model_name).exclude(state=State.ACTIVE).update(
+        state=State.FAILED, error=error, finished_at=timezone.now()
+    )
+
+
+def activate(model_name: str) -> Optional[str]:
+    """Атомарно делает версию активной, возвращает прежнюю активную.
+
+    Прежняя версия переходит в retired вместе с векторами и снимками,
+    поэтому к ней можно откатиться через rollback().
+    """
+    with transaction.atomic():
+        versions = {
+            version.model_name: version
+            for version in EmbeddingModelVersion.objects.select_for_update()
+        }
+        target = versions.get(model_name)
+        if target is None or target.state not in (State.READY, State.RETIRED, State.ACTIVE):
+            state = target.state if target is not None else 'не построена'
+            raise VersionError(f"Версия {model_name} не готова к активации: {state}")
+        if target.state == State.ACTIVE:
+            return model_name
+
+        current = next((version for version in versions.values() if version.state == State.ACTIVE), None)
+        if current is not None:
+            previous = current.model_name
+            current.state = State.RETIRED
+            current.save(update_fields=['state'])
+        else:
+            # До первого переключения поиск обслуживала модель из настроек -
+            # запоминаем ее, чтобы было куда откатиться
+            previous = get_setting('MODEL_NAME')
+            if previous != model_name:
+                EmbeddingModelVersion.objects.update_or_create(
+                    model_name=previous,
+                    defaults={'state': State.RETIRED, 'activated_at': timezone.now()},
+                )
+
+        target.state = State.ACTIVE
+        target.activated_at = timezone.now()
+        target.save(update_fields=['state', 'activated_at'])
+
+    invalidate_active()
+    logger.info(f"Активная версия модели: {model_name} (прежняя {previous})")
+    return previous
+
+
+def rollback() -> str:
+    """Откатывается к последней выведенной версии, возвращает ее имя"""
+    previous = EmbeddingModelVersion.objects.filter(
+        state=State.RETIRED
+    ).order_by(F('activated_at').desc(nulls_last=True)).values_list('model_name', flat=True).first()
+    if previous is None:
+        raise VersionError("Нет версии, к которой можно откатиться")
+    activate(previous)
+    return previous
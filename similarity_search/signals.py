@@ -0,0 +1,64 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from advertisements.models import Advertisement, AdvertisementPhoto
+from similarity_search.services.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Один поток: обновления индекса применяются по порядку и не задерживают ответ
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='clip-index')
+
+
+def _apply(update, *args):
+    try:
+        update(*args)
+    except Exception as e:
+        logger.error(f"Не удалось обновить индекс похожих животных: {e}")
+    finally:
+        close_old_connections()
+
+
+def _schedule(update, *args):
+    transaction.on_commit(lambda: _executor.submit(_apply, update, *args))
+
+
+@receiver(post_save, sender=Advertisement)
+def on_post_save_advertisement(instance, **kwargs):
+    # Индекс есть только у воркеров, где модель уже загружена; остальные
+    # догонят изменение по updated_at (CLIPService.catch_up) или подхватят
+    # его при построении индекса из хранилища векторов
+    service = registry.peek()
+    if service is not None:
+        _schedule(service.upsert_advertisement, instance)
+
+
+@receiver(post_delete, sender=Advertisement)
+def on_post_delete_advertisement(instance, **kwargs):
+    service = registry.peek()
+    if service is not None:
+        _schedule(service.remove_advertisement, instance.pk)
+
+
+@receiver(post_save, sender=AdvertisementPhoto)
+@receiver(post_delete, sender=AdvertisementPhoto)
+def on_change_advertisement_photo(instance, **kwargs):
+    # Отмечаем объявление измененным: по updated_at изменение фото догоняют
+    # другие воркеры. update() не вызывает save() и сигналы объявления
+    Advertisement.objects.filter(pk=instance.advertisement_id).update(updated_at=timezone.now())
+
+    # Набор фото объявления изменился - пересобираем его строки в индексе
+    service = registry.peek()
+    if service is None:
+        return
+    try:
+        advertisement = instance.advertisement
+    except Advertisement.DoesNotExist:
+        # Фото удаляется каскадом вместе с объявлением
+        return
+    _schedule(service.upsert_advertisement, advertisement)
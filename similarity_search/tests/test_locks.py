@@ -0,0 +1,56 @@
+import threading
+
+from similarity_search.services.locks import ReadWriteLock
+
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    both_inside = threading.Barrier(2, timeout=5)
+
+    def reader():
+        with lock.read():
+            # Оба читателя должны оказаться внутри одновременно
+            both_inside.wait()
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not both_inside.broken
+
+
+def test_writer_waits_for_readers_and_blocks_new_ones():
+    lock = ReadWriteLock()
+    events = []
+    reading = threading.Event()
+    release_reader = threading.Event()
+
+    def reader():
+        with lock.read():
+            reading.set()
+            release_reader.wait(5)
+            events.append('read')
+
+    def writer():
+        with lock.write():
+            events.append('write')
+
+    def late_reader():
+        with lock.read():
+            events.append('late read')
+
+    first = threading.Thread(target=reader)
+    first.start()
+    reading.wait(5)
+    second = threading.Thread(target=writer)
+    second.start()
+    # Дождемся, пока писатель встанет в очередь
+    while not lock._waiting_writers:
+        pass
+    third = threading.Thread(target=late_reader)
+    third.start()
+    release_reader.set()
+    for thread in (first, second, third):
+        thread.join(5)
+    assert events == ['read', 'write', 'late read']
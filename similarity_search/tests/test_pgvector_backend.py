@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+
+from advertisements.models import Advertisement
+from similarity_search.services.embedding_store import EmbeddingStore
+from similarity_search.services.pgvector_backend import TABLE, PgVectorBackend
+
+MODEL_NAME = 'test-model'
+DIMENSION = 4
+
+
+def _pgvector_available() -> bool:
+    """Есть ли локальный PostgreSQL с расширением vector"""
+    database = settings.DATABASES['default']
+    if database['ENGINE'] != 'django.db.backends.postgresql':
+        return False
+    try:
+        import psycopg2
+        with psycopg2.connect(
+            dbname=database['NAME'], user=database['USER'], password=database['PASSWORD'],
+            host=database['HOST'], port=database['PORT'], connect_timeout=2,
+        ) as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")
+            return cursor.fetchone() is not None
+    except Exception:
+        return False
+
+
+pytestmark = [
+    pytest.mark.skipif(not _pgvector_available(), reason='нужен PostgreSQL с расширением pgvector'),
+    pytest.mark.django_db,
+]
+
+
+def _unit(*values) -> np.ndarray:
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+QUERY = _unit(1, 0, 0, 0)
+
+
+def _similar(similarity: float) -> np.ndarray:
+    """Единичный вектор с заданным сходством с QUERY"""
+    return _unit(similarity, np.sqrt(1 - similarity ** 2), 0, 0)
+
+
+def _ad(title, type='dog', status='lost', latitude=55.75, longitude=37.62) -> Advertisement:
+    return Advertisement.objects.create(
+        title=title, description='', author='test', breed='', type=type, status=status,
+        latitude=latitude, longitude=longitude,
+    )
+
+
+@pytest.fixture
+def backend():
+    backend = PgVectorBackend(MODEL_NAME, dimension=DIMENSION)
+    backend.ensure_schema()
+    return backend
+
+
+@pytest.fixture
+def catalogue(backend):
+    ads = {
+        'dog': _ad('dog'),
+        'cat': _ad('cat', type='cat'),
+        'found': _ad('found', status='found'),
+        'far': _ad('far', latitude=59.94, longitude=30.31),
+    }
+    backend.upsert([
+        (ads['dog'].id, 'main', _similar(0.95)),
+        (ads['cat'].id, 'main', _similar(0.9)),
+        (ads['found'].id, 'main', _similar(0.85)),
+        (ads['far'].id, 'main', _similar(0.8)),
+    ])
+    return {name: ad.id for name, ad in ads.items()}
+
+
+def _ids(hits):
+    return [ad_id for ad_id, _ in hits]
+
+
+def test_search_orders_by_similarity(backend, catalogue):
+    hits = backend.search(QUERY, 10)
+    assert _ids(hits) == [catalogue['dog'], catalogue['cat'], catalogue['found'], catalogue['far']]
+    assert hits[0][1] == pytest.approx(0.95, abs=1e-5)
+    assert _ids(backend.search(QUERY, 2)) == [catalogue['dog'], catalogue['cat']]
+
+
+def test_search_filters(backend, catalogue):
+    assert _ids(backend.search(QUERY, 10, animal_type='dog')) == [
+        catalogue['dog'], catalogue['found'], catalogue['far'],
+    ]
+    assert _ids(backend.search(QUERY, 10, status='found')) == [catalogue['found']]
+    moscow = (55.0, 37.0, 56.0, 38.0)
+    assert _ids(backend.search(QUERY, 10, animal_type='dog', status='lost', bbox=moscow)) == [catalogue['dog']]
+
+
+def test_range_search_threshold(backend, catalogue):
+    # Так выполняет range_search CLIPService при VECTOR_BACKEND = 'pgvector'
+    hits = backend.search(QUERY, 10, threshold=0.87)
+    assert _ids(hits) == [catalogue['dog'], catalogue['cat']]
+    assert all(score >= 0.87 for _, score in hits)
+    assert backend.search(QUERY, 10, threshold=0.99) == []
+
+
+def test_mean_covers_all_photos_of_the_ad(backend):
+    # У первого объявления лучшее фото, но второе фото непохоже
+    mixed, steady = _ad('mixed'), _ad('steady')
+    backend.upsert([
+        (mixed.id, 'main', _similar(1.0)),
+        (mixed.id, '1', _similar(0.2)),
+        (steady.id, 'main', _similar(0.8)),
+        (steady.id, '1', _similar(0.7)),
+    ])
+
+    assert _ids(backend.search(QUERY, 10, aggregate='max')) == [mixed.id, steady.id]
+    hits = dict(backend.search(QUERY, 10, aggregate='mean'))
+    assert hits[mixed.id] == pytest.approx(0.6, abs=1e-5)
+    assert hits[steady.id] == pytest.approx(0.75, abs=1e-5)
+    assert _ids(backend.search(QUERY, 10, aggregate='mean')) == [steady.id, mixed.id]
+    # Порог применяется к среднему, а не к лучшему фото
+    assert _ids(backend.search(QUERY, 10, threshold=0.7, aggregate='mean')) == [steady.id]
+
+
+def test_delete_missing(backend, catalogue):
+    backend.delete_missing(catalogue['dog'], [])
+    assert catalogue['dog'] not in _ids(backend.search(QUERY, 10))
+
+
+def test_setup_pgvector_creates_table_and_backfills():
+    ad = _ad('stored')
+    EmbeddingStore(MODEL_NAME, dtype='float32').save_many([(ad.id, 'main', 'hash', _similar(0.9))])
+
+    call_command('setup_pgvector', model=MODEL_NAME, dimension=DIMENSION)
+
+    assert TABLE in connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {TABLE} WHERE model_name = %s', [MODEL_NAME])
+        assert cursor.fetchone()[0] == 1
+    hits = PgVectorBackend(MODEL_NAME, dimension=DIMENSION).search(QUERY, 5)
+    assert _ids(hits) == [ad.id]
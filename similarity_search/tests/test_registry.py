@@ -0,0 +1,26 @@
+import threading
+
+from similarity_search.services.registry import ModelRegistry
+
+
+def test_warm_up_reuses_running_thread(monkeypatch):
+    registry = ModelRegistry()
+    release = threading.Event()
+    calls = []
+
+    def load(model_name):
+        calls.append(model_name)
+        release.wait(5)
+
+    monkeypatch.setattr(registry, '_warm_up', load)
+    first = registry.warm_up()
+    # Запросы, пришедшие во время прогрева, не запускают вторую загрузку
+    assert registry.warm_up() is first
+    release.set()
+    first.join(5)
+
+    # После завершения прогрева новый вызов снова может загрузить модель
+    second = registry.warm_up()
+    second.join(5)
+    assert second is not first
+    assert calls == [None, None]
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from similarity_search.services.shards import ShardedIndex
+from similarity_search.services.snapshots import SnapshotStore
+from similarity_search.services.vector_index import FLAT, HNSW, IVF_FLAT, VectorIndex
+
+DIMENSION = 32
+
+
+def _vectors(count: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _sharded(index_type: str, vectors: np.ndarray) -> ShardedIndex:
+    index = ShardedIndex(DIMENSION)
+    # По два фото на объявление
+    index.shards[''] = VectorIndex.build(np.arange(len(vectors)) // 2, vectors, index_type)
+    index.reindex_locations()
+    return index
+
+
+@pytest.mark.parametrize('index_type', [FLAT, HNSW, IVF_FLAT])
+def test_snapshot_save_load_add_save_load_search(tmp_path, index_type):
+    vectors = _vectors(2000)
+    store = SnapshotStore(str(tmp_path), 'test-model')
+    store.save(_sharded(index_type, vectors), {})
+
+    _, _, loaded, _ = store.load()
+    shard = loaded.shards['']
+    assert shard.index_type == index_type
+    assert shard.read_only
+
+    extra = _vectors(1, seed=1)
+    loaded.add(np.array([5000]), extra, {})
+    assert not shard.read_only
+    store.save(loaded, {})
+
+    _, _, reloaded, _ = store.load()
+    assert reloaded.ntotal == len(vectors) + 1
+    assert reloaded.search(extra[0], 1)[0][0] == 5000
+    assert reloaded.search(vectors[10], 1)[0][0] == 5
+
+
+@pytest.mark.parametrize('index_type', [FLAT, IVF_FLAT])
+def test_snapshot_remove_from_mmapped_index(tmp_path, index_type):
+    vectors = _vectors(2000)
+    store = SnapshotStore(str(tmp_path), 'test-model')
+    store.save(_sharded(index_type, vectors), {})
+
+    _, _, loaded, _ = store.load()
+    assert loaded.remove([5]) == 2
+    store.save(loaded, {})
+
+    _, _, reloaded, _ = store.load()
+    assert all(ad_id != 5 for ad_id, _ in reloaded.search(vectors[10], 5))
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from similarity_search.services.vector_index import (
+    AGGREGATE_MAX, AGGREGATE_MEAN, FLAT, HNSW, IVF_FLAT, IVF_PQ, VectorIndex,
+)
+
+DIMENSION = 32
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def _index(index_type: str):
+    rng = np.random.default_rng(0)
+    query = _normalized(rng.standard_normal(DIMENSION))
+    # У объявления 1 одно фото совпадает с запросом, второе почти противоположно
+    ad_one = _normalized([query, -query + 0.1 * rng.standard_normal(DIMENSION)])
+    filler = _normalized(rng.standard_normal((2000, DIMENSION)))
+    vectors = np.concatenate([ad_one, filler])
+    ids = np.concatenate([[1, 1], 100 + np.arange(len(filler)) // 2])
+    return VectorIndex.build(ids, vectors, index_type), query, ad_one
+
+
+@pytest.mark.parametrize('index_type', [FLAT, HNSW, IVF_FLAT, IVF_PQ])
+def test_mean_covers_all_photos_of_the_ad(index_type):
+    index, query, ad_one = _index(index_type)
+    expected = float(np.mean(ad_one @ query))
+
+    hits = dict(index.search(query, 2000, aggregate=AGGREGATE_MEAN))
+    assert hits[1] == pytest.approx(expected, abs=0.05 if index_type == IVF_PQ else 1e-4)
+    assert index.search(query, 1, aggregate=AGGREGATE_MAX)[0][0] == 1
+
+    # После удаления фото объявления других строк у него не остается
+    index.remove([1])
+    assert 1 not in dict(index.search(query, 2000, aggregate=AGGREGATE_MEAN))
+
+
+def test_mean_range_search_thresholds_the_mean():
+    index, query, ad_one = _index(FLAT)
+    # Лучшее фото проходит порог, а среднее по обоим - нет
+    assert 1 not in dict(index.range_search(query, 0.5, 100, aggregate=AGGREGATE_MEAN))
+    assert 1 in dict(index.range_search(query, 0.5, 100, aggregate=AGGREGATE_MAX))
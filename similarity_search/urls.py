@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import SimilaritySearchView
+from .views import AdvertisementMatchesView, SimilaritySearchView, TextSimilaritySearchView
 
 urlpatterns = [
     path('search/', SimilaritySearchView.as_view(), name='similarity-search'),
+    path('search/text/', TextSimilaritySearchView.as_view(), name='similarity-search-text'),
+    path('matches/<int:ad_id>/', AdvertisementMatchesView.as_view(), name='similarity-search-matches'),
 ] 
\ No newline at end of file
@@ -1,31 +1,85 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.parsers import MultiPartParser, FormParser
-from django.conf import settings
-from .services.clip_service import CLIPService
-import os
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from advertisements.models import Advertisement, StatusChoices
+from .models import AdvertisementMatch
+from .services import cursors
+from .services.registry import registry
+from .services.results import resolve
+from .services.versions import active_model_name
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _get_bbox(data):
+    """Границы области поиска (min_lat, min_lon, max_lat, max_lon), если переданы"""
+    keys = ('min_lat', 'min_lon', 'max_lat', 'max_lon')
+    if not any(data.get(key) for key in keys):
+        return None
+    return tuple(float(data[key]) for key in keys)
+
+
+def _serialize_result(request, ad, similarity):
+    return {
+        'id': ad.id,
+        'title': ad.title,
+        'description': ad.description,
+        'photo_url': request.build_absolute_uri(ad.photo.url) if ad.photo else None,
+        'breed': ad.breed,
+        'color': ad.color,
+        'type': ad.type,
+        'similarity_score': similarity
+    }
+
+
 class SimilaritySearchView(APIView):
     parser_classes = (MultiPartParser, FormParser)
     
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.clip_service = CLIPService()
-        self.clip_service.build_index()
-    
     def get(self, request):
         """Проверка доступности сервиса"""
         return Response({
             'status': 'ok',
-            'message': 'Сервис поиска похожих животных доступен'
+            'message': 'Сервис поиска похожих животных доступен',
+            'models': registry.status()
         })
     
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+
+    def _page_response(self, request, hits, next_cursor, total):
+        """Страница результатов: объявления подгружаются одним запросом, без модели"""
+        return Response({
+            'results': [_serialize_result(request, ad, similarity) for ad, similarity in resolve(hits)],
+            'next_cursor': next_cursor,
+            'total': total,
+        })
+
     def post(self, request):
+        """Поиск по фото: все объявления со сходством не ниже порога.
+
+        Порог (threshold, по умолчанию 0.75) отсекает сам индекс. Ответ
+        постраничный: для следующей страницы передается cursor из ответа,
+        без файла - запрос к индексу не повторяется.
+        """
+        try:
+            page_size = min(int(request.data.get('page_size') or self.DEFAULT_PAGE_SIZE), self.MAX_PAGE_SIZE)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Некорректный размер страницы'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         try:
+            cursor = request.data.get('cursor')
+            if cursor:
+                try:
+                    hits, next_cursor, total = cursors.load_page(cursor, page_size)
+                except cursors.InvalidCursor as e:
+                    return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                return self._page_response(request, hits, next_cursor, total)
+
             # Проверяем наличие файла в запросе
             if 'file' in request.FILES:
                 file = request.FILES['file']
@@ -33,27 +87,31 @@ class SimilaritySearchView(APIView):
                 
                 # Читаем содержимое файла
                 file_content = file.read()
+
+                # Фильтры и порог применяются внутри запроса к индексу
+                try:
+                    bbox = _get_bbox(request.data)
+                    threshold = request.data.get('threshold')
+                    threshold = float(threshold) if threshold not in (None, '') else None
+                except (KeyError, TypeError, ValueError):
+                    return Response(
+                        {'error': 'Некорректные параметры поиска'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
                 
-                # Выполняем поиск
-                results = self.clip_service.search(file_content)
-                
-                # Формируем ответ
-                response_data = []
-                for ad, similarity in results:
-                    if similarity < 0.75:
-                        continue
-                    response_data.append({
-                        'id': ad.id,
-                        'title': ad.title,
-                        'description': ad.description,
-                        'photo_url': request.build_absolute_uri(ad.photo.url) if ad.photo else None,
-                        'breed': ad.breed,
-                        'color': ad.color,
-                        'type': ad.type,
-                        'similarity_score': similarity
-                    })
-                
-                return Response(response_data)
+                # Выполняем поиск общим для процесса сервисом
+                hits = registry.get().range_search(
+                    file_content,
+                    threshold=threshold,
+                    animal_type=request.data.get('type') or None,
+                    status=request.data.get('status') or None,
+                    bbox=bbox,
+                )
+
+                # Список сохраняется целиком, дальше страницы берутся по курсору
+                token = cursors.save_results(hits)
+                page, next_cursor, total = cursors.page(hits, token, 0, page_size)
+                return self._page_response(request, page, next_cursor, total)
             else:
                 return Response(
                     {'error': 'Файл не найден в запросе'},
@@ -65,4 +123,98 @@ class SimilaritySearchView(APIView):
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            ) 
\ No newline at end of file
+            )
+
+
+class TextSimilaritySearchView(APIView):
+    """Поиск объявлений по текстовому описанию, например "белая кошка с голубыми глазами".
+
+    Вектор запроса берется из LRU-кеша сервиса, поэтому повторяющиеся
+    запросы стоят только поиска по индексу.
+    """
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+
+    MAX_TOP_K = 50
+
+    def post(self, request):
+        query = str(request.data.get('query') or '').strip()
+        if not query:
+            return Response(
+                {'error': 'Текст запроса не передан'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            bbox = _get_bbox(request.data)
+            top_k = min(int(request.data.get('top_k') or 10), self.MAX_TOP_K)
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'Некорректные параметры поиска'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            # Пользовательский текст - всегда текст, даже если похож на путь к файлу
+            results = registry.get().search(
+                query,
+                kind='text',
+                top_k=top_k,
+                animal_type=request.data.get('type') or None,
+                status=request.data.get('status') or None,
+                bbox=bbox,
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при текстовом поиске животных: {str(e)}")
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        # Сходство текста с изображением у CLIP заметно ниже, чем изображения с
+        # изображением, поэтому порог 0.75 из поиска по фото здесь не применяется
+        return Response([_serialize_result(request, ad, similarity) for ad, similarity in results])
+
+
+class AdvertisementMatchesView(APIView):
+    """Готовые кандидаты в пару для объявления из ночного сопоставления.
+
+    Для потерянного возвращаются найденные, для найденного - потерянные;
+    это чтение по индексу таблицы совпадений, без модели и инференса.
+    """
+
+    MAX_LIMIT = 50
+
+    def get(self, request, ad_id):
+        try:
+            limit = min(int(request.query_params.get('limit') or 10), self.MAX_LIMIT)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'Некорректный параметр limit'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ad_status = Advertisement.objects.filter(pk=ad_id).values_list('status', flat=True).first()
+        if ad_status is None:
+            return Response(
+                {'error': 'Объявление не найдено'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        matches = AdvertisementMatch.objects.filter(model_name=active_model_name())
+        if ad_status == StatusChoices.FOUND:
+            matches = matches.filter(found_id=ad_id).select_related('lost')
+            other = 'lost'
+        else:
+            matches = matches.filter(lost_id=ad_id).select_related('found')
+            other = 'found'
+
+        return Response([
+            {
+                **_serialize_result(request, getattr(match, other), match.similarity),
+                'status': getattr(match, other).status,
+                'score': match.score,
+                'distance_km': match.distance_km,
+                'days_apart': match.days_apart,
+            }
+            for match in matches.order_by('-score')[:limit]
+        ])